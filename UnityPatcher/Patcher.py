@@ -4,20 +4,37 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # Добавляем текущую папку в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))  # Добавляем родительскую папку
 
+import contextvars
 import logging
+import multiprocessing
 import traceback
+from contextlib import closing
 from tqdm import tqdm
-import concurrent.futures
 import UnityPy
 from typing import List, Optional, Tuple, Union
 from colorama import Fore, Style, init
 
 from args import parse_args, print_help, process_asset_types
-from core import GameLoader, ObjectHandler, PatchData, Statistics, TextSearcher
+from core import (
+    GameLoader,
+    ObjectHandler,
+    PackPlanner,
+    PatchArchive,
+    PatchData,
+    PatchFile,
+    ResourceCompactor,
+    Statistics,
+    TaskScheduler,
+    TextReplacer,
+    TextSearcher,
+)
 from core.Settings import Settings
-from helpers import GeneralHelper, SmartPatching
+from helpers import EncodeCache, GeneralHelper, SmartPatching, UndoJournal
+from helpers.AdaptivePool import AdaptivePool
+from helpers.PatchWatcher import PatchWatcher
 from patches import *  # Import everything to apply patches on UnityPy
-from utils import filter_objects, find_files_by_extensions, run_multithread
+from patches.TextureConverter import shutdown_process_pool
+from utils import filter_objects, find_files_by_extensions
 from enums import ExportType
 
 # Initialize colorama
@@ -63,7 +80,17 @@ def export_objects(
     def worker(task: Tuple) -> None:
         ObjectHandler(stats).export_object(*task)
 
-    run_multithread(worker, tasks, max_workers)
+    if max_workers == 1:
+        [worker(task) for task in tasks]
+    else:
+        TaskScheduler.run_scheduled(
+            worker,
+            tasks,
+            "export",
+            estimate=lambda task: TaskScheduler.estimate_export(task[1]),
+            get_object=lambda task: task[1],
+            max_workers=max_workers,
+        )
     stats.print_summary()
 
     return stats
@@ -75,13 +102,41 @@ def patch_objects(
     asset_types_filter: Optional[List[str]] = None,
     max_workers: int = 1,
 ) -> Statistics:
-    sorted_patches = patch_data.sort_by_source()
     stats = Statistics()
-    tasks = []
+    tasks = collect_patch_tasks(env, patch_data, asset_types_filter)
 
     def worker(task: Tuple) -> None:
         ObjectHandler(stats).patch_object(*task)
 
+    if tasks:
+        if max_workers > 1:
+            TaskScheduler.run_scheduled(
+                worker,
+                tasks,
+                "patch",
+                estimate=TaskScheduler.estimate_patch,
+                get_object=lambda task: task[1],
+                max_workers=max_workers,
+            )
+        else:
+            [worker(task) for task in tasks]
+
+    stats.print_summary()
+    EncodeCache.log_statistics()
+    if stats.success_count:
+        print_unimported_assets(patch_data)
+
+    return stats
+
+
+def collect_patch_tasks(
+    env: UnityPy.Environment,
+    patch_data: PatchData,
+    asset_types_filter: Optional[List[str]] = None,
+) -> List[Tuple[PatchData, object]]:
+    sorted_patches = patch_data.sort_by_source()
+    tasks = []
+
     for source_file, path_ids in sorted_patches.items():
         cab = env.get_cab(source_file)
         if not cab:
@@ -96,17 +151,7 @@ def patch_objects(
                     tasks.append((patch, obj))
                     patch.mark_detected()
 
-    if tasks:
-        if max_workers > 1:
-            run_multithread(worker, tasks, max_workers)
-        else:
-            [worker(task) for task in tasks]
-
-    stats.print_summary()
-    if stats.success_count:
-        print_unimported_assets(patch_data)
-
-    return stats
+    return tasks
 
 
 def get_patch_for_object(obj, patch_data: PatchData) -> Tuple[PatchData]:
@@ -164,14 +209,15 @@ def search_text_in_objects(
     phrases = TextSearcher.normalize_phrases(search_phrases, case_sensitive)
     tasks = [(obj, phrases, case_sensitive, whole_string) for obj in objects]
     
-    cpu_count = os.cpu_count()
-    total_tasks = len(tasks)
-    completed_tasks = 0
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=cpu_count) as executor:
-        futures = [executor.submit(worker, task) for task in tasks]
-        for future in tqdm(concurrent.futures.as_completed(futures), total=total_tasks, desc="Task Progress"):
-            completed_tasks += 1
+    context = contextvars.copy_context()
+
+    # text search is mostly waiting for I/O and typetree reading, so the pool adapts
+    with tqdm(total=len(tasks), desc="Task Progress") as progress:
+        AdaptivePool("Search").run(
+            lambda task: context.copy().run(worker, task),
+            tasks,
+            on_done=lambda: progress.update(1),
+        )
 
     if not data:
         logging.warning("[WARN] Nothing found, check the command is correct")
@@ -249,25 +295,164 @@ class Patcher:
         asset_types_filter: List[str] = None,
         packer: str = "original",
         max_workers: int = 1,
+        plan_only: bool = False,
     ):
-        self.loader.check_overwrite_permission(output_folder)
+        if not plan_only:
+            self.loader.check_overwrite_permission(output_folder)
+            logging.info("\n[INF] Mode: Pack")
 
-        logging.info("\n[INF] Mode: Pack")
         if asset_types_filter:
             logging.info("- Filter by Type: %s", ", ".join(sorted(asset_types_filter)))
 
         if patch_data is None:
-            if not patch_folder or not os.path.isdir(patch_folder):
+            if not patch_folder or not os.path.exists(patch_folder):
                 raise ValueError("Patch folder is invalid or doesn't exist")
-            patch_data = PatchData(patch_folder)
+            with closing(PatchData(patch_folder)) as patch_data:
+                return self.pack_assets(
+                    patch_data=patch_data,
+                    output_folder=output_folder,
+                    asset_types_filter=asset_types_filter,
+                    packer=packer,
+                    max_workers=max_workers,
+                    plan_only=plan_only,
+                )
 
         if patch_data is None:
             logging.warning("No patch files found")
             return
 
+        if plan_only:
+            tasks = collect_patch_tasks(self.loader.env, patch_data, asset_types_filter)
+            PackPlanner(self.loader, tasks, packer).print_plan(max_workers)
+            print_unimported_assets(patch_data)
+            return
+
         patch_objects(self.loader.env, patch_data, asset_types_filter, max_workers)
         self.loader.save_modified_files(output_folder, packer)
 
+    def watch_patches(
+        self,
+        patch_folder: str,
+        patch_data: PatchData,
+        output_folder: str = "Patcher_Result",
+        asset_types_filter: List[str] = None,
+        packer: str = "original",
+        max_workers: int = 1,
+        smart_mode: bool = False,
+    ):
+        """
+        Repacks only the changed patch files until interrupted.
+        The environment is kept in memory, so only the files containing
+        the changed objects are saved again.
+        smart_mode: update the hash data after each repack
+        """
+        if not os.path.isdir(patch_folder):
+            raise ValueError("Watch mode requires a patch folder")
+
+        self.loader.reset_changed()
+        watcher = PatchWatcher(patch_folder)
+        logging.info("\n[INF] Watching %s for changes (Ctrl+C to stop)...", patch_folder)
+
+        try:
+            while True:
+                changed, removed = watcher.wait_for_changes()
+                self._repack_changed(
+                    patch_data, changed, removed, output_folder, asset_types_filter, packer,
+                    max_workers, smart_mode,
+                )
+        except KeyboardInterrupt:
+            logging.info("\n[INF] Watch mode stopped")
+        finally:
+            watcher.close()
+
+    def _repack_changed(
+        self,
+        patch_data: PatchData,
+        changed: set,
+        removed: set,
+        output_folder: str,
+        asset_types_filter: List[str],
+        packer: str,
+        max_workers: int,
+        smart_mode: bool,
+    ):
+        for path in removed:
+            prefix = path + os.sep
+            removed_files = [
+                patch.path for patch in patch_data.patches
+                if patch.path == path or patch.path.startswith(prefix)
+            ]
+            for removed_path in removed_files:
+                logging.warning(
+                    "[WARN] Patch file removed: %s (the asset is restored only after restart)",
+                    removed_path,
+                )
+                patch_data.remove_by_path(removed_path)
+
+        new_patches = [patch for patch in map(PatchFile, sorted(changed)) if patch.is_valid]
+        if not new_patches:
+            return
+
+        for patch in new_patches:
+            patch_data.remove_by_path(patch.path)
+            patch_data.patches.append(patch)
+
+        logging.info("\n[INF] Changed patch files: %d", len(new_patches))
+        changed_data = PatchData(new_patches)
+
+        for source_name in set(changed_data.source_names):
+            if not self.loader.env.get_cab(source_name) and not self.loader.try_load_file(source_name):
+                logging.warning("[WARN] %s not found or is corrupted", source_name)
+
+        try:
+            patch_objects(self.loader.env, changed_data, asset_types_filter, max_workers)
+            self.loader.save_modified_files(output_folder, packer)
+        finally:
+            # the processes aren't kept while waiting for the next change
+            shutdown_process_pool()
+
+        if smart_mode:
+            # the saved files contain all patches imported since the start
+            SmartPatching.update_hash_data(self.loader, patch_data.imported_patches, output_folder)
+        self.loader.reset_changed()
+
+        logging.info("\n[INF] Watching for changes...")
+
+    def replace_text(
+        self,
+        table: TextReplacer.ReplacementTable,
+        output_folder: str = "Patcher_Result",
+        whole_string: bool = False,
+        entire_search: bool = False,
+        packer: str = "original",
+    ):
+        self.loader.check_overwrite_permission(output_folder)
+        logging.info("\n[INF] Mode: Replace")
+
+        replacer = TextReplacer.TextReplacer(table, whole_string)
+
+        if table.strings:
+            objects = (
+                self.objects
+                if entire_search
+                else filter_objects(self.objects, ["TextAsset", "MonoBehaviour"])
+            )
+            replacer.replace_strings(objects)
+
+        fields_changed = replacer.set_fields(self.loader.env)
+        replacer.print_summary(fields_changed)
+
+        self.loader.save_modified_files(output_folder, packer)
+
+    def compact_resources(self, output_folder: str = "Patcher_Result"):
+        self.loader.check_overwrite_permission(output_folder)
+        logging.info("\n[INF] Mode: Compact")
+
+        if ResourceCompactor(self.loader).compact():
+            self.loader.save_modified_files(output_folder)
+        else:
+            logging.info("[INF] Nothing to compact")
+
     def search_assets(
         self,
         search_text: str,
@@ -324,6 +509,91 @@ EXPORT_TYPE_MAPPINGS = {
 }
 
 
+def run_unpack(patcher: Patcher, args):
+    export_type = EXPORT_TYPE_MAPPINGS.get(args.export_mode, ExportType.CONVERT)
+    patcher.unpack_assets(
+        asset_types_filter=process_asset_types(args),
+        asset_ids_filter=args.asset_ids,
+        mono_classes_filter=args.mono_classes,
+        output_folder=args.output_folder,
+        export_type=export_type,
+        max_workers=args.max_workers,
+        unpack_all=args.unpack_all,
+    )
+
+
+def run_search(patcher: Patcher, args):
+    export_type = EXPORT_TYPE_MAPPINGS.get(args.export_mode)
+    patcher.search_assets(
+        args.search_text,
+        create_log=args.log_found_assets,
+        case_sensitive=args.case_sensitive_search,
+        entire_search=args.entire_search,
+        output_folder=args.output_folder,
+        export=bool(export_type),
+        export_type=export_type,
+    )
+
+
+def run_pack(asset_loader: GameLoader, args):
+    smart_mode = args.smart_mode
+    patch_folder = args.patch_folder
+    game_folder = asset_loader.game_folder
+    output_folder = game_folder if args.outsamedir else args.output_folder
+
+    patch_data = PatchData(patch_folder)
+    # the full set of patch files, their archives are closed at the end
+    all_patches = patch_data
+
+    try:
+        if smart_mode:
+            logging.warning("[WARN] Smart Mode is enabled")
+            patch_data = SmartPatching.filter_patches(
+                game_folder, output_folder, patch_data
+            )
+
+        if asset_loader.env is not None:
+            # resident environment (daemon mode): only the missing files are loaded
+            for source_name in set(patch_data.source_names):
+                asset_loader.try_load_file(source_name)
+        elif args.load_all_files:
+            asset_loader.load_game()
+        else:
+            asset_loader.load_cabs(patch_data.source_names)
+
+        patcher = Patcher(asset_loader)
+        asset_types = process_asset_types(args)
+        patcher.pack_assets(
+            patch_data=patch_data,
+            asset_types_filter=asset_types,
+            packer=args.archive_packer,
+            output_folder=output_folder,
+            max_workers=args.max_workers or 1,
+            plan_only=args.plan_only,
+        )
+
+        if smart_mode and not args.plan_only:
+            logging.info("\n[INF] Updating hash data...")
+            SmartPatching.update_hash_data(
+                asset_loader, patch_data.imported_patches, output_folder
+            )
+
+        if args.watch and not args.plan_only:
+            patcher.watch_patches(
+                patch_folder,
+                patch_data,
+                output_folder=output_folder,
+                asset_types_filter=asset_types,
+                packer=args.archive_packer,
+                max_workers=args.max_workers or 1,
+                smart_mode=smart_mode,
+            )
+    finally:
+        all_patches.close()
+        # daemon jobs and runs of other commands don't keep the encoding processes
+        shutdown_process_pool()
+
+
 def get_command_input():
     while True:
         print("\n-> Want to run another command to search or unpack?")
@@ -353,6 +623,11 @@ def main(args):
 
     Settings.load_from_args(args)
 
+    if args.command == "archive":
+        configure_logging(debug=Settings.debug_mode)
+        PatchArchive.create_archive(args.patch_folder, args.archive_path, args.compression_level)
+        return
+
     game_folder = args.game_folder or GeneralHelper.find_game_folder()
     Settings.game_folder = game_folder
 
@@ -362,29 +637,38 @@ def main(args):
     setup_unitypy()
     asset_loader = GameLoader(game_folder)
 
+    if args.command == "apply":
+        output_folder = game_folder if args.outsamedir else args.output_folder
+        asset_loader.apply_deltas(args.delta_folder, output_folder)
+        return
+
+    if args.command == "restore":
+        if args.list_journals:
+            for journal in UndoJournal.list_journals(game_folder):
+                logging.info("%s - %d files", journal["id"], len(journal["entries"]))
+        else:
+            UndoJournal.restore(game_folder, args.journal_id)
+        return
+
     from helpers.TypeTreeManager import setup_managed
 
     managed = args.managed_path
     if managed:
         setup_managed(os.path.abspath(managed))
 
+    if args.command == "daemon":
+        from daemon import PatcherDaemon
+
+        daemon = PatcherDaemon([game_folder, *args.game_folders], args.max_jobs)
+        daemon.serve(args.host, args.port, args.token)
+        return
+
     if args.command == "unpack":
         asset_loader.load_game()
         patcher = Patcher(asset_loader)
 
         while True:
-            output_folder = args.output_folder
-            asset_types = process_asset_types(args)
-            export_type = EXPORT_TYPE_MAPPINGS.get(args.export_mode, ExportType.CONVERT)
-            patcher.unpack_assets(
-                asset_types_filter=asset_types,
-                asset_ids_filter=args.asset_ids,
-                mono_classes_filter=args.mono_classes,
-                output_folder=output_folder,
-                export_type=export_type,
-                max_workers=args.max_workers,
-                unpack_all=args.unpack_all,
-            )
+            run_unpack(patcher, args)
 
             if args.once:
                 break
@@ -397,17 +681,7 @@ def main(args):
         patcher = Patcher(asset_loader)
 
         while True:
-            export_type = EXPORT_TYPE_MAPPINGS.get(args.export_mode)
-            patcher.search_assets(
-                args.search_text,
-                create_log=args.log_found_assets,
-                case_sensitive=args.case_sensitive_search,
-                
-                entire_search=args.entire_search,
-                output_folder=args.output_folder,
-                export=bool(export_type),
-                export_type=export_type,
-            )
+            run_search(patcher, args)
 
             if args.once:
                 break
@@ -416,39 +690,36 @@ def main(args):
                 break
 
     elif args.command == "pack":
-        smart_mode = args.smart_mode
-        patch_folder = args.patch_folder
-        output_folder = game_folder if args.outsamedir else args.output_folder
-
-        patch_data = PatchData(patch_folder)
+        run_pack(asset_loader, args)
 
-        if smart_mode:
-            logging.warning("[WARN] Smart Mode is enabled")
-            patch_data = SmartPatching.filter_patches(
-                game_folder, output_folder, patch_data
-            )
+    elif args.command == "replace":
+        output_folder = game_folder if args.outsamedir else args.output_folder
+        table = TextReplacer.load_table(args.table)
 
-        if args.load_all_files:
+        # per-object fields need only their files, text replacement needs everything
+        if table.strings:
             asset_loader.load_game()
         else:
-            asset_loader.load_cabs(patch_data.source_names)
+            asset_loader.load_cabs(table.source_names)
 
         patcher = Patcher(asset_loader)
-        asset_types = process_asset_types(args)
-        patcher.pack_assets(
-            patch_data=patch_data,
-            asset_types_filter=asset_types,
-            packer=args.archive_packer,
+        patcher.replace_text(
+            table,
             output_folder=output_folder,
-            max_workers=args.max_workers or 1,
+            whole_string=args.whole_string,
+            entire_search=args.entire_search,
+            packer=args.archive_packer,
         )
 
-        if smart_mode:
-            logging.info("\n[INF] Updating hash data...")
-            SmartPatching.update_hash_data(asset_loader, patch_data.imported_patches)
+    elif args.command == "compact":
+        asset_loader.load_game()
+        patcher = Patcher(asset_loader)
+        patcher.compact_resources(game_folder if args.outsamedir else args.output_folder)
 
 
 if __name__ == "__main__":
+    # spawned encoding processes of the frozen executable start the worker, not the CLI
+    multiprocessing.freeze_support()
     cli_args = parse_args()
     if not vars(cli_args).get("command"):
         print_help()
@@ -17,6 +17,12 @@ class GroupingOptions(Enum):
     TYPE_SOURCE = "type_source"
 
 
+class OutputModeOptions(Enum):
+    FULL = "full"
+    DELTA = "delta"
+    BOTH = "both"
+
+
 class ExportModeOptions(Enum):
     NORMAL = "normal"
     RAW = "raw"
@@ -48,7 +54,12 @@ def create_parser():
             "Examples of usage:\n"
             "  Patcher unpack --texture -c Text -i ./Game_Data/ -o ./ExtractedAssets/\n"
             "  Patcher pack ./Patches/ --outsamedir\n"
-            "  Patcher search 'example text' --export"
+            "  Patcher search 'example text' --export\n"
+            "  Patcher apply ./Patcher_Result/ --outsamedir\n"
+            "  Patcher archive ./Patches/\n"
+            "  Patcher replace ./translation.csv --outsamedir\n"
+            "  Patcher compact -i ./Game_Data/ --outsamedir\n"
+            "  Patcher daemon -i ./Game_Data/ --port 8765"
         ),
         formatter_class=argparse.RawTextHelpFormatter
     )
@@ -57,6 +68,12 @@ def create_parser():
     _add_unpack_arguments(subparsers)
     _add_pack_arguments(subparsers)
     _add_search_arguments(subparsers)
+    _add_apply_arguments(subparsers)
+    _add_restore_arguments(subparsers)
+    _add_archive_arguments(subparsers)
+    _add_replace_arguments(subparsers)
+    _add_compact_arguments(subparsers)
+    _add_daemon_arguments(subparsers)
     
     return parser
 
@@ -83,8 +100,8 @@ def _add_unpack_arguments(subparsers):
         const=os.cpu_count(),
         type=int,
         dest="max_workers",
-        help="Maximum number of threads to use. "
-        "Default: number of CPU cores. Example: --threads 4."
+        help="Number of threads to use. By default the number of threads is "
+        "adjusted to the CPU and disk load while unpacking. Example: --threads 4."
     )
     general_group.add_argument(
         "-o",
@@ -188,12 +205,43 @@ def _add_pack_arguments(subparsers):
         dest="generate_mipmaps",
         help="Generate mipmaps for textures",
     )
+    texture_group.add_argument(
+        "--tex_mips_filter",
+        type=str,
+        choices=["box", "kaiser"],
+        default="box",
+        dest="mipmap_filter",
+        help="Mipmap filter: box (as Unity's default) or kaiser (sharper). Default: box",
+    )
+    texture_group.add_argument(
+        "--tex_mips_gamma",
+        action="store_true",
+        dest="mipmap_gamma_correct",
+        help="Filter mipmap colors in linear space (for sRGB textures)",
+    )
     texture_group.add_argument(
         "--raw_texture",
         action="store_true",
         dest="dont_compress_texture",
         help="Don't compress texture before packing",
     )
+    texture_group.add_argument(
+        "--tex_encoder",
+        type=str,
+        choices=["auto", "dotnet", "numpy"],
+        default="auto",
+        dest="texture_encoder",
+        help="Encoder of BC (DXT) textures: BCnEncoder.NET (requires .NET) or the "
+        "built-in NumPy encoder (fast and balanced quality only). auto - BCnEncoder.NET, "
+        "NumPy if .NET is not available. Default: auto",
+    )
+    texture_group.add_argument(
+        "--tex_stream",
+        action="store_true",
+        dest="texture_stream",
+        help="Write textures to the .resS file of the assets file instead of "
+        "storing them inside it (doesn't apply to bundles)",
+    )
 
     video_group = pack_parser.add_argument_group("Video Options")
     video_group.add_argument(
@@ -223,8 +271,8 @@ def _add_pack_arguments(subparsers):
         "--res_append",
         action="store_true",
         dest="resource_append_mode",
-        help="Pack audio and video to the end of the resource file "
-        "instead of replacing the original data",
+        help="Pack audio and video (and textures with --tex_stream) to the end "
+        "of the resource file instead of replacing the original data",
     )
     resource_group.add_argument(
         "--custom_res",
@@ -240,7 +288,8 @@ def _add_pack_arguments(subparsers):
     pack_parser.add_argument(
         "patch_folder", 
         type=str, 
-        help="Path to the folder containing modified asset files (patch files)."
+        help="Path to the folder containing modified asset files (patch files) "
+        "or to a patch archive created by the 'archive' command."
     )
     pack_parser.add_argument(
         "--outsamedir",
@@ -256,6 +305,15 @@ def _add_pack_arguments(subparsers):
         dest="archive_packer",
         help="Unity archive compression method. Default: as in the original",
     )
+    pack_parser.add_argument(
+        "--output_mode",
+        type=str,
+        choices=[opt.value for opt in OutputModeOptions],
+        default=OutputModeOptions.FULL.value,
+        help="What to save for each modified file: the full file, a binary delta "
+        "against the original file from the game folder (.delta), or both. "
+        "Deltas are installed with the 'apply' command. Default: full",
+    )
     pack_parser.add_argument(
         "--ignore_name",
         action="store_true",
@@ -266,8 +324,17 @@ def _add_pack_arguments(subparsers):
         "--smart",
         action="store_true",
         dest="smart_mode",
-        help="Enable smart packing mode. Do not import files that have not been "
-        "modified since the previous packaging.",
+        help="Enable smart packing mode. Only the output files whose patches or "
+        "game files have changed since the previous packaging are rebuilt. Hashes are stored beside the "
+        "output folder (<output folder>.hashes.sqlite).",
+    )
+    pack_parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=2048,
+        dest="encode_cache_size",
+        help="Maximum size of the cache of encoded textures, audio and video in MB "
+        "(unchanged patch files aren't encoded again). 0 - disable the cache. Default: 2048",
     )
     pack_parser.add_argument(
         "--load_all",
@@ -288,7 +355,29 @@ def _add_pack_arguments(subparsers):
         action="store_true",
         dest="backup_before_saving",
         help="Before saving modified files, make a backup (for each file, a backup is "
-        "created only once in BACKUP directory)", 
+        "created only once in BACKUP directory). Reflinks are used when the file "
+        "system supports them, so backups don't take extra space",
+    )
+    pack_parser.add_argument(
+        "--journal",
+        action="store_true",
+        dest="journal_before_saving",
+        help="When packing into the game folder, create a restore point that stores "
+        "only the changes instead of full copies of the files. Use the 'restore' "
+        "command to roll the game folder back",
+    )
+    pack_parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan_only",
+        help="Don't pack anything, only show which files will be loaded and rewritten, "
+        "what will be encoded and the estimated time, I/O and memory usage",
+    )
+    pack_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After packing, keep the game loaded and watch the patch folder: "
+        "changed patch files are imported and only the affected files are saved again",
     )
 
 
@@ -358,6 +447,236 @@ def _add_search_arguments(subparsers):
     )
 
 
+def _add_replace_arguments(subparsers):
+    replace_parser = subparsers.add_parser(
+        "replace", help="Replace text in assets using a CSV/TSV table"
+    )
+
+    general_group = replace_parser.add_argument_group("General Options")
+    general_group.add_argument(
+        "-o",
+        "--output_folder",
+        default="Patcher_Result",
+        help="Path to the folder where modified files will be saved. "
+        "Ignored if '--outsamedir' is specified.",
+    )
+    _add_shared_arguments(general_group)
+
+    replace_parser.add_argument(
+        "table",
+        type=str,
+        help="Path to the CSV/TSV table. Rows with 2 columns: source text, target text. "
+        "Rows with 4 columns: source file, path id, field (name or JSON pointer), value.",
+    )
+    replace_parser.add_argument(
+        "--outsamedir",
+        action="store_true",
+        help="Output directory same as input "
+        "(save modified files in the game folder, replacing original files)"
+    )
+    replace_parser.add_argument(
+        "--packer",
+        type=str,
+        choices=["none", "original", "lz4", "lzma"],
+        default="original",
+        dest="archive_packer",
+        help="Unity archive compression method. Default: as in the original",
+    )
+    replace_parser.add_argument(
+        "--entire_search",
+        action="store_true",
+        help="Replace text in all objects, not just TextAsset and MonoBehaviour",
+    )
+    replace_parser.add_argument(
+        "--whole_string",
+        action="store_true",
+        help="Replace only strings that match the source text entirely",
+    )
+    replace_parser.add_argument(
+        "--backup",
+        action="store_true",
+        dest="backup_before_saving",
+        help="Before saving modified files, make a backup in BACKUP directory",
+    )
+
+
+def _add_apply_arguments(subparsers):
+    apply_parser = subparsers.add_parser(
+        "apply", help="Apply binary deltas created by 'pack --output_mode delta'"
+    )
+
+    apply_parser.add_argument(
+        "delta_folder",
+        type=str,
+        help="Path to the folder containing .delta files.",
+    )
+    apply_parser.add_argument(
+        "-i",
+        "--input_folder",
+        type=str,
+        default="",
+        dest="game_folder",
+        help="Path to the folder containing original game files. Example: -i ./Game_Data/",
+    )
+    apply_parser.add_argument(
+        "-o",
+        "--output_folder",
+        default="Patcher_Result",
+        help="Path to the folder where patched files will be saved. "
+        "Ignored if '--outsamedir' is specified.",
+    )
+    apply_parser.add_argument(
+        "--outsamedir",
+        action="store_true",
+        help="Output directory same as input "
+        "(save patched files in the game folder, replacing original files)"
+    )
+    apply_parser.add_argument(
+        "--debug", 
+        action="store_true", 
+        dest="debug_mode", 
+        help="Enable debug mode for more detailed logs."
+    )
+
+
+def _add_restore_arguments(subparsers):
+    restore_parser = subparsers.add_parser(
+        "restore", help="Roll the game folder back to a restore point created by 'pack --journal'"
+    )
+
+    restore_parser.add_argument(
+        "journal_id",
+        type=str,
+        nargs="?",
+        default=None,
+        help="Restore point to roll back to (later packings are undone too). "
+        "Default: undo the last packing",
+    )
+    restore_parser.add_argument(
+        "-i",
+        "--input_folder",
+        type=str,
+        default="",
+        dest="game_folder",
+        help="Path to the folder containing game files. Example: -i ./Game_Data/",
+    )
+    restore_parser.add_argument(
+        "--list",
+        action="store_true",
+        dest="list_journals",
+        help="Show available restore points",
+    )
+    restore_parser.add_argument(
+        "--debug", 
+        action="store_true", 
+        dest="debug_mode", 
+        help="Enable debug mode for more detailed logs."
+    )
+
+
+def _add_archive_arguments(subparsers):
+    archive_parser = subparsers.add_parser(
+        "archive", help="Pack a patch folder into a single patch archive (.upatch)"
+    )
+
+    archive_parser.add_argument(
+        "patch_folder",
+        type=str,
+        help="Path to the folder containing patch files.",
+    )
+    archive_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="",
+        dest="archive_path",
+        help="Path to the archive. Default: <patch_folder>.upatch",
+    )
+    archive_parser.add_argument(
+        "--level",
+        type=int,
+        choices=range(0, 10),
+        default=6,
+        dest="compression_level",
+        help="Compression level of the archive entries (0 - no compression). Default: 6",
+    )
+    archive_parser.add_argument(
+        "--debug", 
+        action="store_true", 
+        dest="debug_mode", 
+        help="Enable debug mode for more detailed logs."
+    )
+
+
+def _add_compact_arguments(subparsers):
+    compact_parser = subparsers.add_parser(
+        "compact", help="Remove unused audio/video/texture data from .resource and .resS files"
+    )
+
+    general_group = compact_parser.add_argument_group("General Options")
+    general_group.add_argument(
+        "-o",
+        "--output_folder",
+        default="Patcher_Result",
+        help="Path to the folder where modified files will be saved. "
+        "Ignored if '--outsamedir' is specified.",
+    )
+    _add_shared_arguments(general_group)
+
+    compact_parser.add_argument(
+        "--outsamedir",
+        action="store_true",
+        help="Output directory same as input "
+        "(save modified files in the game folder, replacing original files)"
+    )
+    compact_parser.add_argument(
+        "--backup",
+        action="store_true",
+        dest="backup_before_saving",
+        help="Before saving modified files, make a backup in BACKUP directory",
+    )
+
+
+def _add_daemon_arguments(subparsers):
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        help="Keep games loaded and run unpack/search/pack jobs sent over local HTTP",
+    )
+
+    daemon_parser.add_argument(
+        "game_folders",
+        nargs="*",
+        default=[],
+        help="Additional game folders to preload. Example: ./GameA_Data/ ./GameB_Data/",
+    )
+    daemon_parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to listen on. Default: 127.0.0.1",
+    )
+    daemon_parser.add_argument(
+        "--token",
+        type=str,
+        default=None,
+        help="Token required in the 'Authorization: Bearer <token>' header of requests. "
+        "Generated automatically when listening on a non-local address",
+    )
+    daemon_parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to listen on. Default: 8765",
+    )
+    daemon_parser.add_argument(
+        "--max_jobs",
+        type=int,
+        default=2,
+        help="Maximum number of jobs running at the same time. Default: 2",
+    )
+    _add_shared_arguments(daemon_parser)
+
+
 def _add_shared_arguments(parser):
     """Adds shared arguments across commands."""
     parser.add_argument(
@@ -11,7 +11,7 @@ from UnityPy.enums import ClassIDType
 from UnityPy.files import ObjectReader
 
 from core.Settings import Settings
-from helpers import GeneralHelper
+from helpers import GeneralHelper, MergePatch
 
 
 TYPE_TO_CONTENT_ATTR = {
@@ -144,6 +144,27 @@ class BaseManager(ABC):
         if not isinstance(tree, dict):
             raise TypeError(f"Tree must be a dictionary, not {type(tree).__name__}")
 
+        self.save_tree(tree)
+
+    def import_merge_patch(self, patch: Union[str, dict]):
+        """
+        patch - Path to json file or dict with changed fields only
+        (merge patch or JSON pointers, see MergePatch).
+        Only the patch values are decoded, the rest of the tree is taken as is
+        """
+        if isinstance(patch, str):
+            patch = GeneralHelper.read_json(patch)
+
+        if not isinstance(patch, dict):
+            raise TypeError(f"Patch must be a dictionary, not {type(patch).__name__}")
+
+        tree = self.read_typetree()
+        if not tree:
+            raise Exception("Failed to read typetree")
+
+        self.save_tree(MergePatch.apply_patch(tree, decode_base64_in_tree(patch)))
+
+    def save_tree(self, tree: dict):
         if isinstance(self.data, ObjectReader):
             self.data.save_typetree(tree)
         else:
@@ -1,10 +1,7 @@
-from typing import Union
-
 from core.Settings import Settings
-from helpers import TypeTreeManager, GeneralHelper
+from helpers import TypeTreeManager
 
 from .BaseManager import BaseManager
-from .BaseManager import decode_base64_in_tree
 
 
 class MonoBehaviour(BaseManager):
@@ -35,21 +32,11 @@ class MonoBehaviour(BaseManager):
             Settings.game_folder,
         )
 
-    def import_dump(self, dump: Union[str, dict]):
+    def save_tree(self, tree: dict):
         """
-        Overridden method for importing a typetree dump.
-
-        Args:
-            dump (Union[str, dict]): Path to JSON file or dictionary.
+        Overridden method for saving a typetree.
+        Without serialized nodes, they are generated via TypeTreeManager.
         """
-        if isinstance(dump, str):
-            dump = GeneralHelper.read_json(dump)
-        
-        if not isinstance(dump, dict):
-            raise TypeError(f"Unsupported dump type: {type(dump).__name__}")
-        
-        tree = decode_base64_in_tree(dump)
-    
         if self.data.serialized_type and self.data.serialized_type.nodes:
             self.data.reader.save_typetree(tree)
             return
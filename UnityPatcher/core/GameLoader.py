@@ -9,6 +9,8 @@ from UnityPy.files import BundleFile, WebFile
 from UnityPy.streams import EndianBinaryReader
 
 from core.Settings import Settings
+from helpers import BackupHelper, DeltaPatcher, ResourceStream, SmartPatching, UndoJournal
+from helpers.ResourcePacker import finalize_resources
 
 
 def apply_bundle_patch():
@@ -92,6 +94,9 @@ class GameLoader:
         self.game_folder = game_folder
         self.loaded_files = []
         self.patched_files = []
+        self.delta_files = []
+        # saved file -> hash of its content (see SmartPatching.HashingWriter)
+        self.output_hashes = {}
         self.loading_files = {}
         self.lock = threading.Lock()
 
@@ -166,12 +171,76 @@ class GameLoader:
     def get_objects(self):
         return self.env.objects
 
+    def reset_changed(self):
+        """Marks all files as saved, so that the next saving skips them."""
+
+        def reset(file):
+            if getattr(file, "is_changed", False):
+                file.is_changed = False
+                for inner_file in getattr(file, "files", {}).values():
+                    reset(inner_file)
+
+        for file in self.env.files.values():
+            reset(file)
+
+    def reload_changed(self):
+        """
+        Loads the changed files from the game folder again, so that the
+        environment can be reused after packing (daemon mode).
+        """
+        changed = [
+            path for path, file in self.env.files.items() if getattr(file, "is_changed", False)
+        ]
+        if not changed:
+            return
+
+        removed = {id(self.env.files.pop(path)) for path in changed}
+        self.env.cabs = {
+            name: cab
+            for name, cab in self.env.cabs.items()
+            if id(self._root_file(cab)) not in removed
+        }
+
+        for path in changed:
+            # resources created by the packing don't exist in the game folder
+            if os.path.isfile(path):
+                logging.debug("Reloading %s...", path)
+                self.env.load_file(path)
+
+    def _root_file(self, file):
+        """Top-level file of the environment containing file."""
+        while getattr(file, "parent", None) is not None and file.parent is not self.env:
+            file = file.parent
+        return file
+
+    def find_file_path(self, assets_file) -> Optional[str]:
+        """Returns the path of the game file containing assets_file."""
+        file = self._root_file(assets_file)
+
+        for path, env_file in self.env.files.items():
+            if env_file is file:
+                return path
+        return None
+
     def save_modified_files(self, output_folder: str, packer: str = "original"):
         if not any(getattr(file, "is_changed", False) for file in self.env.files.values()):
             return
 
         logging.info("\n[INF] Saving modified files...")
+        finalize_resources(self.env)
         self.patched_files = []
+        self.delta_files = []
+        self.output_hashes = {}
+
+        save_full = Settings.output_mode != "delta"
+        save_delta = Settings.output_mode in ("delta", "both")
+
+        if save_delta and os.path.abspath(output_folder) == os.path.abspath(self.game_folder):
+            logging.warning(
+                "[WARN] Deltas can't be created when saving to the game folder, "
+                "full files will be saved"
+            )
+            save_full, save_delta = True, False
 
         if (
             Settings.recreate_output_dir
@@ -180,19 +249,39 @@ class GameLoader:
         ):
             shutil.rmtree(output_folder)
 
-        def save_env_file(file, saving_path: str):
+        backup_stats = {}
+        journal = None
+
+        if Settings.journal_before_saving:
+            if os.path.abspath(output_folder) == os.path.abspath(self.game_folder):
+                journal = UndoJournal.UndoJournal(self.game_folder)
+            else:
+                logging.warning(
+                    "[WARN] Restore points are only created when saving to the game folder"
+                )
+
+        def save_env_file(file, saving_path: str) -> str:
+            """return: hash of the saved content"""
             with open(saving_path, "wb") as f:
-                if isinstance(file, EndianBinaryReader):
-                    f.write(file.bytes)
+                writer = SmartPatching.HashingWriter(f)
+                if isinstance(file, ResourceStream):
+                    file.save(writer)
+                elif isinstance(file, EndianBinaryReader):
+                    writer.write(file.bytes)
                 else:
-                    f.write(file.save(packer=packer))
+                    writer.write(file.save(packer=packer))
+                return writer.hash
+
+        def create_backup(original_path: str, archive_path: str, can_move: bool):
+            if not os.path.isfile(original_path):
+                return None
 
-        def create_backup(original_path: str, archive_path: str):
             backup_path = os.path.join("BACKUP", archive_path)
-            if not os.path.isfile(backup_path):
-                os.makedirs(os.path.dirname(backup_path), exist_ok=True)
-                shutil.copy(original_path, backup_path)
-                logging.info("[INF] Backup created")
+            strategy = BackupHelper.create_backup(original_path, backup_path, can_move)
+            if strategy:
+                backup_stats[strategy] = backup_stats.get(strategy, 0) + 1
+                logging.info("[INF] Backup created (%s)", strategy.value)
+            return strategy
 
         for file_path, file in self.env.files.items():
             if not getattr(file, "is_changed", False):
@@ -204,27 +293,142 @@ class GameLoader:
 
             os.makedirs(os.path.dirname(dest_file), exist_ok=True)
             logging.info(" - %s", archive_path)
+            backup_strategy = None
 
-            if Settings.backup_before_saving:
-                create_backup(file_path, archive_path)
+            if (
+                isinstance(file, ResourceStream)
+                and save_full
+                and not save_delta
+                and not journal
+                and not Settings.backup_before_saving
+                and file.can_append_to(dest_file)
+            ):
+                # only the new data is written to the end of the resource
+                file.append_to(dest_file)
+                self.patched_files.append(dest_file)
+                # the rest of the file wasn't written, so it's read back once
+                self.output_hashes[dest_file] = SmartPatching.calculate_hash(dest_file)
+                continue
 
             try:
-                save_env_file(file, temp_file)
-                if os.path.exists(dest_file):
-                    os.remove(dest_file)
-                shutil.move(temp_file, dest_file)
-                self.patched_files.append(dest_file)
+                content_hash = save_env_file(file, temp_file)
+
+                if journal:
+                    journal.record(dest_file, temp_file, archive_path)
+
+                # the delta is made while the original is still in place
+                if save_delta:
+                    self.save_delta(file_path, temp_file, dest_file)
+
+                # the backup is made after serialization: the original file can
+                # then be moved away, since it's replaced right after that
+                if Settings.backup_before_saving:
+                    backup_strategy = create_backup(
+                        file_path,
+                        archive_path,
+                        can_move=os.path.abspath(dest_file) == os.path.abspath(file_path),
+                    )
+
+                if save_full:
+                    if isinstance(file, ResourceStream):
+                        # it may read from the file saved the previous time
+                        file.release_source()
+                    # atomic, so the journal entry matches either the old or the new file
+                    os.replace(temp_file, dest_file)
+                    self.patched_files.append(dest_file)
+                    self.output_hashes[dest_file] = content_hash
+                    if isinstance(file, ResourceStream):
+                        # the replacements are in the saved file now
+                        file.saved_to(dest_file)
+                else:
+                    os.remove(temp_file)
+
+                if journal:
+                    journal.confirm(archive_path)
             except Exception as e:
                 logging.error("Error saving file %s: %s", dest_file, e)
                 if os.path.exists(temp_file):
                     os.remove(temp_file)
+                if journal:
+                    journal.discard(archive_path)
+                if (
+                    backup_strategy == BackupHelper.BackupStrategy.Rename
+                    and not os.path.exists(file_path)
+                ):
+                    # put the original back in place
+                    shutil.copy2(os.path.join("BACKUP", archive_path), file_path)
                 continue
 
-        if self.patched_files:
+        if journal:
+            journal.commit()
+
+        if backup_stats:
+            logging.info(
+                "[INF] Backups: %s",
+                ", ".join(f"{strategy.value} - {count}" for strategy, count in backup_stats.items()),
+            )
+
+        if self.patched_files or self.delta_files:
             logging.info("[INF] Saving completed! Check output folder: %s", output_folder)
         else:
             logging.warning("[WARN] No files were saved")
 
+    def save_delta(self, original_path: str, modified_path: str, dest_file: str):
+        delta_path = dest_file + DeltaPatcher.DELTA_EXTENSION
+        if not os.path.isfile(original_path):
+            original_path = None  # new file (e.g. custom resource)
+
+        stats = DeltaPatcher.create_delta(original_path, modified_path, delta_path)
+        self.delta_files.append(delta_path)
+        # the header of the delta is written last, so it's hashed after that
+        self.output_hashes[delta_path] = SmartPatching.calculate_hash(delta_path)
+        logging.info(
+            "   delta: %.2f MB (%.2f MB new data)",
+            stats["delta_size"] / 1024 / 1024,
+            stats["new_bytes"] / 1024 / 1024,
+        )
+
+    def apply_deltas(self, delta_folder: str, output_folder: str):
+        """
+        Rebuilds modified files from the original game files and the
+        .delta files created with the "delta" output mode.
+        """
+        if not os.path.isdir(delta_folder):
+            raise ValueError("Delta folder is invalid or doesn't exist")
+
+        logging.info("\n[INF] Mode: Apply")
+        applied_files = []
+
+        for root, _, files in os.walk(delta_folder):
+            for file in files:
+                if not file.endswith(DeltaPatcher.DELTA_EXTENSION):
+                    continue
+
+                delta_path = os.path.join(root, file)
+                archive_path = os.path.relpath(delta_path, delta_folder)[
+                    : -len(DeltaPatcher.DELTA_EXTENSION)
+                ]
+                original_path = os.path.join(self.game_folder, archive_path)
+                dest_file = os.path.join(output_folder, archive_path)
+
+                logging.info(" - %s", archive_path)
+
+                try:
+                    if not os.path.isfile(original_path):
+                        original_path = None  # delta of a new file
+
+                    DeltaPatcher.apply_delta(original_path, delta_path, dest_file)
+                    applied_files.append(dest_file)
+                except Exception as e:
+                    logging.error("Error applying delta %s: %s", delta_path, e)
+
+        if applied_files:
+            logging.info("[INF] Applying completed! Check output folder: %s", output_folder)
+        else:
+            logging.warning("[WARN] No files were patched")
+
+        return applied_files
+
     def check_overwrite_permission(self, output_folder: str):
         locked_files = []
 
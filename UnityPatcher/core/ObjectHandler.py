@@ -9,7 +9,6 @@ from UnityPy.enums import ClassIDType
 import classes
 from classes import SDF
 from core.PatchFile import PatchData, PatchFile
-from helpers import GeneralHelper
 from enums import ExportType
 
 class ExceptionData:
@@ -212,6 +211,8 @@ class ObjectHandler:
                 self._handle_import(self.manager.import_raw_content, file, "Raw content import failed")
             elif file.is_dump:
                 self._handle_import(self.manager.import_dump, file, "Dump import failed")
+            elif file.is_merge:
+                self._handle_import(self.manager.import_merge_patch, file, "Merge patch import failed")
             else:
                 regular_files.append(file)
 
@@ -232,18 +233,21 @@ class ObjectHandler:
                 self._handle_import(self.manager.import_, file, "Regular file import failed")
 
     def _handle_import(self, method, patch: Union[PatchData, PatchFile], error_description: str = None, raw=False):
-        path_list = patch.paths if isinstance(patch, PatchData) else [patch.path]
+        files = patch.patches if isinstance(patch, PatchData) else [patch]
 
         try:
-            for path in path_list:
-                data = GeneralHelper.read_binary_file(path) if raw else path
-                method(data)
+            for file in files:
+                if raw:
+                    method(file.read_bytes())
+                else:
+                    with file.local_path() as path:
+                        method(path)
 
             self.stats.increment_success()
             patch.mark_imported()
 
-            for path in path_list:
-                logging.info("[INF] Successfully patched %s: %s", self.type_name, os.path.basename(path))
+            for file in files:
+                logging.info("[INF] Successfully patched %s: %s", self.type_name, os.path.basename(file.path))
         except Exception as e:
             self.stats.log_error(self, str(e), error_description)
 
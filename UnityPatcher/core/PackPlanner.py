@@ -0,0 +1,211 @@
+import logging
+import os
+from typing import Dict, List, Tuple
+
+from PIL import Image
+from UnityPy.enums import AudioCompressionFormat, ClassIDType
+from UnityPy.enums import TextureFormat as TF
+from UnityPy.enums.GraphicsFormat import GRAPHICS_TO_TEXTURE_MAP
+
+from core.PatchFile import PatchData, PatchFile
+from core.Settings import Settings
+from helpers import CostModel
+from helpers.CostModel import MB, TaskEstimate
+from patches.TextureConverter import get_bc_encoder, get_encoder_name
+
+# share of the game folder size, starting from which the rewrite is reported
+FULL_REWRITE_THRESHOLD = 0.5
+
+
+def _format_size(size: int) -> str:
+    return f"{size / MB:.1f} MB"
+
+
+def _format_time(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _image_size(file: PatchFile) -> Tuple[int, int]:
+    # PIL reads only the header here
+    with file.open() as f, Image.open(f) as img:
+        return img.size
+
+
+class PackPlanner:
+    """
+    Dry run of the packing: shows which files will be loaded and rewritten,
+    what has to be encoded for each patch and how much it will cost.
+    """
+
+    def __init__(self, loader, tasks: List[Tuple[PatchData, object]], packer: str = "original"):
+        self.loader = loader
+        self.tasks = tasks
+        self.packer = packer
+
+    def estimate_task(self, patch: PatchData, obj) -> TaskEstimate:
+        data = obj.read()
+        estimate = TaskEstimate(description="")
+        regular_files = [file for file in patch.patches if file.is_regular]
+
+        for file in patch.patches:
+            if not file.is_regular:
+                estimate.cpu_seconds += CostModel.estimate_typetree(file.size)
+                estimate.description = f"typetree import ({file.extension})"
+
+        if not regular_files:
+            return estimate
+
+        if obj.type == ClassIDType.Texture2D:
+            self._estimate_texture(estimate, data, regular_files[0])
+        elif obj.type == ClassIDType.Texture2DArray:
+            self._estimate_texture_array(estimate, data, regular_files)
+        elif obj.type == ClassIDType.AudioClip:
+            size = regular_files[0].size
+            compress = not Settings.dont_compress_audio
+            fmt = AudioCompressionFormat(data.m_CompressionFormat).name
+            estimate.description = (
+                f"{regular_files[0].extension} -> FSB5 ({fmt})" if compress else "raw audio"
+            )
+            estimate.cpu_seconds += CostModel.estimate_audio(size, compress)
+            estimate.memory_bytes = size * 2
+        elif obj.type == ClassIDType.VideoClip:
+            size = regular_files[0].size
+            transcode = Settings.transcode_video
+            estimate.description = (
+                f"video transcode ({Settings.transcode_quality})" if transcode else "raw video"
+            )
+            estimate.cpu_seconds += CostModel.estimate_video(size, transcode)
+            estimate.memory_bytes = size * 2
+        else:
+            size = sum(file.size for file in regular_files)
+            estimate.description = f"{regular_files[0].extension} import"
+            estimate.cpu_seconds += CostModel.estimate_typetree(size)
+
+        return estimate
+
+    def _texture_encoder(self, target_format, width: int, height: int) -> str:
+        if Settings.dont_compress_texture or width % 4 or height % 4:
+            return "raw"
+        encoder = get_encoder_name(target_format)
+        if encoder == "bc" and get_bc_encoder() == "numpy":
+            return "bc_numpy"
+        return encoder
+
+    def _estimate_texture(self, estimate: TaskEstimate, data, file: PatchFile):
+        width, height = _image_size(file)
+        target_format = TF(data.m_TextureFormat)
+        mip_count = getattr(data, "m_MipCount", 1) if Settings.generate_mipmaps else 1
+        encoder = self._texture_encoder(target_format, width, height)
+        quality = Settings.texture_compression_quality.value
+
+        estimate.description = (
+            f"{target_format.name} {width}x{height}, {mip_count} mips -> {encoder}"
+            + (f" ({quality})" if encoder in ("bc", "bc_numpy") else "")
+        )
+        estimate.cpu_seconds += CostModel.estimate_texture(
+            width, height, encoder, quality, mip_count
+        )
+        estimate.memory_bytes = CostModel.texture_memory(width, height)
+
+    def _estimate_texture_array(self, estimate: TaskEstimate, data, files: List[PatchFile]):
+        target_format = GRAPHICS_TO_TEXTURE_MAP.get(data.m_Format)
+        width, height = data.m_Width, data.m_Height
+        mip_count = getattr(data, "m_MipCount", 1) if Settings.generate_mipmaps else 1
+        encoder = self._texture_encoder(target_format, width, height) if target_format else "raw"
+        quality = Settings.texture_compression_quality.value
+        format_name = target_format.name if target_format else str(data.m_Format)
+
+        estimate.description = (
+            f"{format_name} {width}x{height} x{len(files)}, {mip_count} mips -> {encoder}"
+        )
+        estimate.cpu_seconds += CostModel.estimate_texture(
+            width, height, encoder, quality, mip_count, images=len(files)
+        )
+        estimate.memory_bytes = CostModel.texture_memory(width, height) * 2
+
+    def print_plan(self, max_workers: int = 1):
+        logging.info("\n[INF] Mode: Pack plan (nothing will be saved)")
+
+        loaded_files = [path for path in self.loader.loaded_files if os.path.isfile(path)]
+        loaded_size = sum(os.path.getsize(path) for path in loaded_files)
+
+        logging.info("\nFiles to load: %d (%s)", len(loaded_files), _format_size(loaded_size))
+        for path in loaded_files:
+            logging.debug(" - %s", os.path.relpath(path, self.loader.game_folder))
+
+        rewritten: Dict[str, int] = {}
+        estimates: List[TaskEstimate] = []
+
+        logging.info("\nPatches: %d", len(self.tasks))
+        for patch, obj in self.tasks:
+            file_path = self.loader.find_file_path(obj.assets_file)
+            if file_path:
+                rewritten[file_path] = rewritten.get(file_path, 0) + 1
+
+            try:
+                estimate = self.estimate_task(patch, obj)
+            except Exception as e:
+                logging.warning("[WARN] Can't estimate %s #%d: %s", obj.type.name, obj.path_id, e)
+                continue
+
+            estimates.append(estimate)
+            logging.info(
+                " - %s %s: %s ~ %s",
+                obj.type.name,
+                patch.patches[0].object_name,
+                estimate.description,
+                _format_time(estimate.cpu_seconds),
+            )
+
+        rewritten_size = 0
+        save_seconds = 0.0
+        save_peak = 0
+
+        logging.info("\nFiles to rewrite: %d", len(rewritten))
+        for path, count in sorted(rewritten.items(), key=lambda item: -os.path.getsize(item[0])):
+            size = os.path.getsize(path)
+            rewritten_size += size
+            save_seconds += CostModel.estimate_save(size, self.packer)
+            save_peak = max(save_peak, CostModel.save_memory(size))
+            logging.info(
+                " - %s (%s, %d patches)",
+                os.path.relpath(path, self.loader.game_folder),
+                _format_size(size),
+                count,
+            )
+
+        patch_size = sum(file.size for patch, _ in self.tasks for file in patch.patches)
+        task_seconds = sum(estimate.cpu_seconds for estimate in estimates)
+        longest_task = max((estimate.cpu_seconds for estimate in estimates), default=0)
+        threads = max(1, max_workers)
+        read_bytes = loaded_size + patch_size
+        write_bytes = rewritten_size
+        io_seconds = CostModel.estimate_io(read_bytes, write_bytes)
+        task_memory = sorted((estimate.memory_bytes for estimate in estimates), reverse=True)
+        peak_memory = loaded_size + save_peak + sum(task_memory[:threads])
+
+        logging.info("\n[Estimate]")
+        logging.info("CPU: %s (encoding %s, saving %s)", _format_time(task_seconds + save_seconds),
+                     _format_time(task_seconds), _format_time(save_seconds))
+        logging.info(
+            "Wall time with %d threads: ~%s",
+            threads,
+            _format_time(max(task_seconds / threads, longest_task) + save_seconds + io_seconds),
+        )
+        logging.info("I/O: read %s, write %s", _format_size(read_bytes), _format_size(write_bytes))
+        logging.info("Peak memory: ~%s", _format_size(peak_memory))
+
+        self._check_full_rewrite(rewritten_size)
+
+    def _check_full_rewrite(self, rewritten_size: int):
+        game_size = 0
+        for root, _, files in os.walk(self.loader.game_folder):
+            game_size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+
+        if game_size and rewritten_size / game_size >= FULL_REWRITE_THRESHOLD:
+            logging.warning(
+                "\n[WARN] %d%% of the game folder will be rewritten. Make sure the patch "
+                "folder doesn't contain unchanged assets (pack only edited files)",
+                rewritten_size * 100 // game_size,
+            )
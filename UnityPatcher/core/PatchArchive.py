@@ -0,0 +1,210 @@
+"""
+Single-file patch archive (.upatch):
+
+header: magic, entry count, index offset, index size
+data:   entries one after another, each compressed separately
+index:  zlib-compressed JSON list of entries
+        (path, source, path_id, script, name, extension, index, offset, size, raw_size, compressed)
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterator, List
+
+from core.PatchFile import PatchFile
+from core.Settings import Settings
+
+ARCHIVE_EXTENSION = ".upatch"
+MAGIC = b"UPATCH01"
+HEADER = struct.Struct("<8sIQQ")
+
+# don't keep compressed data if it saves less than 5%
+MIN_COMPRESSION_RATIO = 0.95
+
+
+class ArchivePatchFile(PatchFile):
+    """Patch file stored inside a patch archive. Its path is virtual."""
+
+    def __init__(self, archive: "PatchArchive", entry: dict):
+        self.archive = archive
+        self.entry = entry
+        # everything is already parsed in the archive index
+        fields = {
+            "object_name": entry["name"],
+            "source_file": entry["source"],
+            "script_name": entry["script"],
+            "path_id": entry["path_id"],
+            "index": entry["index"],
+            "extension": entry["extension"],
+        }
+        super().__init__(f"{archive.path}/{entry['path']}", fields)
+
+    def open(self) -> BinaryIO:
+        return BytesIO(self.read_bytes())
+
+    def read_bytes(self) -> bytes:
+        return self.archive.read_entry(self.entry)
+
+    @property
+    def size(self) -> int:
+        return self.entry["raw_size"]
+
+    @property
+    def stat_path(self) -> str:
+        return self.archive.path
+
+    @contextmanager
+    def local_path(self) -> Iterator[str]:
+        """Extracts the entry for importers that work with files on disk."""
+        yield self.archive.extract(self.entry)
+
+
+class PatchArchive:
+    def __init__(self, path: str):
+        self.path = path
+        # entries extracted for importers, removed on close()
+        self._extract_folder = None
+        self._extracted: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, index_offset, index_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a patch archive: {path}")
+
+        index = self._mmap[index_offset : index_offset + index_size]
+        self.entries: List[dict] = json.loads(zlib.decompress(index))
+
+        if len(self.entries) != count:
+            self.close()
+            raise ValueError(f"Patch archive is corrupted: {path}")
+
+    def __enter__(self) -> "PatchArchive":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __deepcopy__(self, memo):
+        # the archive is read-only, copies of patch files can share it
+        # (it's closed by its owner, see PatchData.close)
+        return self
+
+    @staticmethod
+    def is_archive(path: str) -> bool:
+        if not os.path.isfile(path):
+            return False
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def read_entry(self, entry: dict) -> bytes:
+        data = self._mmap[entry["offset"] : entry["offset"] + entry["size"]]
+        return zlib.decompress(data) if entry["compressed"] else data
+
+    def extract(self, entry: dict) -> str:
+        """Path of the entry on disk (each entry is extracted once)."""
+        with self._lock:
+            path = self._extracted.get(entry["path"])
+            if path:
+                return path
+
+            if self._extract_folder is None:
+                os.makedirs(Settings.temp_path, exist_ok=True)
+                self._extract_folder = tempfile.mkdtemp(dir=Settings.temp_path)
+            # entries of different folders may have the same name
+            folder = os.path.join(self._extract_folder, str(len(self._extracted)))
+            os.makedirs(folder)
+            path = os.path.join(folder, os.path.basename(entry["path"]))
+            with open(path, "wb") as f:
+                f.write(self.read_entry(entry))
+
+            self._extracted[entry["path"]] = path
+            return path
+
+    def get_patch_files(self) -> List[ArchivePatchFile]:
+        return [ArchivePatchFile(self, entry) for entry in self.entries]
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._mmap.close()
+        self._file.close()
+        if self._extract_folder:
+            shutil.rmtree(self._extract_folder, ignore_errors=True)
+
+
+def create_archive(patch_folder: str, archive_path: str = "", compression_level: int = 6) -> str:
+    """
+    Packs all patch files of the folder into a single archive.
+    Files with unrecognized names are skipped, as in the patch folder.
+    return: path of the created archive
+    """
+    if not os.path.isdir(patch_folder):
+        raise ValueError("Patch folder is invalid or doesn't exist")
+
+    archive_path = archive_path or os.path.normpath(patch_folder) + ARCHIVE_EXTENSION
+    temp_path = archive_path + "_new"
+
+    patch_files = []
+    for root, _, files in os.walk(patch_folder):
+        patch_files.extend(PatchFile(os.path.join(root, file)) for file in sorted(files))
+    patch_files = [pf for pf in patch_files if pf.is_valid]
+
+    logging.info("[INF] Archiving %d patch files...", len(patch_files))
+
+    entries = []
+    raw_total = 0
+
+    with open(temp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+
+        for patch_file in patch_files:
+            data = patch_file.read_bytes()
+            packed = zlib.compress(data, compression_level) if compression_level else data
+            compressed = len(packed) < len(data) * MIN_COMPRESSION_RATIO
+
+            entries.append(
+                {
+                    "path": os.path.relpath(patch_file.path, patch_folder).replace(os.sep, "/"),
+                    "source": patch_file.source_file,
+                    "path_id": patch_file.path_id,
+                    "script": patch_file.script_name,
+                    "name": patch_file.object_name,
+                    "extension": patch_file.extension,
+                    "index": patch_file.index,
+                    "offset": f.tell(),
+                    "size": len(packed) if compressed else len(data),
+                    "raw_size": len(data),
+                    "compressed": compressed,
+                }
+            )
+            f.write(packed if compressed else data)
+            raw_total += len(data)
+
+        index = zlib.compress(json.dumps(entries, ensure_ascii=False).encode("utf-8"), 9)
+        index_offset = f.tell()
+        f.write(index)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(entries), index_offset, len(index)))
+
+    os.replace(temp_path, archive_path)
+
+    logging.info(
+        "[INF] Patch archive saved: %s (%.2f MB -> %.2f MB)",
+        archive_path,
+        raw_total / 1024 / 1024,
+        os.path.getsize(archive_path) / 1024 / 1024,
+    )
+    return archive_path
@@ -2,9 +2,10 @@ import json
 import logging
 import os
 import re
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import Dict, List, Optional, Tuple, Union
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 from PIL import Image
 
@@ -35,10 +36,63 @@ class PatchFileType(IntEnum):
     Dump = 1
     Raw = 2
     RawContent = 3
+    Merge = 4
+
+
+FILE_TYPES = {
+    "dump.json": PatchFileType.Dump,
+    "obj": PatchFileType.Raw,
+    "content": PatchFileType.RawContent,
+    "patch.json": PatchFileType.Merge,
+}
+
+FILENAME_PATTERN = re.compile(
+    r"^(?P<object_name>[^#@\[\]]+)"  # OBJECT_NAME
+    r"(?: @(?P<script_name>[^\[\]]+))?"  # @SCRIPT_NAME (optional)
+    r" \[(?P<source_file>[^\]]+)\]"  # [SOURCE_FILE]
+    # #PATHID (which can be positive or negative) or #PATHID_INDEX.EXTENSION
+    r" #(?P<path_id>-?\d+)(?:_(?P<index>\d+))?\.(?P<extension>\w+(\.\w+)?)$"
+)
+
+
+def parse_patch_filename(path: str) -> Optional[dict]:
+    """
+    Possible names:
+    OBJECT_NAME [SOURCE_FILE] #PATHID.EXTENSION
+
+    MonoBehaviour:
+    OBJECT_NAME @SCRIPT_NAME [SOURCE_FILE] #PATHID.EXTENSION
+
+    Texture2DArray:
+    ...#PATHID_INDEX.EXTENSION
+
+    Dumps may have a clarifying double extension:
+    .dump.json
+
+    Sparse dumps (only changed fields) have .patch.json extension
+
+    Raw data have .bin extension
+    """
+    match = FILENAME_PATTERN.match(path)
+    if not match:
+        return None
+
+    index = match.group("index")
+    return {
+        "object_name": os.path.basename(match.group("object_name")),
+        "source_file": match.group("source_file"),
+        "script_name": match.group("script_name"),
+        "path_id": int(match.group("path_id")),
+        "index": int(index) if index is not None else None,
+        "extension": match.group("extension"),
+    }
 
 
 class PatchFile:
-    def __init__(self, path: str):
+    def __init__(self, path: str, fields: Optional[dict] = None):
+        """
+        fields: already parsed file name (see parse_patch_filename)
+        """
         self.path = path
         self.object_name = None
         self.source_file = None
@@ -49,61 +103,52 @@ class PatchFile:
         self.file_type = None
         self.detected = False # asset was found in loaded assets
         self.imported = False
-        self.parse_filename()
-
-    def parse_filename(self):
-        """
-        Possible names:
-        OBJECT_NAME [SOURCE_FILE] #PATHID.EXTENSION
-
-        MonoBehaviour:
-        OBJECT_NAME @SCRIPT_NAME [SOURCE_FILE] #PATHID.EXTENSION
-
-        Texture2DArray:
-        ...#PATHID_INDEX.EXTENSION
 
-        Dumps may have a clarifying double extension:
-        .dump.json
-
-        Raw data have .bin extension
-        """
-        pattern = re.compile(
-            r"^(?P<object_name>[^#@\[\]]+)"  # OBJECT_NAME
-            r"(?: @(?P<script_name>[^\[\]]+))?"  # @SCRIPT_NAME (optional)
-            r" \[(?P<source_file>[^\]]+)\]"  # [SOURCE_FILE]
-            # #PATHID (which can be positive or negative) or #PATHID_INDEX.EXTENSION
-            r" #(?P<path_id>-?\d+)(?:_(?P<index>\d+))?\.(?P<extension>\w+(\.\w+)?)$"
-        )
-        match = pattern.match(self.path)
-        if match:
-            self.object_name = os.path.basename(match.group("object_name"))
-            self.source_file = match.group("source_file")
-            self.script_name = match.group("script_name")
-            self.path_id = match.group("path_id")
-            self.index = match.group("index")
-            full_extension = match.group("extension")
-
-            if self.path_id is not None:
-                self.path_id = int(self.path_id)
+        if fields is None:
+            self.parse_filename()
+        else:
+            self.set_fields(fields)
 
-            if self.index is not None:
-                self.index = int(self.index)
+    def parse_filename(self):
+        fields = parse_patch_filename(self.path)
+        if fields:
+            self.set_fields(fields)
+
+    def set_fields(self, fields: dict):
+        self.object_name = fields["object_name"]
+        self.source_file = fields["source_file"]
+        self.script_name = fields["script_name"]
+        self.path_id = fields["path_id"]
+        self.index = fields["index"]
+        self.extension = fields["extension"]
+        self.file_type = FILE_TYPES.get(self.extension, PatchFileType.Regular)
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    def read_bytes(self) -> bytes:
+        with self.open() as file:
+            return file.read()
 
-            self.extension = full_extension
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
 
-            file_types = {
-                "dump.json": PatchFileType.Dump,
-                "obj": PatchFileType.Raw,
-                "content": PatchFileType.RawContent,
-            }
+    @property
+    def stat_path(self) -> str:
+        """File on disk whose size and mtime change with the patch file."""
+        return self.path
 
-            self.file_type = file_types.get(full_extension, PatchFileType.Regular)
+    @contextmanager
+    def local_path(self) -> Iterator[str]:
+        """Path of the patch file on disk (importers work with paths)."""
+        yield self.path
 
     def read_file(self) -> Union[str, dict, Image.Image, bytes]:
         """
         Reads a patch file. Supports text, JSON, images (PIL), and binary files.
         """
-        with open(self.path, "rb") as file:
+        with self.open() as file:
             return read_file_content(file, self.path)
 
     def mark_imported(self):
@@ -112,6 +157,12 @@ class PatchFile:
     def mark_detected(self):
         self.detected = True
 
+    @property
+    def is_valid(self) -> bool:
+        return bool(
+            self.path_id and (self.source_file or self.object_name or self.script_name)
+        )
+
     @property
     def is_dump(self) -> bool:
         return self.file_type == PatchFileType.Dump
@@ -124,6 +175,10 @@ class PatchFile:
     def is_raw_content(self) -> bool:
         return self.file_type == PatchFileType.RawContent
 
+    @property
+    def is_merge(self) -> bool:
+        return self.file_type == PatchFileType.Merge
+
     @property
     def is_regular(self) -> bool:
         return self.file_type == PatchFileType.Regular
@@ -174,6 +229,12 @@ class PatchData:
     def imported_patches(self) -> "PatchData":
         return PatchData([patch for patch in self.patches if patch.imported])
 
+    def close(self):
+        """Closes the patch archives the files are read from."""
+        archives = {patch.archive for patch in self.patches if hasattr(patch, "archive")}
+        for archive in archives:
+            archive.close()
+
     def remove_by_path(self, target_path: str):
         self.patches = [pf for pf in self.patches if pf.path != target_path]
 
@@ -198,27 +259,25 @@ class PatchData:
             logging.info("Is Dump: %s", patch_file.is_dump)
             logging.info("Is Raw: %s", patch_file.is_raw)
             logging.info("Is Raw Content: %s", patch_file.is_raw_content)
+            logging.info("Is Merge Patch: %s", patch_file.is_merge)
             logging.info("")
 
     @classmethod
     def process_data(cls, path: str) -> List["PatchFile"]:
         """
-        path: str - path to patch files folder
+        path: str - path to patch files folder or patch archive
         """
-        patch_files = []
+        from core.PatchArchive import PatchArchive
+        from core.PatchScanner import PatchScanner
+
         if os.path.isdir(path):
-            for root, _, files in os.walk(path):
-                patch_files.extend(
-                    PatchFile(os.path.join(root, file)) for file in files
-                )
+            patch_files = PatchScanner(path).scan()
+        elif PatchArchive.is_archive(path):
+            patch_files = PatchArchive(path).get_patch_files()
         else:
             raise ValueError("Invalid path")
 
-        return [
-            pf
-            for pf in patch_files
-            if pf.path_id and (pf.source_file or pf.object_name or pf.script_name)
-        ]
+        return [pf for pf in patch_files if pf.is_valid]
 
     def get_patch(
         self,
@@ -264,13 +323,16 @@ class PatchData:
         Определяет приоритет сортировки:
         - is_raw=True: приоритет 0
         - is_dump=True: приоритет 1
-        - is_raw_content=True: приоритет 2
-        - Остальные файлы (regular): приоритет 3
+        - is_merge=True: приоритет 2 (применяется поверх полного дампа)
+        - is_raw_content=True: приоритет 3
+        - Остальные файлы (regular): приоритет 4
         """
         if file.is_raw:
             return 0
         if file.is_dump:
             return 1
-        if file.is_raw_content:
+        if file.is_merge:
             return 2
-        return 3
+        if file.is_raw_content:
+            return 3
+        return 4
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from core.PatchFile import PatchFile, parse_patch_filename
+
+CACHE_NAME = ".patch_cache.json"
+CACHE_VERSION = 1
+# directories changed less than this time ago are not trusted to the cache,
+# because a file may still be added to them within the same mtime tick
+RACY_INTERVAL_NS = 2_000_000_000
+
+
+class PatchScanner:
+    """
+    Scans the patch folder and caches parsed file names in it.
+
+    The cache is keyed by directory mtimes: adding, removing or renaming files
+    changes the mtime of their directory, so directories with the same mtime
+    are taken from the cache without listing and parsing them again.
+    Editing the content of patch files doesn't affect the scan.
+    """
+
+    def __init__(self, root: str, max_workers: Optional[int] = None):
+        self.root = root
+        self.cache_path = os.path.join(root, CACHE_NAME)
+        self.max_workers = max_workers
+        self.cached_dirs: Dict[str, dict] = self._load_cache()
+
+    def _load_cache(self) -> Dict[str, dict]:
+        if not os.path.isfile(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.debug("Patch cache is corrupted, rescanning: %s", e)
+            return {}
+
+        if cache.get("version") != CACHE_VERSION or cache.get("root") != os.path.abspath(self.root):
+            return {}
+
+        return cache.get("dirs", {})
+
+    def _save_cache(self, dirs: Dict[str, dict]):
+        cache = {"version": CACHE_VERSION, "root": os.path.abspath(self.root), "dirs": dirs}
+
+        try:
+            existed = os.path.isfile(self.cache_path)
+            self._write_cache(cache)
+
+            # creating the cache changes the mtime of the root folder.
+            # Rewriting an existing file doesn't, so the root entry is fixed in place
+            mtime = os.stat(self.root).st_mtime_ns
+            root = dirs.get("")
+            if not existed and root and root["mtime"] not in (None, mtime):
+                root["mtime"] = mtime
+                self._write_cache(cache)
+        except OSError as e:
+            logging.debug("Can't save patch cache: %s", e)
+
+    def _write_cache(self, cache: dict):
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, separators=(",", ":"))
+
+    def _scan_dir(self, rel_dir: str) -> Tuple[str, dict, bool]:
+        """return: relative dir, dir entry, whether the entry was taken from the cache"""
+        path = os.path.join(self.root, rel_dir)
+        mtime = os.stat(path).st_mtime_ns
+
+        cached = self.cached_dirs.get(rel_dir)
+        if cached and cached["mtime"] == mtime:
+            return rel_dir, cached, True
+
+        files = {}
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file() and entry.name != CACHE_NAME:
+                    # unrecognized names are cached too (as None)
+                    files[entry.name] = parse_patch_filename(entry.path)
+
+        if time.time_ns() - mtime < RACY_INTERVAL_NS:
+            mtime = None
+
+        return rel_dir, {"mtime": mtime, "subdirs": sorted(subdirs), "files": files}, False
+
+    def scan(self) -> List[PatchFile]:
+        dirs: Dict[str, dict] = {}
+        level = [""]
+        rescanned = 0
+
+        # directories of the same depth are scanned in parallel
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while level:
+                next_level = []
+                for rel_dir, entry, from_cache in executor.map(self._scan_dir, level):
+                    dirs[rel_dir] = entry
+                    rescanned += not from_cache
+                    next_level.extend(os.path.join(rel_dir, name) for name in entry["subdirs"])
+                level = next_level
+
+        logging.debug("Patch folder scanned: %d folders, %d rescanned", len(dirs), rescanned)
+
+        if rescanned or len(dirs) != len(self.cached_dirs):
+            self._save_cache(dirs)
+
+        return [
+            PatchFile(os.path.join(self.root, rel_dir, name), fields)
+            for rel_dir, entry in dirs.items()
+            for name, fields in entry["files"].items()
+            if fields
+        ]
@@ -0,0 +1,203 @@
+"""
+Removes dead data from .resource/.resS files.
+
+Appending media (--res_append, --custom_res) leaves the old data in the
+resource file. Compaction keeps only the ranges still referenced by
+AudioClips, VideoClips, textures and meshes, writes them in offset order
+to a new file and updates the offsets of the objects. Files which other
+objects may refer to are left as they are.
+"""
+
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from UnityPy.files import SerializedFile
+from UnityPy.streams import EndianBinaryReader
+
+from core.Settings import Settings
+from helpers.ResourceIndex import STREAM_FIELDS
+from helpers.ResourceStream import COPY_CHUNK_SIZE, ResourceStream
+
+# data is moved with the same alignment it had (up to this value)
+MAX_ALIGNMENT = 32
+
+
+@dataclass
+class StreamReference:
+    obj: object
+    offset: int
+    size: int
+
+
+@dataclass
+class Span:
+    """Overlapping ranges are moved together."""
+
+    start: int
+    end: int
+    references: List[StreamReference] = field(default_factory=list)
+
+
+def _alignment(offset: int) -> int:
+    return min(offset & -offset, MAX_ALIGNMENT) if offset else MAX_ALIGNMENT
+
+
+def _align(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class ResourceCompactor:
+    def __init__(self, loader):
+        self.loader = loader
+        self.env = loader.env
+
+    def collect(self) -> Dict[str, List[StreamReference]]:
+        """return: resource file path -> references to its data"""
+        paths = {os.path.normcase(os.path.normpath(path)): path for path in self.env.files}
+        resources: Dict[str, List[StreamReference]] = {}
+        # resources of files with unreadable objects may have more live data
+        skipped = set()
+        # resources referenced by objects whose stream fields aren't known
+        unknown = set()
+
+        for assets_path, assets_file in self.env.files.items():
+            # resources inside bundles are rewritten with the bundle anyway
+            if not isinstance(assets_file, SerializedFile):
+                continue
+
+            folder_resources = self._get_folder_resources(assets_path)
+
+            for obj in assets_file.objects.values():
+                fields = STREAM_FIELDS.get(obj.type.name)
+                if not fields:
+                    raw_data = obj.get_raw_data()
+                    for name, resource_path in folder_resources.items():
+                        if resource_path not in unknown and name in raw_data:
+                            logging.warning(
+                                "[WARN] %s #%d may refer to %s, the file isn't compacted",
+                                obj.type.name, obj.path_id, os.path.basename(resource_path),
+                            )
+                            unknown.add(resource_path)
+                    continue
+
+                stream_key, source_key, offset_key, size_key = fields
+                try:
+                    stream = obj.read_typetree().get(stream_key)
+                except Exception as e:
+                    logging.warning(
+                        "[WARN] Can't read %s #%d, resources of %s are skipped: %s",
+                        obj.type.name, obj.path_id, os.path.basename(assets_path), e,
+                    )
+                    skipped.add(assets_file)
+                    continue
+
+                if not stream or not stream[source_key] or not stream[size_key]:
+                    continue
+                if stream[source_key].startswith("archive:"):
+                    continue
+
+                resource_path = os.path.join(
+                    os.path.dirname(assets_path), os.path.basename(stream[source_key])
+                )
+                resource_path = paths.get(os.path.normcase(os.path.normpath(resource_path)))
+                if resource_path is None:
+                    logging.warning("[WARN] %s not found", stream[source_key])
+                    continue
+
+                resources.setdefault(resource_path, []).append(
+                    StreamReference(obj, stream[offset_key], stream[size_key])
+                )
+
+        return {
+            path: references
+            for path, references in resources.items()
+            if path not in unknown
+            and not any(reference.obj.assets_file in skipped for reference in references)
+        }
+
+    def _get_folder_resources(self, assets_path: str) -> Dict[bytes, str]:
+        """return: encoded file name -> path of the resources next to the assets file"""
+        folder = os.path.dirname(os.path.abspath(assets_path))
+        return {
+            os.path.basename(path).encode(): path
+            for path, file in self.env.files.items()
+            if isinstance(file, (EndianBinaryReader, ResourceStream))
+            and os.path.dirname(os.path.abspath(path)) == folder
+        }
+
+    @staticmethod
+    def get_spans(references: List[StreamReference]) -> List[Span]:
+        spans: List[Span] = []
+        for reference in sorted(references, key=lambda ref: ref.offset):
+            end = reference.offset + reference.size
+            if spans and reference.offset < spans[-1].end:
+                spans[-1].end = max(spans[-1].end, end)
+            else:
+                spans.append(Span(reference.offset, end))
+            spans[-1].references.append(reference)
+        return spans
+
+    def compact_resource(self, resource_path: str, references: List[StreamReference]) -> int:
+        """return: number of reclaimed bytes"""
+        reader = self.env.files[resource_path]
+        original_length = reader.Length
+        spans = self.get_spans(references)
+
+        new_offsets = []
+        position = 0
+        for span in spans:
+            position = _align(position, _alignment(span.start))
+            new_offsets.append(position)
+            position += span.end - span.start
+
+        if position >= original_length:
+            return 0
+
+        os.makedirs(Settings.temp_path, exist_ok=True)
+        compacted = tempfile.TemporaryFile(dir=Settings.temp_path)
+        for span, new_offset in zip(spans, new_offsets):
+            compacted.write(b"\0" * (new_offset - compacted.tell()))
+            for start in range(span.start, span.end, COPY_CHUNK_SIZE):
+                reader.Position = start
+                compacted.write(reader.read_bytes(min(COPY_CHUNK_SIZE, span.end - start)))
+        compacted.flush()
+
+        for span, new_offset in zip(spans, new_offsets):
+            for reference in span.references:
+                offset = new_offset + reference.offset - span.start
+                if offset == reference.offset:
+                    continue
+
+                obj = reference.obj
+                stream_key, _, offset_key, _ = STREAM_FIELDS[obj.type.name]
+                typetree = obj.read_typetree()
+                typetree[stream_key][offset_key] = offset
+                obj.save_typetree(typetree)
+
+        stream = ResourceStream(EndianBinaryReader(compacted, reader.endian), resource_path)
+        self.env.files[resource_path] = stream
+        self.env.register_cab(os.path.basename(resource_path), stream)
+
+        return original_length - position
+
+    def compact(self) -> int:
+        """return: total number of reclaimed bytes"""
+        resources = self.collect()
+        total = 0
+
+        logging.info("\n[INF] Resource files: %d", len(resources))
+        for resource_path, references in resources.items():
+            reclaimed = self.compact_resource(resource_path, references)
+            total += reclaimed
+            logging.info(
+                " - %s: %d objects, %.2f MB reclaimed",
+                os.path.relpath(resource_path, self.loader.game_folder),
+                len(references),
+                reclaimed / 1024 / 1024,
+            )
+
+        logging.info("[INF] Reclaimed: %.2f MB", total / 1024 / 1024)
+        return total
@@ -1,10 +1,37 @@
+import copy
+from contextvars import ContextVar
 from enum import Enum
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from enums import TextureCompressionQuality as TexQuality
 
+_current_context: ContextVar[Optional["SettingsContext"]] = ContextVar(
+    "settings_context", default=None
+)
 
-class Settings:
+
+class _SettingsMeta(type):
+    """
+    Redirects Settings attributes to the current SettingsContext (if any),
+    so that code reading Settings doesn't depend on how the job is run.
+    """
+
+    def __getattribute__(cls, name: str):
+        if not name.startswith("_"):
+            context = _current_context.get()
+            if context is not None and name in context.values:
+                return context.values[name]
+        return super().__getattribute__(name)
+
+    def __setattr__(cls, name: str, value):
+        context = _current_context.get()
+        if context is not None and not name.startswith("_"):
+            context.values[name] = value
+        else:
+            super().__setattr__(name, value)
+
+
+class Settings(metaclass=_SettingsMeta):
     """
     Variables for temporary data storage
     (do not edit)
@@ -32,11 +59,19 @@ class Settings:
     transcode_quality: str = "medium"
     texture_compression_quality: TexQuality = TexQuality.BEST
     generate_mipmaps: bool = False
+    mipmap_filter: str = "box"
+    mipmap_gamma_correct: bool = False
     dont_compress_texture: bool = False
+    texture_stream: bool = False
+    texture_encoder: str = "auto"
     dont_compress_audio: bool = False
     resource_append_mode: bool = False
     recreate_output_dir: bool = False
     backup_before_saving: bool = False
+    journal_before_saving: bool = False
+    output_mode: str = "full"
+    encode_cache_path: str = ""  # "" - <temp_path>/encode_cache
+    encode_cache_size: int = 2048  # MB, 0 - disabled
 
     # Unpacking
     group_option: str = "type"
@@ -70,8 +105,38 @@ class Settings:
             for key, value in args_dict.items():
                 cls.update_setting(key, value)
 
+    @classmethod
+    def get_values(cls) -> Dict[str, Any]:
+        return {
+            key: getattr(cls, key)
+            for key, value in vars(Settings).items()
+            if not key.startswith("_") and not callable(value) and not isinstance(value, classmethod)
+        }
+
     @classmethod
     def display_settings(cls):
         settings = {k: v for k, v in cls.__dict__.items() if not k.startswith("_")}
         for key, value in settings.items():
             print(f"{key}: {value}")
+
+
+class SettingsContext:
+    """
+    Settings of a single job. Inside `with context:` (and in threads started
+    via run_multithread) Settings attributes are read from and written to
+    the context instead of the class, so several jobs can run at once.
+    """
+
+    def __init__(self, args=None):
+        # starts with a copy of the process-wide settings
+        self.values: Dict[str, Any] = copy.deepcopy(Settings.get_values())
+        if args:
+            with self:
+                Settings.load_from_args(args)
+
+    def __enter__(self) -> "SettingsContext":
+        self._token = _current_context.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_context.reset(self._token)
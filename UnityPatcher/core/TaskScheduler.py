@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from UnityPy.enums import ClassIDType
+
+from core.Settings import Settings
+from helpers import CostModel
+from utils import run_multithread
+
+# stored in the temp folder, with the other patcher data
+TIMINGS_NAME = "task_timings.json"
+# weight of the current run when recorded ratios are updated
+TIMINGS_SMOOTHING = 0.5
+# streamed objects are small, their data size is read from the raw object
+STREAMED_OBJECT_MAX_SIZE = 4096
+
+
+class TaskTimings:
+    """
+    Ratios of the actual task time to the estimated one, per task kind
+    (e.g. "export:Texture2D"), recorded in previous runs.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(Settings.temp_path, TIMINGS_NAME)
+        self.lock = threading.Lock()
+        self.ratios: Dict[str, float] = self._load()
+        self._run: Dict[str, List[float]] = {}
+
+    def _load(self) -> Dict[str, float]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.debug("Can't load task timings: %s", e)
+            return {}
+
+    def correct(self, kind: str, estimate: float) -> float:
+        return estimate * self.ratios.get(kind, 1.0)
+
+    def record(self, kind: str, estimate: float, seconds: float):
+        with self.lock:
+            totals = self._run.setdefault(kind, [0.0, 0.0])
+            totals[0] += estimate
+            totals[1] += seconds
+
+    def save(self):
+        for kind, (estimated, actual) in self._run.items():
+            if estimated <= 0:
+                continue
+            ratio = actual / estimated
+            old_ratio = self.ratios.get(kind)
+            self.ratios[kind] = (
+                ratio
+                if old_ratio is None
+                else old_ratio * (1 - TIMINGS_SMOOTHING) + ratio * TIMINGS_SMOOTHING
+            )
+        self._run = {}
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.ratios, f, indent=2)
+        except OSError as e:
+            logging.debug("Can't save task timings: %s", e)
+
+
+def _streamed_size(obj) -> int:
+    """
+    Size of the AudioClip/VideoClip data without reading it:
+    both objects end with the StreamedResource size and 4 more bytes.
+    """
+    if obj.byte_size > STREAMED_OBJECT_MAX_SIZE or obj.version < (5,):
+        return obj.byte_size
+
+    raw = obj.get_raw_data()
+    (size,) = struct.unpack(f"{obj.reader.endian}q", raw[-12:-4])
+    return max(size, obj.byte_size)
+
+
+def estimate_export(obj) -> float:
+    """return: estimated CPU seconds of exporting the object"""
+    if obj.type == ClassIDType.Texture2D:
+        if obj.byte_size > STREAMED_OBJECT_MAX_SIZE:
+            # the image data is stored inside the object: estimate from its size
+            # instead of reading it
+            return CostModel.estimate_export_texture_data(obj.byte_size)
+        # the image data is in a .resS file, the object itself is small to read
+        data = obj.read()
+        return CostModel.estimate_export_texture(data.m_Width, data.m_Height)
+    if obj.type in (ClassIDType.AudioClip, ClassIDType.VideoClip):
+        return CostModel.estimate_export(_streamed_size(obj), obj.type.name)
+    return CostModel.estimate_export(obj.byte_size, obj.type.name)
+
+
+def estimate_patch(task: Tuple) -> float:
+    """
+    return: estimated CPU seconds of importing the patch.
+    Only the patch file sizes are used: objects and images aren't read before
+    the workers start (TaskTimings corrects the estimates of each object type).
+    """
+    patch, obj = task
+    regular_size = sum(file.size for file in patch.patches if file.is_regular)
+    seconds = CostModel.estimate_typetree(
+        sum(file.size for file in patch.patches if not file.is_regular)
+    )
+
+    if obj.type in (ClassIDType.Texture2D, ClassIDType.Texture2DArray):
+        return seconds + CostModel.estimate_texture_file(
+            regular_size,
+            "raw" if Settings.dont_compress_texture else "bc",
+            Settings.texture_compression_quality.value,
+        )
+    if obj.type == ClassIDType.AudioClip:
+        return seconds + CostModel.estimate_audio(regular_size, not Settings.dont_compress_audio)
+    if obj.type == ClassIDType.VideoClip:
+        return seconds + CostModel.estimate_video(regular_size, Settings.transcode_video)
+    return seconds + CostModel.estimate_typetree(regular_size)
+
+
+def run_scheduled(
+    worker: Callable,
+    tasks: List[Tuple],
+    operation: str,
+    estimate: Callable[[Tuple], float],
+    get_object: Callable[[Tuple], object],
+    max_workers: Optional[int] = None,
+):
+    """
+    Runs tasks with the longest (estimated) ones first, so that a huge texture
+    or video doesn't end up as the last task while the other threads are idle.
+    Actual timings refine the estimates of the next runs.
+    """
+    timings = TaskTimings()
+    overhead = CostModel.task_overhead()
+    # tasks are numbered, so that their costs don't depend on the task objects
+    costs: List[Tuple[str, float]] = []
+
+    for task in tasks:
+        kind = f"{operation}:{get_object(task).type.name}"
+        try:
+            cost = estimate(task) + overhead
+        except Exception as e:
+            logging.debug("Can't estimate the task: %s", e)
+            cost = overhead
+        costs.append((kind, cost))
+
+    def timed_worker(item: Tuple[int, Tuple]):
+        index, task = item
+        kind, cost = costs[index]
+        start = time.perf_counter()
+        try:
+            return worker(task)
+        finally:
+            timings.record(kind, cost, time.perf_counter() - start)
+
+    def get_cost(item: Tuple[int, Tuple]) -> float:
+        kind, cost = costs[item[0]]
+        return timings.correct(kind, cost)
+
+    run_multithread(
+        timed_worker, list(enumerate(tasks)), max_workers, cost=get_cost, name=operation.capitalize()
+    )
+    timings.save()
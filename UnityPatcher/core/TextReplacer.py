@@ -0,0 +1,211 @@
+"""
+Replacement table (CSV, or TSV for .tsv/.tab files), rows starting with # are skipped:
+
+- 2 columns: SOURCE TEXT, TARGET TEXT
+  replaces the text in TextAsset content and typetree string fields
+- 4 columns: SOURCE_FILE, PATH_ID, FIELD, VALUE
+  sets a field of a specific object. FIELD is a field name or a JSON pointer
+  (/m_Items/3/m_Text)
+"""
+
+import csv
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+from UnityPy.enums import ClassIDType
+
+from helpers import MergePatch
+
+TSV_EXTENSIONS = (".tsv", ".tab")
+
+
+@dataclass
+class ReplacementTable:
+    strings: Dict[str, str] = field(default_factory=dict)
+    # (source file, path id) -> {JSON pointer: value}
+    fields: Dict[Tuple[str, int], Dict[str, str]] = field(default_factory=dict)
+
+    @property
+    def source_names(self) -> List[str]:
+        return list({source for source, _ in self.fields})
+
+
+def load_table(path: str) -> ReplacementTable:
+    table = ReplacementTable()
+    delimiter = "\t" if path.lower().endswith(TSV_EXTENSIONS) else ","
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for line_number, row in enumerate(csv.reader(f, delimiter=delimiter), 1):
+            if not row or row[0].startswith("#"):
+                continue
+
+            if len(row) == 2:
+                source, target = row
+                if not source:
+                    raise ValueError(f"Empty source text (line {line_number})")
+                if table.strings.get(source, target) != target:
+                    logging.warning("[WARN] Duplicate source text (line %d): %s", line_number, source)
+                table.strings[source] = target
+            elif len(row) == 4:
+                source_file, path_id, field_name, value = row
+                try:
+                    key = (source_file, int(path_id))
+                except ValueError:
+                    raise ValueError(f"Invalid path id '{path_id}' (line {line_number})")
+                pointer = field_name if field_name.startswith("/") else f"/{field_name}"
+                table.fields.setdefault(key, {})[pointer] = value
+            else:
+                raise ValueError(
+                    f"Expected 2 or 4 columns, got {len(row)} (line {line_number})"
+                )
+
+    return table
+
+
+class TextReplacer:
+    """
+    Applies the replacement table in one pass over the loaded objects.
+
+    All source texts are matched with a single regex alternation (longest first).
+    Raw object data is checked with the bytes version of the pattern before
+    reading the typetree, so objects without matches are skipped cheaply.
+    """
+
+    def __init__(self, table: ReplacementTable, whole_string: bool = False):
+        self.table = table
+        self.whole_string = whole_string
+        self.used_sources = set()
+        self.replaced_count = 0
+        self.changed_objects = 0
+
+        sources = sorted(table.strings, key=len, reverse=True)
+        self.pattern: Optional[re.Pattern] = None
+        self.bytes_pattern: Optional[re.Pattern] = None
+        self.bytes_strings = {s.encode("utf-8"): t.encode("utf-8") for s, t in table.strings.items()}
+
+        if sources:
+            self.pattern = re.compile("|".join(map(re.escape, sources)))
+            self.bytes_pattern = re.compile(b"|".join(re.escape(s.encode("utf-8")) for s in sources))
+
+    def _replace_match(self, match: re.Match) -> str:
+        self.used_sources.add(match.group(0))
+        self.replaced_count += 1
+        return self.table.strings[match.group(0)]
+
+    def _replace_bytes_match(self, match: re.Match) -> bytes:
+        self.used_sources.add(match.group(0).decode("utf-8"))
+        self.replaced_count += 1
+        return self.bytes_strings[match.group(0)]
+
+    def replace_text(self, text: str) -> str:
+        if self.whole_string:
+            if text in self.table.strings:
+                self.used_sources.add(text)
+                self.replaced_count += 1
+                return self.table.strings[text]
+            return text
+        return self.pattern.sub(self._replace_match, text)
+
+    def replace_in_tree(self, tree) -> Tuple[object, bool]:
+        """return: tree with replaced strings, whether anything was changed"""
+        if isinstance(tree, str):
+            new_text = self.replace_text(tree)
+            return new_text, new_text != tree
+
+        changed = False
+        if isinstance(tree, dict):
+            for key, value in tree.items():
+                tree[key], value_changed = self.replace_in_tree(value)
+                changed |= value_changed
+        elif isinstance(tree, list):
+            for i, value in enumerate(tree):
+                tree[i], value_changed = self.replace_in_tree(value)
+                changed |= value_changed
+
+        return tree, changed
+
+    def process_object(self, obj) -> bool:
+        if not self.bytes_pattern.search(bytes(obj.get_raw_data())):
+            return False
+
+        if obj.type == ClassIDType.TextAsset and not self.whole_string:
+            data = obj.read()
+            script = bytes(data.m_Script)
+            new_script = self.bytes_pattern.sub(self._replace_bytes_match, script)
+            if new_script == script:
+                return False
+            data.script = new_script
+            data.save()
+            return True
+
+        manager = _get_manager(obj)
+        tree, changed = self.replace_in_tree(manager.read_typetree())
+        if changed:
+            manager.save_tree(tree)
+        return changed
+
+    def replace_strings(self, objects: List[object]):
+        if not self.pattern:
+            return
+
+        for obj in tqdm(objects, desc="Replacing"):
+            try:
+                if self.process_object(obj):
+                    self.changed_objects += 1
+            except Exception as e:
+                logging.error("[ERR] Failed to replace text in %s #%d: %s", obj.type.name, obj.path_id, e)
+
+    def set_fields(self, env) -> int:
+        changed = 0
+
+        for (source_file, path_id), values in self.table.fields.items():
+            cab = env.get_cab(source_file)
+            obj = cab.objects.get(path_id) if cab else None
+            if obj is None:
+                logging.warning("[WARN] Object not found: %s #%d", source_file, path_id)
+                continue
+
+            try:
+                manager = _get_manager(obj)
+                tree = manager.read_typetree()
+                for pointer, value in values.items():
+                    current = MergePatch.get_by_pointer(tree, pointer)
+                    MergePatch.set_by_pointer(tree, pointer, _convert_value(value, current))
+                manager.save_tree(tree)
+                changed += 1
+                logging.debug("[INF] Fields changed: %s #%d", source_file, path_id)
+            except Exception as e:
+                logging.error("[ERR] Failed to set fields of %s #%d: %s", source_file, path_id, e)
+
+        return changed
+
+    def print_summary(self, fields_changed: int = 0):
+        logging.info(
+            "\n[INF] %d strings replaced in %d assets", self.replaced_count, self.changed_objects
+        )
+        if self.table.fields:
+            logging.info("[INF] Fields changed in %d assets", fields_changed)
+
+        unused = [source for source in self.table.strings if source not in self.used_sources]
+        if unused:
+            logging.warning("[WARN] %d source texts were not found (see them in debug mode)", len(unused))
+            for source in unused:
+                logging.debug(" - %s", source)
+
+
+def _convert_value(value: str, current):
+    """Table values are strings, numeric and boolean fields keep their type."""
+    if isinstance(current, bool):
+        return value.strip().lower() in ("1", "true")
+    if isinstance(current, (int, float)):
+        return type(current)(value)
+    return value
+
+
+def _get_manager(obj):
+    from core.ObjectHandler import ObjectHandler
+
+    return ObjectHandler().read(obj).manager
@@ -1,16 +1,25 @@
-from . import TextSearcher
+from . import PatchArchive, TaskScheduler, TextReplacer, TextSearcher
 from .GameLoader import GameLoader
 from .ObjectHandler import ExceptionData, ObjectHandler, Statistics
+from .PackPlanner import PackPlanner
 from .PatchFile import PatchData, PatchFile
+from .PatchScanner import PatchScanner
+from .ResourceCompactor import ResourceCompactor
 from .Settings import Settings
 
 __all__ = [
     "TextSearcher",
+    "TextReplacer",
+    "TaskScheduler",
+    "PatchArchive",
     "ObjectHandler",
     "ExceptionData",
     "GameLoader",
+    "PackPlanner",
     "Settings",
     "PatchFile",
     "PatchData",
+    "PatchScanner",
+    "ResourceCompactor",
     "Statistics"
 ]
@@ -0,0 +1,309 @@
+"""
+Daemon mode: game folders are loaded once and jobs are run over local HTTP.
+
+GET  /games                      - loaded game folders
+GET  /assets?game=...&type=...   - assets of a loaded game
+GET  /jobs                       - all jobs
+GET  /jobs/<id>                  - job status and log
+POST /jobs {"command": "...", "wait": false}
+     command is a usual command line: "unpack --texture -i Game_Data -o Out"
+
+Read jobs (unpack, search) share the loaded environment. Pack jobs use it
+too, but exclusively: the files changed by a pack job are loaded from the
+game folder again when it finishes.
+
+When listening on a non-local address, requests must have the
+"Authorization: Bearer <token>" header (see --token).
+"""
+
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from args import parse_args
+from core import GameLoader
+from core.Settings import Settings, SettingsContext
+
+READ_COMMANDS = {"unpack", "search"}
+JOB_COMMANDS = READ_COMMANDS | {"pack"}
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+_current_job: ContextVar[Optional["Job"]] = ContextVar("current_job", default=None)
+
+
+class Job:
+    def __init__(self, job_id: int, command: str):
+        self.id = job_id
+        self.command = command
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.log: List[str] = []
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self, with_log: bool = False) -> dict:
+        data = {
+            "id": self.id,
+            "command": self.command,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+        if with_log:
+            data["log"] = self.log
+        return data
+
+
+class ReadWriteLock:
+    """Shared access for read jobs, exclusive access for pack jobs."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writer)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writer and not self.readers)
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class JobLogHandler(logging.Handler):
+    """Collects log records of the job that is running in the current context."""
+
+    def emit(self, record: logging.LogRecord):
+        job = _current_job.get()
+        if job is not None:
+            job.log.append(record.getMessage())
+
+
+class PatcherDaemon:
+    def __init__(self, game_folders: List[str], max_jobs: int = 2):
+        self.loaders: Dict[str, GameLoader] = {}
+        self.loader_locks: Dict[str, ReadWriteLock] = {}
+        self.jobs: Dict[int, Job] = {}
+        self.job_ids = count(1)
+        self.lock = threading.Lock()
+        self.job_slots = threading.Semaphore(max_jobs)
+
+        logging.getLogger().addHandler(JobLogHandler())
+
+        for game_folder in game_folders:
+            self.get_loader(game_folder)
+
+    @staticmethod
+    def _key(game_folder: str) -> str:
+        return os.path.normcase(os.path.abspath(game_folder))
+
+    def get_loader(self, game_folder: str = "") -> GameLoader:
+        """Returns the resident environment of the game (loads it if needed)."""
+        with self.lock:
+            if not game_folder:
+                if len(self.loaders) != 1:
+                    raise ValueError("Specify the game folder (-i)")
+                return next(iter(self.loaders.values()))
+
+            key = self._key(game_folder)
+            if key not in self.loaders:
+                loader = GameLoader(game_folder)
+                loader.load_game()
+                self.loaders[key] = loader
+                self.loader_locks[key] = ReadWriteLock()
+            return self.loaders[key]
+
+    def get_lock(self, loader: GameLoader) -> ReadWriteLock:
+        with self.lock:
+            return self.loader_locks[self._key(loader.game_folder)]
+
+    def list_jobs(self) -> List[Job]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def game_folders(self) -> List[str]:
+        with self.lock:
+            return [loader.game_folder for loader in self.loaders.values()]
+
+    def submit(self, command: str) -> Job:
+        args = parse_args(command)
+
+        if args.command not in JOB_COMMANDS:
+            raise ValueError(f"Unsupported job command: {args.command}")
+        if args.command == "pack" and (args.watch or args.outsamedir):
+            raise ValueError("--watch and --outsamedir are not available for jobs")
+
+        job = Job(next(self.job_ids), command)
+        with self.lock:
+            self.jobs[job.id] = job
+
+        context = SettingsContext(args)
+        threading.Thread(target=self._run_job, args=(job, args, context), daemon=True).start()
+        return job
+
+    def _run_job(self, job: Job, args, context: SettingsContext):
+        from Patcher import Patcher, run_pack, run_search, run_unpack
+
+        _current_job.set(job)
+
+        with self.job_slots, context:
+            job.status = "running"
+            try:
+                loader = self.get_loader(args.game_folder)
+                Settings.game_folder = loader.game_folder
+                if args.command in READ_COMMANDS:
+                    with self.get_lock(loader).read():
+                        patcher = Patcher(loader)
+                        if args.command == "unpack":
+                            run_unpack(patcher, args)
+                        else:
+                            run_search(patcher, args)
+                else:
+                    with self.get_lock(loader).write():
+                        try:
+                            run_pack(loader, args)
+                        finally:
+                            loader.reload_changed()
+
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logging.error("[ERR] Job %d failed:\n%s", job.id, traceback.format_exc())
+            finally:
+                job.finished = time.time()
+                job.done.set()
+
+    def list_assets(self, game_folder: str = "", asset_type: str = "") -> List[dict]:
+        loader = self.get_loader(game_folder)
+        with self.get_lock(loader).read():
+            return [
+                {
+                    "type": obj.type.name,
+                    "path_id": obj.path_id,
+                    "source": obj.assets_file.name,
+                }
+                for obj in loader.get_objects()
+                if not asset_type or obj.type.name == asset_type
+            ]
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8765, token: Optional[str] = None):
+        """
+        token: required in the Authorization header of requests. Generated
+        when listening on a non-local address without a token, since jobs
+        write files.
+        """
+        daemon = self
+        if token is None and host not in LOCAL_HOSTS:
+            token = secrets.token_urlsafe(24)
+            logging.warning("[WARN] Listening on %s, requests require the token: %s", host, token)
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logging.debug("[HTTP] " + format, *args)
+
+            def _send(self, data, status: int = 200):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                if token is None:
+                    return True
+                header = self.headers.get("Authorization", "")
+                if hmac.compare_digest(header.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+                    return True
+                self._send({"error": "Unauthorized"}, 401)
+                return False
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                parts = [part for part in url.path.split("/") if part]
+
+                try:
+                    if parts == ["games"]:
+                        self._send(daemon.game_folders())
+                    elif parts == ["assets"]:
+                        self._send(daemon.list_assets(query.get("game", ""), query.get("type", "")))
+                    elif parts == ["jobs"]:
+                        self._send([job.to_dict() for job in daemon.list_jobs()])
+                    elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                        job = daemon.jobs.get(int(parts[1]))
+                        if job:
+                            self._send(job.to_dict(with_log=True))
+                        else:
+                            self._send({"error": "Job not found"}, 404)
+                    else:
+                        self._send({"error": "Not found"}, 404)
+                except Exception as e:
+                    self._send({"error": str(e)}, 400)
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                if urlparse(self.path).path.rstrip("/") != "/jobs":
+                    self._send({"error": "Not found"}, 404)
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    job = daemon.submit(request["command"])
+                except SystemExit:
+                    # argparse exits on invalid command lines
+                    self._send({"error": "Invalid command"}, 400)
+                    return
+                except Exception as e:
+                    self._send({"error": str(e)}, 400)
+                    return
+
+                if request.get("wait"):
+                    job.done.wait()
+                self._send(job.to_dict(with_log=bool(request.get("wait"))), 202 if not job.done.is_set() else 200)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        logging.info("\n[INF] Daemon is listening on http://%s:%d (Ctrl+C to stop)", host, port)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("\n[INF] Daemon stopped")
+        finally:
+            server.server_close()
@@ -0,0 +1,238 @@
+import ctypes
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# how often the load is sampled and the pool is resized
+SAMPLE_INTERVAL = 0.5
+# system CPU usage above which the machine is considered saturated
+CPU_SATURATED = 0.95
+CPU_BUSY = 0.8
+# share of CPU time spent waiting for the disk above which the disk is saturated
+IOWAIT_SATURATED = 0.2
+# tasks whose threads use the CPU less than this share of the time are waiting for I/O
+TASK_IO_BOUND = 0.5
+TASK_CPU_BOUND = 0.8
+
+_active_tasks = 0
+_active_lock = threading.Lock()
+
+
+class CpuSampler:
+    """System CPU usage and I/O wait between two calls of sample()."""
+
+    def __init__(self):
+        self._last = self._read_times()
+        self._last_process = (time.perf_counter(), time.process_time())
+
+    @staticmethod
+    def _read_times() -> Optional[Tuple[float, float, float]]:
+        """return: total, idle and iowait time (iowait is 0 if unknown)"""
+        if sys.platform.startswith("linux"):
+            try:
+                with open("/proc/stat", "r") as f:
+                    values = [int(value) for value in f.readline().split()[1:]]
+            except (OSError, ValueError):
+                return None
+            # user nice system idle iowait irq softirq steal
+            return sum(values[:8]), values[3], values[4]
+
+        if sys.platform == "win32":
+            idle, kernel, user = (ctypes.c_ulonglong() for _ in range(3))
+            if ctypes.windll.kernel32.GetSystemTimes(
+                ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)
+            ):
+                # kernel time includes idle time
+                return kernel.value + user.value, idle.value, 0
+
+        return None
+
+    def sample(self) -> Tuple[Optional[float], float, float]:
+        """return: system CPU usage (None if unknown), I/O wait share, CPU cores used by the process"""
+        now, process_time = time.perf_counter(), time.process_time()
+        last_now, last_process_time = self._last_process
+        self._last_process = (now, process_time)
+        process_cores = (process_time - last_process_time) / max(now - last_now, 1e-6)
+
+        times = self._read_times()
+        last, self._last = self._last, times
+        if not times or not last or times[0] <= last[0]:
+            return None, 0.0, process_cores
+
+        total = times[0] - last[0]
+        busy = 1 - (times[1] - last[1] + times[2] - last[2]) / total
+        return busy, (times[2] - last[2]) / total, process_cores
+
+
+class AdaptivePool:
+    """
+    Thread pool which resizes itself while running: it grows while tasks are
+    waiting for I/O and the CPU is free, and shrinks when the machine is
+    saturated (e.g. by FSB5/ffmpeg processes) or when tasks are limited by the GIL.
+    Tasks are taken from the queue in the given order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        min_workers: int = 1,
+        max_workers: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        cpu_count = os.cpu_count() or 1
+        self.name = name
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers or min(32, cpu_count * 4), min_workers)
+        self.target = min(max(workers or cpu_count, self.min_workers), self.max_workers)
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._alive = 0
+        self._error: Optional[BaseException] = None
+        # thread CPU time and wall time of tasks finished since the last sample
+        self._task_cpu = 0.0
+        self._task_wall = 0.0
+        self._history: List[int] = []
+        self._drained = threading.Event()
+
+    @property
+    def is_fixed(self) -> bool:
+        return self.min_workers == self.max_workers
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._work, daemon=True)
+        self._alive += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        global _active_tasks
+
+        while True:
+            with self._lock:
+                # the pool was shrunk
+                if self._alive > self.target:
+                    self._alive -= 1
+                    return
+
+            item = self._queue.get()
+            if self._queue.empty():
+                self._drained.set()
+            if item is None:
+                with self._lock:
+                    self._alive -= 1
+                return
+
+            fn, task, on_done = item
+            start_wall, start_cpu = time.perf_counter(), time.thread_time()
+            with _active_lock:
+                _active_tasks += 1
+            try:
+                fn(task)
+            except BaseException as e:
+                with self._lock:
+                    self._error = self._error or e
+            finally:
+                with _active_lock:
+                    _active_tasks -= 1
+                with self._lock:
+                    self._task_wall += time.perf_counter() - start_wall
+                    self._task_cpu += time.thread_time() - start_cpu
+                if on_done:
+                    on_done()
+
+    def _resize(self, sampler: CpuSampler):
+        cpu_usage, iowait, process_cores = sampler.sample()
+
+        with self._lock:
+            task_cpu, task_wall = self._task_cpu, self._task_wall
+            self._task_cpu = self._task_wall = 0.0
+            previous = target = self.target
+
+            if not task_wall:
+                return
+            cpu_share = task_cpu / task_wall
+
+            if (cpu_usage is not None and cpu_usage > CPU_SATURATED) or iowait > IOWAIT_SATURATED:
+                target -= 1
+            elif cpu_share >= TASK_CPU_BOUND and process_cores < self._alive / 2:
+                # threads are waiting for the GIL, not for the CPU
+                target = max(int(process_cores) + 1, target - 1)
+            elif (
+                cpu_share < TASK_IO_BOUND
+                and self._queue.qsize() > self._alive
+                and (cpu_usage is None or cpu_usage < CPU_BUSY)
+            ):
+                target += max(1, target // 2)
+
+            self.target = min(max(target, self.min_workers), self.max_workers)
+            for _ in range(self.target - self._alive):
+                self._start_worker()
+
+        if self.target != previous:
+            logging.debug("[%s] Threads: %d", self.name, self.target)
+
+    def run(self, fn: Callable, tasks: Iterable, on_done: Optional[Callable[[], None]] = None):
+        """Runs fn(task) for every task and waits for completion."""
+        tasks = list(tasks)
+        if not tasks:
+            return
+
+        self._history = []
+        self._error = None
+        for task in tasks:
+            self._queue.put((fn, task, on_done))
+
+        with self._lock:
+            self.target = min(self.target, len(tasks))
+            for _ in range(self.target):
+                self._start_worker()
+
+        sampler = CpuSampler()
+        while not self._drained.wait(SAMPLE_INTERVAL):
+            self._history.append(self.target)
+            if not self.is_fixed:
+                self._resize(sampler)
+
+        with self._lock:
+            # the queue is empty: every thread stops after its last task
+            for _ in range(self._alive):
+                self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._queue = queue.Queue()
+        self._drained.clear()
+
+        self._log_summary(len(tasks))
+        if self._error:
+            raise self._error
+
+    def _log_summary(self, task_count: int):
+        history = self._history or [self.target]
+        if self.is_fixed or min(history) == max(history):
+            logging.info("[INF] %s: %d tasks, %d threads", self.name, task_count, history[-1])
+        else:
+            logging.info(
+                "[INF] %s: %d tasks, %d-%d threads (%.1f on average)",
+                self.name,
+                task_count,
+                min(history),
+                max(history),
+                sum(history) / len(history),
+            )
+
+
+def subprocess_threads() -> int:
+    """
+    Number of threads for an external encoder (FSB5, ffmpeg),
+    so that encoders started from several tasks don't oversubscribe the CPU.
+    """
+    cpu_count = os.cpu_count() or 1
+    with _active_lock:
+        return max(1, cpu_count // max(1, _active_tasks))
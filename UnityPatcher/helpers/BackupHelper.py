@@ -0,0 +1,71 @@
+import logging
+import os
+import shutil
+import sys
+from enum import Enum
+from typing import Optional
+
+# ioctl request for cloning file extents (btrfs, XFS, bcachefs...)
+FICLONE = 0x40049409
+
+
+class BackupStrategy(Enum):
+    Reflink = "reflink"
+    Rename = "rename"
+    Copy = "copy"
+
+
+def reflink(src: str, dst: str) -> bool:
+    """
+    Creates a copy-on-write clone of src. Returns False if the file system
+    doesn't support it (in this case dst is not created).
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+    shutil.copystat(src, dst)
+    return True
+
+
+def create_backup(
+    original_path: str, backup_path: str, can_move: bool = False
+) -> Optional[BackupStrategy]:
+    """
+    Backs up original_path without copying data whenever possible.
+
+    Strategies, from cheapest to the most expensive (hardlinks aren't used:
+    resources may be appended to in place, which would change the backup too):
+    - reflink: copy-on-write clone (near-instant on btrfs/XFS)
+    - rename: the original is moved to the backup folder. Only allowed
+      (can_move) when the original is about to be replaced anyway
+    - copy: full copy
+
+    return: used strategy or None if the backup already exists
+    """
+    if os.path.isfile(backup_path):
+        return None
+
+    os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+
+    if reflink(original_path, backup_path):
+        return BackupStrategy.Reflink
+
+    if can_move:
+        try:
+            os.rename(original_path, backup_path)
+            return BackupStrategy.Rename
+        except OSError as e:
+            logging.debug("Can't move %s: %s", original_path, e)
+
+    shutil.copy2(original_path, backup_path)
+    return BackupStrategy.Copy
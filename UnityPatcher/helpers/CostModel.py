@@ -0,0 +1,109 @@
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+MB = 1024 * 1024
+
+CALIBRATION_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "calibration.json"
+)
+
+
+@dataclass
+class TaskEstimate:
+    description: str
+    cpu_seconds: float = 0.0
+    memory_bytes: int = 0
+
+
+@lru_cache(maxsize=None)
+def load_calibration(path: str = CALIBRATION_PATH) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def estimate_texture(
+    width: int,
+    height: int,
+    encoder: str,
+    quality: str = "best",
+    mip_count: int = 1,
+    images: int = 1,
+) -> float:
+    """
+    encoder: bc, bc_numpy, etc, astc or raw
+    return: CPU seconds for encoding
+    """
+    calibration = load_calibration()["texture_seconds_per_megapixel"]
+    megapixels = width * height * images / 1_000_000
+    # the whole mip chain is ~4/3 of the base level
+    encoded_megapixels = megapixels * (4 / 3 if mip_count > 1 else 1)
+
+    rate = calibration[encoder]
+    if isinstance(rate, dict):
+        rate = rate.get(quality, max(rate.values()))
+
+    return megapixels * calibration["decode"] + encoded_megapixels * rate
+
+
+def estimate_texture_file(size: int, encoder: str, quality: str = "best") -> float:
+    """
+    Rough estimate from the image file size, when the image isn't opened
+    (used to order the tasks, not for the pack plan).
+    """
+    pixels = size * load_calibration()["texture_pixels_per_file_byte"]
+    side = int(pixels ** 0.5)
+    return estimate_texture(side, side, encoder, quality)
+
+
+def texture_memory(width: int, height: int) -> int:
+    return width * height * load_calibration()["texture_memory_bytes_per_pixel"]
+
+
+def estimate_audio(input_size: int, compress: bool = True) -> float:
+    rates = load_calibration()["audio_seconds_per_megabyte"]
+    return input_size / MB * rates["fsb5" if compress else "copy"]
+
+
+def estimate_video(input_size: int, transcode: bool = False) -> float:
+    rates = load_calibration()["video_seconds_per_megabyte"]
+    return input_size / MB * rates["transcode" if transcode else "copy"]
+
+
+def estimate_typetree(size: int) -> float:
+    return size / MB * load_calibration()["typetree_seconds_per_megabyte"]
+
+
+def estimate_save(size: int, packer: str = "original") -> float:
+    rates = load_calibration()["save_seconds_per_megabyte"]
+    return size / MB * rates.get(packer, rates["lz4"])
+
+
+def save_memory(size: int) -> int:
+    return int(size * load_calibration()["save_memory_factor"])
+
+
+def estimate_io(read_bytes: int, write_bytes: int) -> float:
+    rates = load_calibration()["io_megabytes_per_second"]
+    return read_bytes / MB / rates["read"] + write_bytes / MB / rates["write"]
+
+
+def estimate_export_texture(width: int, height: int) -> float:
+    # only the base level is decoded and saved as an image
+    return width * height / 1_000_000 * load_calibration()["export_seconds_per_megapixel"]
+
+
+def estimate_export_texture_data(size: int) -> float:
+    """Export estimate from the size of the encoded image data."""
+    pixels = size * load_calibration()["texture_pixels_per_data_byte"]
+    return pixels / 1_000_000 * load_calibration()["export_seconds_per_megapixel"]
+
+
+def estimate_export(size: int, type_name: str) -> float:
+    rates = load_calibration()["export_seconds_per_megabyte"]
+    return size / MB * rates.get(type_name, rates["default"])
+
+
+def task_overhead() -> float:
+    return load_calibration()["task_overhead_seconds"]
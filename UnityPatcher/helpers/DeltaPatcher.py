@@ -0,0 +1,335 @@
+"""
+Binary deltas between an original game file and its patched version.
+
+Delta layout:
+    header:   magic, block size, source size, target size, target digest
+    commands: COPY (source offset, length) - take bytes from the original file
+              DATA (raw length, packed length, zlib data) - take new bytes
+              END
+
+Both creating and applying a delta are streaming: the target file is scanned
+in chunks and the original file is only accessed block by block, so memory
+usage doesn't depend on the file size.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import zlib
+from typing import BinaryIO, Dict, Optional
+
+import numpy as np
+
+
+MAGIC = b"UPDELTA1"
+DELTA_EXTENSION = ".delta"
+
+HEADER = struct.Struct("<8sIQQ32s")
+COPY_ARGS = struct.Struct("<QQ")
+DATA_ARGS = struct.Struct("<II")
+
+OP_END = 0
+OP_COPY = 1
+OP_DATA = 2
+
+DEFAULT_BLOCK_SIZE = 8 * 1024
+SCAN_CHUNK_SIZE = 1024 * 1024
+LITERAL_LIMIT = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _open_source(path: Optional[str]) -> BinaryIO:
+    # files that don't exist in the game folder are diffed against empty data
+    return open(path, "rb") if path else io.BytesIO()
+
+
+def new_digest():
+    return hashlib.blake2b(digest_size=32)
+
+
+def _strong_hash(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _weak_hash(block: bytes) -> int:
+    """Adler-like checksum of a single block (see _rolling_weak_hashes)."""
+    x = np.frombuffer(block, dtype=np.uint8).astype(np.int64)
+    weights = np.arange(len(x), 0, -1, dtype=np.int64)
+    a = int(x.sum())
+    b = int((x * weights).sum())
+    return (a & 0xFFFF) | ((b & 0xFFFF) << 16)
+
+
+def _rolling_weak_hashes(data: bytes, block_size: int) -> np.ndarray:
+    """
+    Computes the weak checksum of every window of block_size bytes in data
+    at once. Equals _weak_hash(data[k:k + block_size]) for each position k.
+    """
+    x = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    count = len(x) - block_size + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    sums = np.zeros(len(x) + 1, dtype=np.int64)
+    np.cumsum(x, out=sums[1:])
+    weighted = np.zeros(len(x) + 1, dtype=np.int64)
+    np.cumsum(x * np.arange(len(x), dtype=np.int64), out=weighted[1:])
+
+    starts = np.arange(count, dtype=np.int64)
+    a = sums[block_size:] - sums[:count]
+    b = (block_size + starts) * a - (weighted[block_size:] - weighted[:count])
+    return (a & 0xFFFF) | ((b & 0xFFFF) << 16)
+
+
+class _Signature:
+    """Checksums of the aligned blocks of the original file."""
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self.weak_hashes = np.empty(0, dtype=np.int64)
+        self.strong_hashes: Dict[bytes, int] = {}  # strong hash -> source offset
+        self.block_hashes = []  # strong hash of each block in source order
+        self.size = 0
+
+    @classmethod
+    def build(cls, source: BinaryIO, block_size: int) -> "_Signature":
+        signature = cls(block_size)
+        weak_hashes = set()
+        offset = 0
+
+        while True:
+            block = source.read(block_size)
+            if len(block) < block_size:
+                signature.size = offset + len(block)
+                break
+
+            strong = _strong_hash(block)
+            weak_hashes.add(_weak_hash(block))
+            signature.strong_hashes.setdefault(strong, offset)
+            signature.block_hashes.append(strong)
+            offset += block_size
+
+        signature.weak_hashes = np.array(sorted(weak_hashes), dtype=np.int64)
+        return signature
+
+    def expected_block(self, offset: int):
+        index, remainder = divmod(offset, self.block_size)
+        if remainder or index >= len(self.block_hashes):
+            return None
+        return self.block_hashes[index]
+
+
+class _DeltaWriter:
+    def __init__(self, output: BinaryIO):
+        self.output = output
+        self.literal = bytearray()
+        self.copy_offset = None
+        self.copy_length = 0
+        self.copied_bytes = 0
+        self.literal_bytes = 0
+
+    def copy(self, offset: int, length: int):
+        self._flush_literal()
+        if self.copy_offset is not None and self.copy_offset + self.copy_length == offset:
+            self.copy_length += length
+        else:
+            self._flush_copy()
+            self.copy_offset, self.copy_length = offset, length
+        self.copied_bytes += length
+
+    def data(self, data):
+        if not len(data):
+            return
+        self._flush_copy()
+        self.literal.extend(data)
+        self.literal_bytes += len(data)
+        if len(self.literal) >= LITERAL_LIMIT:
+            self._flush_literal()
+
+    def close(self):
+        self._flush_copy()
+        self._flush_literal()
+        self.output.write(bytes([OP_END]))
+
+    def _flush_copy(self):
+        if self.copy_offset is not None:
+            self.output.write(bytes([OP_COPY]))
+            self.output.write(COPY_ARGS.pack(self.copy_offset, self.copy_length))
+            self.copy_offset, self.copy_length = None, 0
+
+    def _flush_literal(self):
+        while self.literal:
+            chunk = bytes(self.literal[:LITERAL_LIMIT])
+            del self.literal[:LITERAL_LIMIT]
+            packed = zlib.compress(chunk, 6)
+            self.output.write(bytes([OP_DATA]))
+            self.output.write(DATA_ARGS.pack(len(chunk), len(packed)))
+            self.output.write(packed)
+
+
+def create_delta(
+    source_path: Optional[str],
+    target_path: str,
+    delta_path: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> dict:
+    """
+    Writes a delta that turns source_path into target_path.
+
+    source_path: original file (None if the file is new)
+    target_path: modified file
+    delta_path: where to write the delta
+    return: statistics (delta size, copied and new bytes)
+    """
+    with _open_source(source_path) as source:
+        signature = _Signature.build(source, block_size)
+
+    digest = new_digest()
+    target_size = 0
+
+    with open(target_path, "rb") as target, open(delta_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, block_size, signature.size, 0, b""))
+        writer = _DeltaWriter(output)
+        buffer = b""
+        next_offset = 0  # source offset expected after the previous match
+        eof = False
+
+        while not eof:
+            chunk = target.read(SCAN_CHUNK_SIZE)
+            eof = not chunk
+            digest.update(chunk)
+            target_size += len(chunk)
+            buffer += chunk
+
+            weak_hashes = _rolling_weak_hashes(buffer, block_size)
+            candidates = np.flatnonzero(np.isin(weak_hashes, signature.weak_hashes))
+            # on the last pass every window can be matched, otherwise
+            # keep the windows that may continue into the next chunk
+            limit = len(weak_hashes) if eof else max(len(buffer) - 2 * block_size, 0)
+            pos = 0
+            literal_start = 0
+
+            while pos < limit:
+                window = buffer[pos : pos + block_size]
+                expected = signature.expected_block(next_offset)
+
+                if expected is not None and _strong_hash(window) == expected:
+                    match = pos
+                    offset = next_offset
+                else:
+                    match, offset = None, None
+                    index = np.searchsorted(candidates, pos)
+                    while index < len(candidates) and candidates[index] < limit:
+                        candidate = int(candidates[index])
+                        offset = signature.strong_hashes.get(
+                            _strong_hash(buffer[candidate : candidate + block_size])
+                        )
+                        if offset is not None:
+                            match = candidate
+                            break
+                        index += 1
+
+                if match is None:
+                    pos = limit
+                    break
+
+                writer.data(buffer[literal_start:match])
+                writer.copy(offset, block_size)
+                pos = literal_start = match + block_size
+                next_offset = offset + block_size
+
+            if eof:
+                writer.data(buffer[literal_start:])
+            else:
+                # everything before the unscanned tail is not part of any match
+                writer.data(buffer[literal_start:pos])
+                buffer = buffer[pos:]
+
+        writer.close()
+
+        output.seek(0)
+        output.write(
+            HEADER.pack(MAGIC, block_size, signature.size, target_size, digest.digest())
+        )
+        delta_size = output.seek(0, os.SEEK_END)
+
+    return {
+        "delta_size": delta_size,
+        "copied_bytes": writer.copied_bytes,
+        "new_bytes": writer.literal_bytes,
+    }
+
+
+def read_header(delta: BinaryIO) -> dict:
+    magic, block_size, source_size, target_size, target_digest = HEADER.unpack(
+        delta.read(HEADER.size)
+    )
+    if magic != MAGIC:
+        raise ValueError("Invalid delta file")
+
+    return {
+        "block_size": block_size,
+        "source_size": source_size,
+        "target_size": target_size,
+        "target_digest": target_digest,
+    }
+
+
+def apply_delta(source_path: Optional[str], delta_path: str, output_path: str):
+    """
+    Rebuilds the modified file from the original one and the delta.
+    The result is written to a temporary file first, so output_path
+    may be the same as source_path.
+    """
+    temp_path = output_path + "_new"
+    digest = new_digest()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    with open(delta_path, "rb") as delta:
+        header = read_header(delta)
+
+        source_size = os.path.getsize(source_path) if source_path else 0
+        if source_size != header["source_size"]:
+            raise ValueError(
+                f"{source_path} doesn't match the delta (the original file was changed?)"
+            )
+
+        try:
+            with _open_source(source_path) as source, open(temp_path, "wb") as output:
+                while True:
+                    op = delta.read(1)
+                    if not op:
+                        raise ValueError("Unexpected end of delta file")
+
+                    if op[0] == OP_END:
+                        break
+
+                    if op[0] == OP_COPY:
+                        offset, length = COPY_ARGS.unpack(delta.read(COPY_ARGS.size))
+                        source.seek(offset)
+                        while length:
+                            data = source.read(min(length, COPY_CHUNK_SIZE))
+                            if not data:
+                                raise ValueError("Delta refers outside the original file")
+                            output.write(data)
+                            digest.update(data)
+                            length -= len(data)
+                    elif op[0] == OP_DATA:
+                        raw_length, packed_length = DATA_ARGS.unpack(delta.read(DATA_ARGS.size))
+                        data = zlib.decompress(delta.read(packed_length))
+                        if len(data) != raw_length:
+                            raise ValueError("Corrupted delta data")
+                        output.write(data)
+                        digest.update(data)
+                    else:
+                        raise ValueError(f"Unknown delta command: {op[0]}")
+
+            if digest.digest() != header["target_digest"]:
+                raise ValueError("Result doesn't match the delta checksum")
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    os.replace(temp_path, output_path)
@@ -0,0 +1,231 @@
+"""
+Content-addressed cache of encoded payloads: compressed textures,
+FSB5 audio and transcoded video.
+
+The key is built from the hash of the source files and everything the
+result depends on (target format, quality, mip count, encoder version),
+so an unchanged patch isn't encoded again on the next pack. Payloads are
+stored as files, their sizes and last use times are kept in an SQLite
+index; the least recently used entries are removed when the cache
+exceeds Settings.encode_cache_size. The cache is kept in the temporary
+folder (Settings.temp_path) unless Settings.encode_cache_path is set.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from core.Settings import Settings
+from helpers.SmartPatching import calculate_hash
+
+INDEX_NAME = "index.sqlite"
+# default cache folder inside Settings.temp_path
+CACHE_FOLDER_NAME = "encode_cache"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    metadata TEXT NOT NULL
+);
+"""
+
+_cache: Optional["EncodeCache"] = None
+_cache_lock = threading.Lock()
+# source path -> (size, mtime_ns, hash) of the files hashed in this run
+_source_hashes: Dict[str, Tuple[int, int, str]] = {}
+
+
+@dataclass
+class CacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    saved_bytes: int = 0
+    evicted: int = 0
+
+
+class EncodeCache:
+    def __init__(self, folder: str, max_size: int):
+        """
+        folder: cache folder
+        max_size: maximum total size of the payloads in bytes
+        """
+        self.folder = folder
+        self.max_size = max_size
+        self.stats = CacheStatistics()
+        self.lock = threading.Lock()
+
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(
+            os.path.join(folder, INDEX_NAME), check_same_thread=False, timeout=30
+        )
+        self.connection.executescript(SCHEMA)
+
+    def _payload_path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, dict]]:
+        """return: payload and its metadata or None if it isn't cached"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT metadata FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            data = None
+            if row:
+                try:
+                    with open(self._payload_path(key), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    pass
+
+            if data is None:
+                if row:
+                    with self.connection:
+                        self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.stats.misses += 1
+                return None
+
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+            self.stats.hits += 1
+            self.stats.saved_bytes += len(data)
+            return data, json.loads(row[0])
+
+    def put(self, key: str, kind: str, data: bytes, metadata: dict):
+        if len(data) > self.max_size:
+            return
+
+        path = self._payload_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # other processes may read the cache at the same time
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, len(data), time.time(), json.dumps(metadata)),
+                )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_size:
+            return
+
+        removed = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self._payload_path(key))
+            except OSError:
+                pass
+            removed.append((key,))
+            total -= size
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM entries WHERE key = ?", removed)
+        self.stats.evicted += len(removed)
+
+    def log_statistics(self):
+        if not self.stats.hits and not self.stats.misses:
+            return
+        logging.info(
+            "[INF] Encode cache: %d hits, %d misses, %.2f MB reused",
+            self.stats.hits,
+            self.stats.misses,
+            self.stats.saved_bytes / 1024 / 1024,
+        )
+        if self.stats.evicted:
+            logging.info("[INF] Encode cache: %d old entries removed", self.stats.evicted)
+        self.stats = CacheStatistics()
+
+
+def get_cache() -> Optional[EncodeCache]:
+    """return: the shared cache (None if it's disabled)"""
+    global _cache
+    if Settings.encode_cache_size <= 0:
+        return None
+
+    with _cache_lock:
+        folder = os.path.abspath(
+            Settings.encode_cache_path or os.path.join(Settings.temp_path, CACHE_FOLDER_NAME)
+        )
+        if _cache is None or _cache.folder != folder:
+            _cache = EncodeCache(folder, Settings.encode_cache_size * 1024 * 1024)
+        _cache.max_size = Settings.encode_cache_size * 1024 * 1024
+        return _cache
+
+
+def source_hash(path: str) -> str:
+    """Hash of the file content (files are hashed once per run while they don't change)."""
+    stat = os.stat(path)
+    cached = _source_hashes.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    file_hash = calculate_hash(path)
+    _source_hashes[path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+    return file_hash
+
+
+def make_key(kind: str, sources: Iterable[str], params: Iterable) -> str:
+    """
+    kind: payload kind (texture, audio, video)
+    sources: source files of the payload
+    params: everything else the payload depends on
+    """
+    parts = [kind, *(source_hash(path) for path in sources), *map(str, params)]
+    return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=20).hexdigest()
+
+
+def cached(
+    kind: str,
+    sources: Iterable[str],
+    params: Callable[[], Iterable],
+    encode: Callable[[], Tuple[bytes, dict]],
+) -> Tuple[bytes, dict]:
+    """
+    params: returns the parameters of the key (only called when the cache is enabled,
+    like the sources are only hashed then)
+
+    return: payload and metadata from the cache or from encode()
+    (metadata must be JSON serializable)
+    """
+    cache = get_cache()
+    if cache is None:
+        return encode()
+
+    key = make_key(kind, sources, params())
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    data, metadata = encode()
+    try:
+        cache.put(key, kind, bytes(data), metadata)
+    except (OSError, sqlite3.Error) as e:
+        logging.debug("Can't cache the %s: %s", kind, e)
+    return data, metadata
+
+
+def log_statistics():
+    if _cache is not None:
+        _cache.log_statistics()
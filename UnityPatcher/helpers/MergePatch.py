@@ -0,0 +1,97 @@
+"""
+Sparse patches of typetrees. Two styles are supported:
+
+- JSON merge patch (RFC 7386): a part of the tree with changed fields only.
+  Objects are merged recursively, any other value (including lists) replaces
+  the old one: {"m_Name": "New name", "m_Data": {"m_Text": "..."}}
+
+- JSON pointers (RFC 6901): every key is a path to the changed value,
+  which is useful for changing single list items:
+  {"/m_Strings/3": "...", "/m_Data/m_Items/0/m_Text": "..."}
+
+Unlike RFC 7386, fields can't be added or removed: the typetree structure
+is fixed, so unknown fields and null values are treated as errors.
+"""
+
+from typing import Any, List, Union
+
+
+def is_pointer_patch(patch: dict) -> bool:
+    return bool(patch) and all(key.startswith("/") for key in patch)
+
+
+def apply_patch(tree: dict, patch: dict) -> dict:
+    if not isinstance(patch, dict):
+        raise TypeError(f"Patch must be a dictionary, not {type(patch).__name__}")
+
+    if is_pointer_patch(patch):
+        for pointer, value in patch.items():
+            set_by_pointer(tree, pointer, value)
+        return tree
+
+    return merge_patch(tree, patch)
+
+
+def merge_patch(target: dict, patch: dict, path: str = "") -> dict:
+    for key, value in patch.items():
+        field_path = f"{path}/{key}"
+
+        if key not in target:
+            raise KeyError(f"Unknown field: {field_path}")
+        if value is None:
+            raise ValueError(f"Fields can't be removed from the typetree: {field_path}")
+
+        if isinstance(value, dict) and isinstance(target[key], dict):
+            merge_patch(target[key], value, field_path)
+        else:
+            target[key] = value
+
+    return target
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {pointer}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def get_by_pointer(tree: dict, pointer: str) -> Any:
+    node = tree
+    for part in parse_pointer(pointer):
+        node = _get_child(node, part, pointer)
+    return node
+
+
+def set_by_pointer(tree: dict, pointer: str, value: Any):
+    parts = parse_pointer(pointer)
+    parent: Union[dict, list] = tree
+
+    for part in parts[:-1]:
+        parent = _get_child(parent, part, pointer)
+
+    last = parts[-1]
+    if isinstance(parent, list):
+        if last == "-":
+            parent.append(value)
+            return
+        parent[_list_index(parent, last, pointer)] = value
+    elif isinstance(parent, dict):
+        if last not in parent:
+            raise KeyError(f"Unknown field: {pointer}")
+        parent[last] = value
+    else:
+        raise ValueError(f"Can't set a field of a {type(parent).__name__}: {pointer}")
+
+
+def _get_child(node: Union[dict, list], part: str, pointer: str) -> Any:
+    if isinstance(node, list):
+        return node[_list_index(node, part, pointer)]
+    if isinstance(node, dict) and part in node:
+        return node[part]
+    raise KeyError(f"Unknown field: {pointer}")
+
+
+def _list_index(node: list, part: str, pointer: str) -> int:
+    if not part.isdigit() or int(part) >= len(node):
+        raise IndexError(f"Invalid list index '{part}': {pointer}")
+    return int(part)
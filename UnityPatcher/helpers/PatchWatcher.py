@@ -0,0 +1,184 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Optional, Set, Tuple
+
+# inotify events (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+# changes are collected until the folder is quiet for this time,
+# so that a file is not imported while the editor is still saving it
+DEBOUNCE_SECONDS = 0.5
+POLL_INTERVAL = 1.0
+
+Changes = Tuple[Set[str], Set[str]]
+
+
+class PatchWatcher:
+    """
+    Waits for changes in the patch folder.
+    Uses inotify on Linux and polls file mtimes on other systems.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._fd: Optional[int] = None
+        self._watches: Dict[int, str] = {}
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+
+        if sys.platform.startswith("linux"):
+            try:
+                self._init_inotify()
+            except OSError as e:
+                logging.debug("inotify is not available, polling is used: %s", e)
+                self._fd = None
+
+        if self._fd is None:
+            self._snapshot = self._take_snapshot()
+
+    # ==== inotify ==== #
+
+    def _init_inotify(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+
+        for root, _, _ in os.walk(self.folder):
+            self._add_watch(root)
+
+    def _add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Can't watch {path}")
+        self._watches[wd] = path
+
+    def _read_events(self, changed: Set[str], removed: Set[str]):
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("[WARN] Too many changes at once, the whole patch folder is reimported")
+                changed.update(self._list_files(self.folder))
+                continue
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            folder = self._watches.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may appear before the watch is added
+                    self._add_watch(path)
+                    for root, _, _ in os.walk(path):
+                        if root != path:
+                            self._add_watch(root)
+                    changed.update(self._list_files(path))
+                elif mask & IN_MOVED_FROM:
+                    # the folder is watched by inode, so it would be reported at its old path
+                    for moved_wd, moved_path in list(self._watches.items()):
+                        if moved_path == path or moved_path.startswith(path + os.sep):
+                            self._libc.inotify_rm_watch(self._fd, moved_wd)
+                            self._watches.pop(moved_wd)
+                    removed.add(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE):
+                removed.discard(path)
+                changed.add(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changed.discard(path)
+                removed.add(path)
+
+    def _wait_inotify(self) -> Changes:
+        changed, removed = set(), set()
+
+        select.select([self._fd], [], [])
+        self._read_events(changed, removed)
+        while select.select([self._fd], [], [], DEBOUNCE_SECONDS)[0]:
+            self._read_events(changed, removed)
+
+        # a file can be created empty and written later
+        return {path for path in changed if os.path.isfile(path)}, removed
+
+    # ==== polling ==== #
+
+    @staticmethod
+    def _list_files(folder: str) -> Set[str]:
+        return {
+            os.path.join(root, file) for root, _, files in os.walk(folder) for file in files
+        }
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in self._list_files(self.folder):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _wait_polling(self) -> Changes:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            snapshot = self._take_snapshot()
+            if snapshot == self._snapshot:
+                continue
+
+            # wait until files stop changing
+            while True:
+                time.sleep(DEBOUNCE_SECONDS)
+                new_snapshot = self._take_snapshot()
+                if new_snapshot == snapshot:
+                    break
+                snapshot = new_snapshot
+
+            changed = {
+                path for path, state in snapshot.items() if self._snapshot.get(path) != state
+            }
+            removed = set(self._snapshot) - set(snapshot)
+            self._snapshot = snapshot
+            return changed, removed
+
+    # ==== ==== #
+
+    def wait_for_changes(self) -> Changes:
+        """
+        Blocks until something changes in the folder.
+        return: changed (created or modified) files, removed files and folders
+        """
+        if self._fd is not None:
+            return self._wait_inotify()
+        return self._wait_polling()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
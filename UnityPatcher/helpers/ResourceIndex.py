@@ -0,0 +1,113 @@
+import bisect
+import os
+import threading
+import weakref
+from typing import Callable, Dict, List, Tuple
+
+# object type -> stream field, source, offset and size keys
+STREAM_FIELDS = {
+    "AudioClip": ("m_Resource", "m_Source", "m_Offset", "m_Size"),
+    "VideoClip": ("m_ExternalResources", "m_Source", "m_Offset", "m_Size"),
+    "Texture2D": ("m_StreamData", "path", "offset", "size"),
+    "Cubemap": ("m_StreamData", "path", "offset", "size"),
+    "Texture2DArray": ("m_StreamData", "path", "offset", "size"),
+    "Texture3D": ("m_StreamData", "path", "offset", "size"),
+    "CubemapArray": ("m_StreamData", "path", "offset", "size"),
+    "Mesh": ("m_StreamData", "path", "offset", "size"),
+}
+RESOURCE_KEY_MAP = {"AudioClip": "m_Resource", "VideoClip": "m_ExternalResources"}
+# .resource files hold audio and video, .resS files textures and meshes
+RESOURCE_TYPES = {
+    ".resource": ("AudioClip", "VideoClip"),
+    ".resS": ("Texture2D", "Cubemap", "Texture2DArray", "Texture3D", "CubemapArray", "Mesh"),
+}
+
+_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+class ResourceIndex:
+    """
+    Resource ranges of the streamed objects of an assets file:
+    source -> [offset, size, path_id] sorted by offset.
+    Typetrees are read once, when the index is built.
+    """
+
+    def __init__(self, asset, types: Tuple[str, ...]):
+        self.asset = asset
+        self.lock = threading.Lock()
+        self.ranges: Dict[str, List[List[int]]] = {}
+        self.sources: Dict[int, str] = {}
+
+        for obj in asset.objects.values():
+            if obj.type.name not in types:
+                continue
+
+            stream_key, source_key, offset_key, size_key = STREAM_FIELDS[obj.type.name]
+            stream = obj.read_typetree().get(stream_key)
+            # textures of old versions and inline data aren't streamed
+            if stream and stream[source_key]:
+                self._insert(obj.path_id, stream[source_key], stream[offset_key], stream[size_key])
+
+    def _insert(self, path_id: int, source: str, offset: int, size: int):
+        bisect.insort(self.ranges.setdefault(source, []), [offset, size, path_id])
+        self.sources[path_id] = source
+
+    def _remove(self, path_id: int):
+        source = self.sources.pop(path_id, None)
+        if source is not None:
+            ranges = self.ranges[source]
+            ranges.remove(next(entry for entry in ranges if entry[2] == path_id))
+
+    def update(self, path_id: int, source: str, offset: int, size: int):
+        """Records the new location of the object data."""
+        with self.lock:
+            self._remove(path_id)
+            self._insert(path_id, source, offset, size)
+
+    def remap(self, resource_name: str, map_offset: Callable[[int], int]):
+        """Converts the offsets of all objects stored in the resource with map_offset."""
+        with self.lock:
+            for source, ranges in self.ranges.items():
+                if os.path.basename(source) != resource_name:
+                    continue
+                # map_offset keeps the order of non-overlapping ranges
+                for entry in ranges:
+                    new_offset = map_offset(entry[0])
+                    if new_offset != entry[0]:
+                        entry[0] = new_offset
+                        self.set_offset(entry[2], new_offset)
+
+    def set_offset(self, path_id: int, offset: int):
+        """Writes the new offset to the typetree of the object."""
+        obj = self.asset.objects[path_id]
+        typetree = obj.read_typetree()
+        stream_key, _, offset_key, _ = STREAM_FIELDS[obj.type.name]
+        typetree[stream_key][offset_key] = offset
+        obj.save_typetree(typetree)
+
+    def shift(self, source: str, offset: int, size_diff: int):
+        """Moves the data placed after offset in the resource by size_diff bytes."""
+        if not size_diff:
+            return
+
+        with self.lock:
+            ranges = self.ranges.get(source, [])
+            start = bisect.bisect_right(ranges, [offset, float("inf")])
+            for entry in ranges[start:]:
+                entry[0] += size_diff
+                self.set_offset(entry[2], entry[0])
+
+
+def get_resource_index(asset, resource_name: str) -> ResourceIndex:
+    """
+    return: the index of the objects of the assets file which can be stored
+    in the resource (built on the first call)
+    """
+    types = RESOURCE_TYPES.get(os.path.splitext(resource_name)[1], tuple(STREAM_FIELDS))
+    with _indexes_lock:
+        indexes = _indexes.setdefault(asset, {})
+        index = indexes.get(types)
+        if index is None:
+            index = indexes[types] = ResourceIndex(asset, types)
+        return index
@@ -1,14 +1,20 @@
 import logging
 import os
-from typing import Union
+import threading
+import weakref
+from typing import Dict, List, Optional, Union
 
 from UnityPy.enums import ClassIDType
+from UnityPy.files import SerializedFile
 from UnityPy.streams import EndianBinaryReader
 
 from core.Settings import Settings
+from helpers.ResourceIndex import RESOURCE_KEY_MAP, get_resource_index
+from helpers.ResourceStream import ResourceStream
 
-
-RESOURCE_KEY_MAP = {"AudioClip": "m_Resource", "VideoClip": "m_ExternalResources"}
+_stream_lock = threading.Lock()
+# environment -> (number of files, file name -> file path)
+_file_names: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
 
 class ResourcePacker:
@@ -76,40 +82,61 @@ class ResourcePacker:
             return
 
         resource_name, resource_data = self.get_or_create_resource()
-
-        file_data = (
-            resource_data.bytes.tobytes()
-            if isinstance(resource_data.bytes, memoryview)
-            else resource_data.bytes
-        )
         new_data = (
             self.obj.m_AudioData
             if self.obj.type == ClassIDType.AudioClip
             else self.obj.m_VideoData
         )
 
-        if self.append_mode:
-            # Добавление данных в конец
-            data_offset = len(file_data)
-            file_data += new_data
+        if not self.is_bundle_parent:
+            # the original resource isn't loaded: new data is spooled and
+            # replacements are written all at once while saving (finalize_resources)
+            stream = self.get_stream(resource_name)
+            if self.append_mode:
+                data_offset = stream.append(new_data)
+            else:
+                _, data_offset, original_size = self.typetree[self.resource_key].values()
+                stream.replace(data_offset, original_size, new_data)
         else:
-            # Подмена аудио/видео на оригинальной позиции
-            source_path, data_offset, original_size = self.typetree[
-                self.resource_key
-            ].values()
             file_data = (
-                file_data[:data_offset]
-                + new_data
-                + file_data[data_offset + original_size :]
+                resource_data.bytes.tobytes()
+                if isinstance(resource_data.bytes, memoryview)
+                else resource_data.bytes
             )
-            size_diff = len(new_data) - original_size
-            self.update_offsets(source_path, data_offset, size_diff)
 
-        new_resource = EndianBinaryReader(file_data, resource_data.endian)
-        self.update_resource(resource_name, new_resource)
-        
-        source = f"archive:/{resource_name.split(".")[0]}/{resource_name}" if self.is_bundle_parent else resource_name
+            if self.append_mode:
+                # Добавление данных в конец
+                data_offset = len(file_data)
+                file_data += new_data
+            else:
+                # Подмена аудио/видео на оригинальной позиции
+                source_path, data_offset, original_size = self.typetree[
+                    self.resource_key
+                ].values()
+                file_data = (
+                    file_data[:data_offset]
+                    + new_data
+                    + file_data[data_offset + original_size :]
+                )
+                size_diff = len(new_data) - original_size
+                self.update_offsets(source_path, data_offset, size_diff)
+
+            new_resource = EndianBinaryReader(file_data, resource_data.endian)
+            self.update_resource(resource_name, new_resource)
+
+        source = (
+            f"archive:/{resource_name.split('.')[0]}/{resource_name}"
+            if self.is_bundle_parent
+            else resource_name
+        )
         self.update_typetree(source=source, offset=data_offset, size=len(new_data))
+        get_resource_index(self.asset, resource_name).update(
+            self.obj.path_id, source, data_offset, len(new_data)
+        )
+
+    def get_stream(self, resource_name: str) -> ResourceStream:
+        file_path = self.find_file(resource_name)[0]
+        return _get_stream(self.env, file_path)
 
     def update_typetree(self, source: str = None, offset: int = None, size: int = None):
         if self.obj.type == ClassIDType.AudioClip:
@@ -144,16 +171,7 @@ class ResourcePacker:
             source_path: что должно быть написано в поле источник
             size_diff: разница в байтах между старым и новым размером данных
         """
-        for obj in self.asset.objects.values():
-            if obj.type.name in ["AudioClip", "VideoClip"]:
-                resource_key = RESOURCE_KEY_MAP[obj.type.name]
-                typetree = obj.read_typetree()
-                if (
-                    typetree[resource_key]["m_Offset"] > offset
-                    and typetree[resource_key]["m_Source"] == source
-                ):
-                    typetree[resource_key]["m_Offset"] += size_diff
-                    obj.save_typetree(typetree)
+        get_resource_index(self.asset, os.path.basename(source)).shift(source, offset, size_diff)
 
     def update_resource(self, res_name: str, new_res: EndianBinaryReader):
         file_path = self.find_file(res_name)[0]
@@ -169,6 +187,8 @@ class ResourcePacker:
         else:
             self.env.files[file_path] = new_res
             self.env.files[file_path].is_changed = True
+            # resource data of other objects is looked up by name
+            self.env.register_cab(os.path.basename(file_path), new_res)
 
     def find_file(self, res_name: str) -> tuple[str, object]:
         # .resource in bundle
@@ -176,8 +196,115 @@ class ResourcePacker:
             return res_name, self.asset.parent.files[res_name]
 
         # separate .resource file
-        for file_path, file_obj in self.env.files.items():
-            if os.path.basename(file_path) == res_name:
-                return file_path, file_obj
+        file_path = _get_file_names(self.env).get(res_name)
+        if file_path is None:
+            return None, None
+        return file_path, self.env.files[file_path]
+
+
+def _get_file_names(env) -> Dict[str, str]:
+    """return: file name -> path of the loaded files (rebuilt when files are added)"""
+    count, names = _file_names.get(env, (None, None))
+    if count != len(env.files):
+        names = {}
+        for file_path in env.files:
+            names.setdefault(os.path.basename(file_path), file_path)
+        _file_names[env] = (len(env.files), names)
+    return names
+
+
+def _get_stream(env, file_path: str) -> ResourceStream:
+    """return: the loaded resource wrapped as ResourceStream (an empty one if it isn't loaded)"""
+    with _stream_lock:
+        resource_data = env.files.get(file_path)
+        if isinstance(resource_data, ResourceStream):
+            return resource_data
+
+        if resource_data is None:
+            resource_data = (
+                EndianBinaryReader(open(file_path, "rb"))
+                if os.path.isfile(file_path)
+                else EndianBinaryReader(b"")
+            )
+
+        stream = ResourceStream(resource_data, file_path)
+        env.files[file_path] = stream
+        # resource data of other objects is looked up by name
+        env.register_cab(os.path.basename(file_path), stream)
+        return stream
+
+
+def pack_stream_data(obj, stream_data: dict, data: bytes) -> Optional[dict]:
+    """
+    Writes the texture data to the .resS file of the assets file,
+    like the game stores it: the old range is replaced in place
+    (or the data is appended in --res_append mode and for new textures).
+
+    Arguments:
+        obj: the texture object
+        stream_data: the current m_StreamData of the object
+        data: the new image data
+
+    return: the new m_StreamData or None if the data can't be streamed
+    (files inside bundles and versions without m_StreamData)
+    """
+    asset = obj.assets_file
+    env = asset.environment
+    assets_path = _get_file_names(env).get(asset.name)
+    if stream_data is None or assets_path is None or env.files[assets_path] is not asset:
+        return None
+
+    resource_name = (
+        os.path.basename(stream_data["path"])
+        if stream_data["path"] and not stream_data["path"].startswith("archive:")
+        else f"{asset.name}.resS"
+    )
+    stream = _get_stream(env, os.path.join(os.path.dirname(assets_path), resource_name))
+    offset, size = stream_data["offset"], stream_data["size"]
+
+    if (
+        not Settings.resource_append_mode
+        and os.path.basename(stream_data["path"]) == resource_name
+        and size
+        and offset + size <= stream.original_length
+    ):
+        # the following data is moved by finalize_resources
+        stream.replace(offset, size, data)
+    else:
+        offset = stream.append(data)
+
+    get_resource_index(asset, resource_name).update(obj.path_id, resource_name, offset, len(data))
+    return {"offset": offset, "size": len(data), "path": resource_name}
+
+
+def finalize_resources(env):
+    """
+    Fixes the offsets of the clips and textures placed after the pending
+    replacements of the resources (one pass over the index per assets file).
+    The replacements themselves are written while saving the resources.
+    """
+    for file_path, file in list(env.files.items()):
+        if not isinstance(file, ResourceStream) or not file.has_replacements:
+            continue
+
+        map_offset = file.get_offset_mapper()
+        resource_name = os.path.basename(file_path)
+
+        for asset in _get_referencing_files(env, file_path):
+            get_resource_index(asset, resource_name).remap(resource_name, map_offset)
+
+        file.commit_offsets()
+
 
-        return None, None
+def _get_referencing_files(env, resource_path: str) -> List[SerializedFile]:
+    """
+    return: the loaded assets files which can refer to the resource
+    (sources are relative to the folder of the assets file)
+    """
+    folder = os.path.dirname(os.path.abspath(resource_path))
+    return [
+        file
+        for file_path, file in env.files.items()
+        if isinstance(file, SerializedFile)
+        and os.path.dirname(os.path.abspath(file_path)) == folder
+    ]
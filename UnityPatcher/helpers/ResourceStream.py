@@ -0,0 +1,263 @@
+import bisect
+import os
+import shutil
+import tempfile
+import threading
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from UnityPy.streams import EndianBinaryReader
+
+from core.Settings import Settings
+
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+class ResourceStream:
+    """
+    A .resource/.resS file with pending changes: appended data and replaced ranges.
+
+    The original file is only read through its loaded reader, new data is
+    spooled to temporary files. It replaces the reader in env.files, so the
+    new data can be read back like from the original file.
+
+    Offsets are given in the coordinates of the original file. Replacements
+    are applied while saving: save() writes the new file in a single pass and
+    get_offset_mapper() converts the old offsets to the new ones. Once the objects
+    point to the new offsets (commit_offsets), the stream continues from the
+    saved file (saved_to) or, if it wasn't saved in full, rebuilds itself
+    on the next access.
+    """
+
+    def __init__(self, source: EndianBinaryReader, path: str):
+        self.source = source
+        # the source was opened by the stream (rebuild, append_to), not loaded by UnityPy
+        self._source_opened = False
+        # the saved file the stream continues from (reopened after release_source)
+        self._source_path = None
+        self.path = path
+        self.endian = source.endian
+        self.original_length = source.Length
+        self.Position = 0
+        self.is_changed = True
+
+        os.makedirs(Settings.temp_path, exist_ok=True)
+        self._spool = tempfile.TemporaryFile(dir=Settings.temp_path)
+        self._spool_length = 0
+        self._replacement_spool = tempfile.TemporaryFile(dir=Settings.temp_path)
+        self._replacement_spool_length = 0
+        # original offset -> (original size, position in the replacement spool, new size)
+        self._replacements: Dict[int, Tuple[int, int, int]] = {}
+        # the objects point to the offsets after the replacements
+        self._offsets_committed = False
+        self._lock = threading.Lock()
+
+    @property
+    def Length(self) -> int:
+        return self.original_length + self._spool_length
+
+    @property
+    def bytes(self) -> bytes:
+        """The whole content without pending replacements (loads it into memory)."""
+        self.Position = 0
+        return self.read_bytes(self.Length)
+
+    @property
+    def has_replacements(self) -> bool:
+        return bool(self._replacements)
+
+    def append(self, data: bytes) -> int:
+        """return: offset of the data in the resource"""
+        with self._lock:
+            self._apply_committed()
+            offset = self.Length
+            self._spool.seek(self._spool_length)
+            self._spool.write(data)
+            self._spool_length += len(data)
+            return offset
+
+    def replace(self, offset: int, size: int, data: bytes):
+        """Replaces size bytes at offset. The data is written on save()."""
+        with self._lock:
+            self._apply_committed()
+            if offset + size > self.original_length:
+                raise ValueError(f"Range {offset}-{offset + size} is out of {self.path}")
+
+            # the same data can be replaced several times, the original size is kept
+            original_size = self._replacements.get(offset, (size,))[0]
+
+            self._replacement_spool.seek(self._replacement_spool_length)
+            self._replacement_spool.write(data)
+            self._replacements[offset] = (original_size, self._replacement_spool_length, len(data))
+            self._replacement_spool_length += len(data)
+
+    def read_bytes(self, size: int) -> bytes:
+        with self._lock:
+            self._apply_committed()
+            start = self.Position
+
+            # replaced data is read from the start of the range (like a clip reads it)
+            if start in self._replacements:
+                _, position, new_size = self._replacements[start]
+                self._replacement_spool.seek(position)
+                self.Position = start + min(size, new_size)
+                return self._replacement_spool.read(min(size, new_size))
+
+            end = min(start + size, self.Length)
+            chunks = []
+
+            if start < self.original_length:
+                source = self._get_source()
+                source.Position = start
+                chunks.append(source.read_bytes(min(end, self.original_length) - start))
+            if end > self.original_length:
+                self._spool.seek(max(start - self.original_length, 0))
+                chunks.append(self._spool.read(end - max(start, self.original_length)))
+
+            self.Position = end
+            return b"".join(chunks)
+
+    def _sorted_replacements(self) -> Tuple[List[int], List[int]]:
+        """return: sorted original offsets and the total size change before each of them"""
+        offsets = sorted(self._replacements)
+        diffs = [self._replacements[offset][2] - self._replacements[offset][0] for offset in offsets]
+        return offsets, [0, *accumulate(diffs)]
+
+    def get_offset_mapper(self):
+        """return: function converting an original offset to the offset in the saved file"""
+        offsets, shifts = self._sorted_replacements()
+
+        def map_offset(offset: int) -> int:
+            # replacements starting before the offset move it
+            return offset + shifts[bisect.bisect_left(offsets, offset)]
+
+        return map_offset
+
+    def commit_offsets(self):
+        """
+        Marks the offsets of the objects as converted with get_offset_mapper():
+        the replacements are fixed until the resource is saved or rebuilt.
+        """
+        with self._lock:
+            self._offsets_committed = bool(self._replacements)
+
+    def _apply_committed(self):
+        # the resource wasn't saved in full after the offsets were converted
+        if self._offsets_committed:
+            self._rebuild()
+
+    def _get_source(self) -> EndianBinaryReader:
+        if self.source is None:
+            self.source = EndianBinaryReader(open(self._source_path, "rb"), self.endian)
+        return self.source
+
+    def _copy_source(self, f, start: int, end: int):
+        source = self._get_source()
+        position = start
+        while position < end:
+            source.Position = position
+            chunk = source.read_bytes(min(COPY_CHUNK_SIZE, end - position))
+            if not chunk:
+                raise IOError(
+                    f"Unexpected end of {self.path} at {position} (expected {end} bytes)"
+                )
+            f.write(chunk)
+            position += len(chunk)
+
+    def _copy_spool(self, spool, f, position: int = 0, size: int = None):
+        spool.seek(position)
+        if size is None:
+            shutil.copyfileobj(spool, f, COPY_CHUNK_SIZE)
+            return
+
+        while size > 0:
+            chunk = spool.read(min(COPY_CHUNK_SIZE, size))
+            f.write(chunk)
+            size -= len(chunk)
+
+    def _write(self, f):
+        position = 0
+        for offset in sorted(self._replacements):
+            original_size, spool_position, new_size = self._replacements[offset]
+            self._copy_source(f, position, offset)
+            self._copy_spool(self._replacement_spool, f, spool_position, new_size)
+            position = offset + original_size
+
+        self._copy_source(f, position, self.original_length)
+        self._copy_spool(self._spool, f)
+
+    def rebuild(self):
+        """
+        Writes the resource with all replacements to a temporary file and continues
+        from it, so the offsets are in the coordinates of the new file after that.
+        """
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        if not self._replacements:
+            return
+
+        stream = tempfile.TemporaryFile(dir=Settings.temp_path)
+        self._write(stream)
+        stream.flush()
+        self._set_source(EndianBinaryReader(stream, self.endian))
+
+    def save(self, f):
+        """Writes the whole resource with the replacements to the file object chunk by chunk."""
+        with self._lock:
+            self._write(f)
+
+    def saved_to(self, path: str):
+        """Continues from the file written by save(): its offsets are the new ones."""
+        with self._lock:
+            self._set_source(None, path)
+
+    def release_source(self):
+        """Closes the saved file the stream reads from, so it can be replaced (reopened on demand)."""
+        with self._lock:
+            if self._source_path is not None:
+                self._close_source()
+
+    def can_append_to(self, path: str) -> bool:
+        """
+        Whether the file at path is the unchanged original, so new data can be appended to it.
+        Files with several hardlinks (e.g. backups made by older versions) aren't written in place.
+        """
+        return (
+            not self._replacements
+            and os.path.isfile(path)
+            and os.path.abspath(path) == os.path.abspath(self.path)
+            and os.path.getsize(path) == self.original_length
+            and os.stat(path).st_nlink == 1
+        )
+
+    def append_to(self, path: str):
+        """Appends only the new data to the original file."""
+        with self._lock:
+            with open(path, "ab") as f:
+                self._copy_spool(self._spool, f)
+
+            # the data is in the original file now: continue reading from it
+            # (the loaded reader only knows the old length)
+            self._set_source(None, path)
+
+    def _set_source(self, source: EndianBinaryReader, path: str = None):
+        """Continues from the new content: the source stream or the file at path."""
+        self._close_source()
+        self.source = source
+        self._source_path = path
+        self._source_opened = True
+        self.original_length = self._get_source().Length
+        self._replacements = {}
+        self._offsets_committed = False
+        for spool in (self._spool, self._replacement_spool):
+            spool.seek(0)
+            spool.truncate()
+        self._spool_length = self._replacement_spool_length = 0
+
+    def _close_source(self):
+        """Closes the source if it was opened by the stream itself."""
+        if self._source_opened and self.source is not None:
+            self.source.dispose()
+            self.source = None
@@ -1,135 +1,471 @@
-import copy
 import hashlib
-import json
 import logging
 import os
+import sqlite3
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List
+from typing import BinaryIO, Callable, Dict, List, Optional, Set, Tuple
 from UnityPy.files import BundleFile, WebFile
 
-from core.PatchFile import PatchData
+from core.PatchFile import PatchData, PatchFile
+from helpers.DeltaPatcher import DELTA_EXTENSION
+from utils import run_multithread
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# the store is kept beside the output folder: <output folder>.hashes.sqlite
+HASH_STORE_SUFFIX = ".hashes.sqlite"
+# stored hashes are prefixed with the algorithm, so they're recalculated
+# when a faster one becomes available
+HASH_ALGORITHM = "xxh3_128" if xxhash else "blake3" if blake3 else "blake2b"
+
+# stores of other versions are recreated
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    source_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS output_assets (
+    output TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    PRIMARY KEY (output, asset)
+);
+CREATE TABLE IF NOT EXISTS output_patches (
+    output TEXT NOT NULL,
+    patch TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (output, patch)
+);
+"""
 
 
 class PatchType(Enum):
     Patch = "PATCH"
 
 
+@dataclass
+class OutputRecord:
+    """Output file as it was saved: hashes of the file and of what it was built from."""
+
+    hash: str
+    # hash of the game file it was built from (None if saved to the game folder)
+    source_hash: Optional[str] = None
+    # patch file -> hash
+    patches: Dict[str, str] = field(default_factory=dict)
+    # names of the assets files inside it (patches are matched by them)
+    assets: Set[str] = field(default_factory=set)
+
+
+def _new_hasher():
+    if xxhash:
+        return xxhash.xxh3_128()
+    if blake3:
+        return blake3.blake3()
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_stream(f: BinaryIO) -> str:
+    hasher = _new_hasher()
+    while chunk := f.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+
+class HashingWriter:
+    """Hashes the data written to the file, so it doesn't have to be read back."""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.hasher = _new_hasher()
+
+    def write(self, data) -> int:
+        self.hasher.update(data)
+        return self.f.write(data)
+
+    @property
+    def hash(self) -> str:
+        return f"{HASH_ALGORITHM}:{self.hasher.hexdigest()}"
+
+
 def calculate_hash(file_path: str) -> str:
     with open(file_path, "rb") as f:
-        return hashlib.sha256(f.read()).hexdigest()
+        return hash_stream(f)
+
+
+def calculate_patch_hash(patch_file: PatchFile) -> str:
+    # patch files may be stored in an archive, so they are read via PatchFile
+    with patch_file.open() as f:
+        return hash_stream(f)
+
+
+def get_store_path(output_folder: str) -> str:
+    output_folder = os.path.normpath(os.path.abspath(output_folder))
+    return output_folder + HASH_STORE_SUFFIX
+
+
+def _stat(path: str) -> Tuple[int, int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class HashStore:
+    """
+    Hashes of the output files and of the patches imported into them.
+
+    Hashes of all files are cached with their size, mtime and inode, so
+    unchanged files aren't read again.
+    """
+
+    def __init__(self, output_folder: str):
+        self.output_folder = output_folder
+        self.path = get_store_path(output_folder)
+        self.connection = sqlite3.connect(self.path)
+
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            tables = self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall()
+            with self.connection:
+                for (table,) in tables:
+                    self.connection.execute(f"DROP TABLE {table}")
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "HashStore":
+        return self
+
+    def __exit__(self, *args):
+        self.connection.close()
+
+    def hash_files(
+        self, files: Dict[str, Tuple[str, Callable[[], BinaryIO]]]
+    ) -> Dict[str, Optional[str]]:
+        """
+        Arguments:
+            files: key -> (path to stat, function opening the file)
+
+        return: key -> hash (None if the file doesn't exist)
+        """
+        hashes: Dict[str, Optional[str]] = {}
+        stats: Dict[str, Tuple[int, int, int]] = {}
+
+        for key, (stat_path, _) in files.items():
+            try:
+                stats[key] = _stat(stat_path)
+            except OSError:
+                hashes[key] = None
+                continue
+
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?", (key,)
+            ).fetchone()
+            if row and tuple(row[:3]) == stats[key] and row[3].startswith(f"{HASH_ALGORITHM}:"):
+                hashes[key] = row[3]
+
+        def worker(key: str):
+            with files[key][1]() as f:
+                hashes[key] = hash_stream(f)
+
+        changed = [key for key in files if key not in hashes]
+        run_multithread(worker, changed, cost=lambda key: stats[key][0], name="Hashing")
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                [(key, *stats[key], hashes[key]) for key in changed],
+            )
+        return hashes
+
+    def record_hashes(self, hashes: Dict[str, str]):
+        """Caches hashes calculated elsewhere (e.g. while the files were written)."""
+        rows = []
+        for path, file_hash in hashes.items():
+            try:
+                rows.append((path, *_stat(path), file_hash))
+            except OSError:
+                continue
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+    def hash_folder_files(self, folder: str, paths: List[str]) -> Dict[str, Optional[str]]:
+        """paths: paths relative to the folder"""
+        def opener(full_path: str):
+            return lambda: open(full_path, "rb")
 
+        files = {}
+        for path in paths:
+            full_path = os.path.join(folder, path)
+            files[full_path] = (full_path, opener(full_path))
+        hashes = self.hash_files(files)
+        return {path: hashes[os.path.join(folder, path)] for path in paths}
 
-def save_hashes(hashes: dict) -> None:
-    with open("hash_data.json", "w") as f:
-        json.dump(hashes, f, indent=2)
+    def hash_patches(self, patch_files: List[PatchFile]) -> Dict[str, Optional[str]]:
+        return self.hash_files(
+            {patch_file.path: (patch_file.stat_path, patch_file.open) for patch_file in patch_files}
+        )
 
+    def get_outputs(self) -> Dict[str, OutputRecord]:
+        """return: output file (relative to the output folder) -> its record"""
+        outputs = {
+            path: OutputRecord(output_hash, source_hash)
+            for path, output_hash, source_hash in self.connection.execute(
+                "SELECT path, hash, source_hash FROM outputs"
+            )
+        }
+        for output, patch, patch_hash in self.connection.execute(
+            "SELECT output, patch, hash FROM output_patches"
+        ):
+            if output in outputs:
+                outputs[output].patches[patch] = patch_hash
+        for output, asset in self.connection.execute("SELECT output, asset FROM output_assets"):
+            if output in outputs:
+                outputs[output].assets.add(asset)
+        return outputs
+
+    def _delete(self, tables: Dict[str, str], paths: List[str]):
+        for table, column in tables.items():
+            self.connection.executemany(
+                f"DELETE FROM {table} WHERE {column} = ?", [(path,) for path in paths]
+            )
+
+    def remove_outputs(self, paths: List[str]):
+        with self.connection:
+            self._delete(
+                {"outputs": "path", "output_patches": "output", "output_assets": "output"}, paths
+            )
+
+    def clear_patches(self, paths: List[str]):
+        with self.connection:
+            self._delete({"output_patches": "output"}, paths)
+
+    def update_outputs(self, outputs: Dict[str, OutputRecord], replace: bool):
+        """
+        replace: forget the patches of the previous runs
+        (the outputs were built from the game files again)
+        """
+        with self.connection:
+            if replace:
+                self._delete({"output_patches": "output"}, list(outputs))
+            self._delete({"output_assets": "output"}, list(outputs))
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)",
+                [(path, record.hash, record.source_hash) for path, record in outputs.items()],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO output_patches VALUES (?, ?, ?)",
+                [
+                    (path, patch_path, patch_hash)
+                    for path, record in outputs.items()
+                    for patch_path, patch_hash in record.patches.items()
+                ],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO output_assets VALUES (?, ?)",
+                [(path, asset) for path, record in outputs.items() for asset in record.assets],
+            )
 
-def load_hashes() -> dict:
-    file_path = "hash_data.json"
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            return json.load(f)
-    return {}
 
 # ==== Patch ==== #
 
+def _is_same_folder(input_folder: str, output_folder: str) -> bool:
+    return os.path.abspath(input_folder) == os.path.abspath(output_folder)
+
+
+def _hash_sources(store: HashStore, folder: str, outputs: List[str]) -> Dict[str, Optional[str]]:
+    """return: output path -> hash of the game file it was saved from (deltas are <file>.delta)"""
+    def source_path(output_path: str) -> str:
+        if output_path.endswith(DELTA_EXTENSION):
+            return output_path[: -len(DELTA_EXTENSION)]
+        return output_path
+
+    hashes = store.hash_folder_files(folder, list({source_path(path) for path in outputs}))
+    return {path: hashes[source_path(path)] for path in outputs}
+
+
 def filter_patches(
     input_folder: str, output_folder: str, patch_data: PatchData
 ) -> PatchData:
     """
-    Filters PatchData based on hashes. If at least one hash does not match, 
-    the original patch_data is returned for a complete overwrite.
+    Filters PatchData based on hashes, per output file.
+
+    When saving to another folder, an output file is built again (from the game
+    file, with all of its patches) if the game file, the output file or its set
+    of patches has changed since it was saved. Patches of the other output files
+    are removed, so these files stay on disk as they are.
+
+    When saving to the game folder, the patched file is the base of the next
+    run, so only the patches that haven't changed are removed (all patches
+    are kept if the file was changed by something else).
     """
-    hashes = load_hashes()
-    if not hashes:
+    if not os.path.exists(get_store_path(output_folder)):
         return patch_data
 
-    root_key = PatchType.Patch.value
-    new_hashes = copy.deepcopy(hashes)
-    new_patch_data = copy.deepcopy(patch_data)
+    same_folder = _is_same_folder(input_folder, output_folder)
 
-    for assets_file, value in hashes.get(root_key, {}).items():
-        if not assets_file.startswith(output_folder):
-            continue
+    with HashStore(output_folder) as store:
+        outputs = store.get_outputs()
+        if not outputs:
+            return patch_data
 
-        if not os.path.exists(assets_file):
-            del new_hashes[root_key][assets_file]
-            continue
+        current_patches = {patch_file.path: patch_file for patch_file in patch_data.patches}
+        recorded_patches = {
+            patch_path: current_patches[patch_path]
+            for record in outputs.values()
+            for patch_path in record.patches
+            if patch_path in current_patches
+        }
 
-        # Check assets file hash
-        if calculate_hash(assets_file) != value["hash"]:
-            new_hashes[root_key][assets_file]["patch_files"] = {}
-            continue
+        # all files are hashed at once (in parallel)
+        output_hashes = store.hash_folder_files(output_folder, list(outputs))
+        source_hashes = (
+            {} if same_folder else _hash_sources(store, input_folder, list(outputs))
+        )
+        patch_hashes = store.hash_patches(list(recorded_patches.values()))
 
-        # Checking file hashes in the patch_files dictionary
-        for patch_path, patch_hash in value.get("patch_files", {}).items():
-            if not os.path.exists(patch_path):
-                continue
+        missing = [path for path, output_hash in output_hashes.items() if output_hash is None]
+        store.remove_outputs(missing)
+        outputs = {path: record for path, record in outputs.items() if path not in missing}
+
+        if same_folder:
+            changed = [path for path, record in outputs.items() if output_hashes[path] != record.hash]
+            store.clear_patches(changed)
+
+            unchanged_patches = {
+                patch_path
+                for path, record in outputs.items()
+                if path not in changed
+                for patch_path, patch_hash in record.patches.items()
+                if patch_hashes.get(patch_path) == patch_hash
+            }
+            return PatchData(
+                [patch_file for patch_file in patch_data.patches if patch_file.path not in unchanged_patches]
+            )
+
+        # assets file name -> current patches
+        asset_patches: Dict[str, Set[str]] = {}
+        for patch_file in patch_data.patches:
+            asset_patches.setdefault(patch_file.source_file, set()).add(patch_file.path)
+
+        def is_up_to_date(path: str, record: OutputRecord) -> bool:
+            current = set().union(*(asset_patches.get(asset, ()) for asset in record.assets))
+            return (
+                output_hashes[path] == record.hash
+                and source_hashes[path] == record.source_hash
+                and current == set(record.patches)
+                and all(patch_hashes[p] == patch_hash for p, patch_hash in record.patches.items())
+            )
+
+        up_to_date: Set[str] = set()
+        rebuilt: Set[str] = set()
+        for path, record in outputs.items():
+            (up_to_date if is_up_to_date(path, record) else rebuilt).add(path)
+
+        # an assets file name may be shared by several outputs, so their
+        # patches are kept if any of them has to be rebuilt
+        rebuilt_assets = {asset for path in rebuilt for asset in outputs[path].assets}
+        skipped_assets = {
+            asset for path in up_to_date for asset in outputs[path].assets
+        } - rebuilt_assets
 
-            if calculate_hash(patch_path) == patch_hash:
-                new_patch_data.remove_by_path(patch_path)
-            # If at least one hash does not match, we return the original data
-            elif input_folder != output_folder:
-                return patch_data
+    logging.info(
+        "[INF] Smart mode: %d up-to-date files, %d files to rebuild", len(up_to_date), len(rebuilt)
+    )
+    for path in sorted(rebuilt):
+        logging.info(" - %s", path)
 
-    save_hashes(new_hashes)
-    return new_patch_data
+    return PatchData(
+        [patch_file for patch_file in patch_data.patches if patch_file.source_file not in skipped_assets]
+    )
 
 
-def update_hash_data(game_loader, imported_patches: PatchData):
+def update_hash_data(game_loader, imported_patches: PatchData, output_folder: str):
     """
     Updates hash data for all modified files and their patches.
     """
-    def get_root_folder(path: str) -> str:
-        return os.path.normpath(path).split(os.sep)[0]
+    # full files and deltas (<file>.delta) are recorded as separate outputs
+    saved_files = {
+        os.path.normpath(path) for path in game_loader.patched_files + game_loader.delta_files
+    }
+    if not imported_patches or not saved_files:
+        return
 
-    def merge_patch_files(
-        old_patches: Dict[str, str], new_patches: Dict[str, str]
-    ) -> Dict[str, str]:
-        merged = old_patches.copy()
-        merged.update(new_patches)
-        return merged
+    # output file -> patch files imported into it
+    output_patches: Dict[str, Dict[str, PatchFile]] = {}
+    output_assets: Dict[str, Set[str]] = {}
 
-    def process_env_file(filename: str, file, hash_data: dict):
+    def process_env_file(filename: str, file):
         if not hasattr(file, "objects"):
             return
 
         archive_path = os.path.relpath(filename, game_loader.game_folder)
-        modified_file = os.path.join(get_root_folder(patched_files[0]), archive_path)
-
-        if modified_file not in patched_files:
+        output_paths = [
+            output_path
+            for output_path in (archive_path, archive_path + DELTA_EXTENSION)
+            if os.path.normpath(os.path.join(output_folder, output_path)) in saved_files
+        ]
+        if not output_paths:
             return
 
-        patch_files = {
-            patch_file.path: calculate_hash(patch_file.path)
-            for obj in file.objects.values()
-            if (patch := imported_patches.get_patch(obj.assets_file.name, obj.path_id))
-            for patch_file in patch.patches
-        }
-
-        root_key = PatchType.Patch.value
-
-        if modified_file in hash_data.get(root_key, {}):
-            patch_files = merge_patch_files(
-                hash_data[root_key][modified_file]["patch_files"], patch_files
-            )
+        patch_files = {}
+        for obj in file.objects.values():
+            patch = imported_patches.get_patch(obj.assets_file.name, obj.path_id)
+            if patch:
+                patch_files.update((patch_file.path, patch_file) for patch_file in patch.patches)
 
-        hash_data.setdefault(root_key, {})
-        hash_data[root_key][modified_file] = {
-            "hash": calculate_hash(modified_file),
-            "patch_files": patch_files,
-        }
-
-    hashes = load_hashes()
-    patched_files = game_loader.patched_files
-    if not imported_patches or not patched_files:
-        return
+        for output_path in output_paths:
+            output_assets.setdefault(output_path, set()).add(file.name)
+            output_patches.setdefault(output_path, {}).update(patch_files)
 
     for name, file in game_loader.env.files.items():
         if isinstance(file, (BundleFile, WebFile)):
             for inner_file in file.files.values():
-                process_env_file(name, inner_file, hashes)
+                process_env_file(name, inner_file)
         else:
-            process_env_file(name, file, hashes)
+            process_env_file(name, file)
+
+    same_folder = _is_same_folder(game_loader.game_folder, output_folder)
 
-    save_hashes(hashes)
+    with HashStore(output_folder) as store:
+        # saved files were hashed while they were written
+        store.record_hashes(game_loader.output_hashes)
+        paths = list(output_patches)
+        output_hashes = store.hash_folder_files(output_folder, paths)
+        source_hashes = (
+            {} if same_folder else _hash_sources(store, game_loader.game_folder, paths)
+        )
+        patch_hashes = store.hash_patches(
+            [patch_file for patches in output_patches.values() for patch_file in patches.values()]
+        )
+        store.update_outputs(
+            {
+                path: OutputRecord(
+                    output_hashes[path],
+                    source_hashes.get(path),
+                    {patch_path: patch_hashes[patch_path] for patch_path in patches},
+                    output_assets[path],
+                )
+                for path, patches in output_patches.items()
+                if output_hashes[path] is not None
+            },
+            replace=not same_folder,
+        )
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import List, Optional
+
+from . import DeltaPatcher
+
+JOURNAL_FOLDER = "JOURNAL"
+MANIFEST_NAME = "journal.json"
+# delta of a file that is being replaced (until UndoJournal.confirm)
+PENDING_EXTENSION = ".pending"
+
+
+class UndoJournal:
+    """
+    Restore point of a single packing into the game folder.
+
+    Instead of full copies, for each overwritten file the journal keeps a delta
+    from the new file back to the original one, so restoring costs only the
+    size of the changes. Files that didn't exist before are simply deleted.
+    """
+
+    def __init__(self, game_folder: str, root: str = JOURNAL_FOLDER):
+        self.game_folder = os.path.abspath(game_folder)
+        self.root = root
+        self.journal_id = self._new_id(root)
+        self.folder = os.path.join(root, self.journal_id)
+        self.entries = {}
+
+    @staticmethod
+    def _new_id(root: str) -> str:
+        base_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+        journal_id, index = base_id, 1
+        while os.path.exists(os.path.join(root, journal_id)):
+            journal_id = f"{base_id}-{index}"
+            index += 1
+        return journal_id
+
+    def record(self, original_path: str, new_path: str, archive_path: str):
+        """
+        Remembers how to get original_path back from new_path.
+        Must be called before the new file replaces the original one: the entry
+        is written to the manifest first, so an interrupted saving can still be
+        restored. Call confirm() after the replacement or discard() if it failed.
+        """
+        entry = self.entries.get(archive_path)
+
+        if entry and entry["action"] == "delete":
+            return
+
+        if not entry and not os.path.isfile(original_path):
+            self.entries[archive_path] = {"path": archive_path, "action": "delete", "pending": True}
+            self._save()
+            return
+
+        delta_name = archive_path + DeltaPatcher.DELTA_EXTENSION
+        delta_path = os.path.join(self.folder, delta_name)
+        pending_path = delta_path + PENDING_EXTENSION
+        os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+
+        if entry:
+            # the file was already replaced during this journal:
+            # rebuild the real original first and diff against it
+            temp_original = delta_path + ".orig"
+            DeltaPatcher.apply_delta(original_path, delta_path, temp_original)
+            try:
+                stats = DeltaPatcher.create_delta(new_path, temp_original, pending_path)
+            finally:
+                os.remove(temp_original)
+        else:
+            stats = DeltaPatcher.create_delta(new_path, original_path, pending_path)
+        _fsync(pending_path)
+
+        self.entries[archive_path] = {
+            "path": archive_path,
+            "action": "delta",
+            "delta": delta_name,
+            "size": stats["delta_size"],
+            "pending": True,
+        }
+        if entry:
+            self.entries[archive_path]["previous"] = entry
+        self._save()
+
+    def confirm(self, archive_path: str):
+        """The file recorded by record() was replaced."""
+        entry = self.entries.get(archive_path)
+        if not entry or not entry.get("pending"):
+            return
+
+        if entry["action"] == "delta":
+            delta_path = os.path.join(self.folder, entry["delta"])
+            os.replace(delta_path + PENDING_EXTENSION, delta_path)
+        del entry["pending"]
+        entry.pop("previous", None)
+        self._save()
+
+    def discard(self, archive_path: str):
+        """The file recorded by record() wasn't replaced."""
+        entry = self.entries.get(archive_path)
+        if not entry or not entry.get("pending"):
+            return
+
+        if entry["action"] == "delta":
+            pending_path = os.path.join(self.folder, entry["delta"]) + PENDING_EXTENSION
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+
+        previous = entry.get("previous")
+        if previous:
+            self.entries[archive_path] = previous
+        else:
+            del self.entries[archive_path]
+        self._save()
+
+    def _save(self):
+        manifest = {
+            "id": self.journal_id,
+            "game_folder": self.game_folder,
+            "entries": list(self.entries.values()),
+        }
+        _save_manifest(self.folder, manifest)
+
+    def commit(self):
+        if not self.entries:
+            if os.path.isdir(self.folder):
+                shutil.rmtree(self.folder)
+            return
+
+        size = sum(entry.get("size", 0) for entry in self.entries.values())
+        logging.info(
+            "[INF] Restore point %s created (%.2f MB)", self.journal_id, size / 1024 / 1024
+        )
+
+
+def _fsync(path: str):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def _save_manifest(folder: str, manifest: dict):
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    temp_path = manifest_path + "_new"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, manifest_path)
+
+
+def _id_key(journal_id: str):
+    """Journal ids are compared by their numbers: ...-2 goes before ...-10."""
+    return [int(part) if part.isdigit() else 0 for part in journal_id.split("-")]
+
+
+def _restore_delta(file_path: str, folder: str, entry: dict):
+    if not entry.get("pending"):
+        DeltaPatcher.apply_delta(file_path, os.path.join(folder, entry["delta"]), file_path)
+        return
+
+    # saving was interrupted: the file is either replaced (the pending delta
+    # or, if it was already confirmed, the delta itself applies) or not
+    delta_path = os.path.join(folder, entry["delta"])
+    for path in (delta_path + PENDING_EXTENSION, delta_path):
+        if not os.path.isfile(path):
+            continue
+        try:
+            DeltaPatcher.apply_delta(file_path, path, file_path)
+            return
+        except ValueError:
+            continue
+
+    if entry.get("previous"):
+        raise ValueError("The file doesn't match any delta of the restore point")
+    # the file wasn't replaced yet, it's still the original
+    logging.info("[INF] %s wasn't changed", entry["path"])
+
+
+def list_journals(game_folder: str, root: str = JOURNAL_FOLDER) -> List[dict]:
+    """Returns manifests of the game folder journals, from oldest to newest."""
+    if not os.path.isdir(root):
+        return []
+
+    game_folder = os.path.abspath(game_folder)
+    journals = []
+
+    for journal_id in sorted(os.listdir(root), key=_id_key):
+        manifest_path = os.path.join(root, journal_id, MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            continue
+
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if os.path.normcase(manifest.get("game_folder", "")) == os.path.normcase(game_folder):
+            journals.append(manifest)
+
+    return journals
+
+
+def restore(game_folder: str, journal_id: Optional[str] = None, root: str = JOURNAL_FOLDER) -> bool:
+    """
+    Rolls the game folder back to the state before the journal_id packing
+    (all later packings are undone too). If journal_id is not specified,
+    only the last packing is undone.
+    """
+    journals = list_journals(game_folder, root)
+    if not journals:
+        logging.warning("[WARN] No restore points found for %s", game_folder)
+        return False
+
+    ids = [journal["id"] for journal in journals]
+    if journal_id is None:
+        journal_id = ids[-1]
+    elif journal_id not in ids:
+        raise ValueError(f"Restore point not found: {journal_id}")
+
+    for journal in reversed(journals[ids.index(journal_id):]):
+        logging.info("\n[INF] Restoring %s...", journal["id"])
+        folder = os.path.join(root, journal["id"])
+
+        for entry in journal["entries"]:
+            if entry.get("restored"):
+                continue
+
+            file_path = os.path.join(game_folder, entry["path"])
+            logging.info(" - %s", entry["path"])
+
+            try:
+                if entry["action"] == "delete":
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                else:
+                    _restore_delta(file_path, folder, entry)
+            except Exception as e:
+                logging.error(
+                    "[ERR] Can't restore %s: %s\n"
+                    "The file was probably changed after packing. Restoring stopped.",
+                    file_path, e,
+                )
+                return False
+
+            # remember the progress, so that an interrupted restoring can be resumed
+            entry["restored"] = True
+            _save_manifest(folder, journal)
+
+        shutil.rmtree(folder)
+
+    logging.info("[INF] Restoring completed!")
+    return True
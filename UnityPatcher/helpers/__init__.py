@@ -1,12 +1,24 @@
-from . import GeneralHelper, SmartPatching
+from . import AdaptivePool, BackupHelper, CostModel, DeltaPatcher, EncodeCache, GeneralHelper, MergePatch, PatchWatcher, SmartPatching, UndoJournal
 from .RuntimeManager import RuntimeManager
+from .ResourceIndex import ResourceIndex
 from .ResourcePacker import ResourcePacker
+from .ResourceStream import ResourceStream
 from .TypeTreeManager import TypeTreeManager
 
 __all__ = [
     "ResourcePacker",
+    "ResourceIndex",
+    "ResourceStream",
     "GeneralHelper",
     "TypeTreeManager",
     "SmartPatching",
+    "DeltaPatcher",
+    "BackupHelper",
+    "UndoJournal",
+    "CostModel",
+    "AdaptivePool",
+    "EncodeCache",
+    "MergePatch",
+    "PatchWatcher",
     "RuntimeManager"
 ]
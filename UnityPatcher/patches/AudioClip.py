@@ -5,8 +5,8 @@ from UnityPy.classes import AudioClip
 from UnityPy.enums import AudioCompressionFormat
 from UnityPy.export import AudioClipConverter
 
-from helpers import GeneralHelper, ResourcePacker
-from tools import convert_to_fsb5
+from helpers import AdaptivePool, EncodeCache, GeneralHelper, ResourcePacker
+from tools import FSB5_CONVERTER_PATH, convert_to_fsb5
 from utils import lock
 
 
@@ -25,18 +25,26 @@ def _AudioClip_set_audio(self: AudioClip, file: str, compress_to_fsb5: bool = Tr
         fmt_name = AudioCompressionFormat(self.m_CompressionFormat).name
         compression_format = fmt_name if fmt_name in converter_formats else "Vorbis"
 
-        temp_path = config.TEMP_PATH
-        os.makedirs(temp_path, exist_ok=True)
-        output_file = os.path.join(temp_path, f"{self.name}.fsb")
-        cache_folder = os.path.join(temp_path, "fsb5_cache")
-        convert_to_fsb5(
-            file,
-            compression_format=compression_format,
-            output_file_path=output_file,
-            cache_folder_path=cache_folder,
-            thread_count=os.cpu_count(),
+        def encode():
+            temp_path = config.TEMP_PATH
+            os.makedirs(temp_path, exist_ok=True)
+            output_file = os.path.join(temp_path, f"{self.name}.fsb")
+            cache_folder = os.path.join(temp_path, "fsb5_cache")
+            convert_to_fsb5(
+                file,
+                compression_format=compression_format,
+                output_file_path=output_file,
+                cache_folder_path=cache_folder,
+                thread_count=AdaptivePool.subprocess_threads(),
+            )
+            return GeneralHelper.read_binary_file(output_file), {}
+
+        self.m_AudioData, _ = EncodeCache.cached(
+            "audio",
+            [file],
+            lambda: [compression_format, EncodeCache.source_hash(FSB5_CONVERTER_PATH)],
+            encode,
         )
-        self.m_AudioData = GeneralHelper.read_binary_file(output_file)
 
         if compression_format == "Vorbis":
             self.m_CompressionFormat = AudioCompressionFormat.Vorbis
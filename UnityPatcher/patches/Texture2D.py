@@ -1,10 +1,11 @@
 from typing import Optional
 
-from PIL import Image
 from UnityPy.classes import Texture2D
 
+from core.Settings import Settings
 from enums import TextureCompressionQuality as Quality
-from .TextureConverter import generate_mipmaps, image_to_raw, image_to_texture2d
+from helpers.ResourcePacker import pack_stream_data
+from .TextureConverter import encode_image
 
 
 def _Texture2D_set_image(
@@ -21,19 +22,10 @@ def _Texture2D_set_image(
     if not target_format:
         target_format = self.m_TextureFormat
 
-    img = Image.open(img_path)
-
-    img_data, tex_format = (
-        image_to_raw(img, target_format)
-        if raw_mode or any(dimension % 4 != 0 for dimension in img.size)
-        else image_to_texture2d(img, target_format, compression_quality)
+    img_data, tex_format, mipmap_count, size = encode_image(
+        img_path, target_format, raw_mode, compression_quality, mipmap_count
     )
 
-    if mipmap_count > 1:
-        img_data, mipmap_count = generate_mipmaps(
-            img, img_data, mipmap_count, target_format, compression_quality
-        )
-
     if self.version[:2] < (5, 2):  # 5.2 down
         self.m_MipMap = mipmap_count > 1
     else:
@@ -43,7 +35,7 @@ def _Texture2D_set_image(
 
     self.m_CompleteImageSize = len(img_data)
     self.m_TextureFormat = tex_format
-    self.m_Width, self.m_Height = img.size
+    self.m_Width, self.m_Height = size
 
 
 def _Texture2D_save_via_tree(self: Texture2D):
@@ -56,16 +48,23 @@ def _Texture2D_save_via_tree(self: Texture2D):
     else:
         tree["m_MipCount"] = self.m_MipCount
 
+    stream_data = (
+        pack_stream_data(self, tree.get("m_StreamData"), self.image_data)
+        if Settings.texture_stream
+        else None
+    )
+
     tree.update(
         {
             "m_TextureFormat": self.m_TextureFormat,
             "m_CompleteImageSize": len(self.image_data),
-            "image data": self.image_data,
+            "image data": b"" if stream_data else self.image_data,
             "m_Width": self.m_Width,
             "m_Height": self.m_Height,
-            "m_StreamData": {"offset": 0, "size": 0, "path": ""},
         }
     )
+    if "m_StreamData" in tree:
+        tree["m_StreamData"] = stream_data or {"offset": 0, "size": 0, "path": ""}
 
     self.reader.save_typetree(tree)
 
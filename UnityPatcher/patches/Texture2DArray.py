@@ -6,8 +6,10 @@ from UnityPy.classes import Texture2DArray
 from UnityPy.enums.GraphicsFormat import GRAPHICS_TO_TEXTURE_MAP
 from UnityPy.helpers.ResourceReader import get_resource_data
 
+from core.Settings import Settings
 from enums import TextureCompressionQuality as Quality
-from .TextureConverter import generate_mipmaps, image_to_raw, image_to_texture2d
+from helpers.ResourcePacker import pack_stream_data
+from .TextureConverter import encode_image
 
 
 def _Texture2DArray_image_data_getter(self: Texture2DArray):
@@ -61,24 +63,19 @@ def _Texture2DArray_set_images(
     for i, image_path in enumerate(imgs_path[: self.m_Depth]):
         logging.info("Packing progress: %d/%d", i + 1, self.m_Depth)
 
-        img = Image.open(image_path)
+        # only the header is read here
+        with Image.open(image_path) as img:
+            size = img.size
 
-        if img.size != (self.m_Width, self.m_Height):
+        if size != (self.m_Width, self.m_Height):
             raise ValueError(
-                f"Incorrect image size. Expected {self.m_Width}x{self.m_Height}, got {img.size} (index: {i})"
+                f"Incorrect image size. Expected {self.m_Width}x{self.m_Height}, got {size} (index: {i})"
             )
 
-        img_data, tex_format = (
-            image_to_raw(img, target_format)
-            if (raw_mode or any(dimension % 4 != 0 for dimension in img.size))
-            else image_to_texture2d(img, target_format, compression_quality)
+        img_data, tex_format, mipmap_count, _ = encode_image(
+            image_path, target_format, raw_mode, compression_quality, mipmap_count
         )
 
-        if mipmap_count > 1:
-            img_data, mipmap_count = generate_mipmaps(
-                img, img_data, mipmap_count, target_format, compression_quality
-            )
-
         new_image_data.extend(img_data)
 
     self.image_data = bytes(new_image_data)
@@ -92,13 +89,19 @@ def _Texture2DArray_save_via_tree(self: Texture2DArray):
     if not tree:
         raise Exception("Typetree is None")
 
+    stream_data = (
+        pack_stream_data(self, tree.get("m_StreamData"), self.image_data)
+        if Settings.texture_stream
+        else None
+    )
+
     tree.update(
         {
             "m_Format": self.m_Format,
             "m_MipCount": self.m_MipCount,
             "m_DataSize": self.m_DataSize,
-            "image data": self.image_data,
-            "m_StreamData": {"offset": 0, "size": 0, "path": ""},
+            "image data": b"" if stream_data else self.image_data,
+            "m_StreamData": stream_data or {"offset": 0, "size": 0, "path": ""},
         }
     )
     self.reader.save_typetree(tree)
@@ -1,11 +1,66 @@
-from typing import Tuple, Union
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib import metadata
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import astc_encoder
+import numpy as np
 from PIL import Image
 from UnityPy.enums import TextureFormat as TF
 
+from core.Settings import Settings
 from enums import TextureCompressionQuality as Quality
-from tools import compress_image_to_bc
+from helpers import AdaptivePool, EncodeCache
+from tools import compress_images_to_bc, compress_images_to_bc_numpy
+from tools.bc_encoder import ENCODER_PATH as BC_ENCODER_PATH
+from tools.bc_encoder import init_clr_once
+
+# images with more pixels are encoded in stripes by several processes
+PARALLEL_MIN_PIXELS = 2048 * 2048
+
+# part of the encode cache key, changes when the mips are built differently
+MIPMAP_VERSION = 2
+# Kaiser filter of the mips: width in the mip pixels and the window shape
+KAISER_WIDTH = 3
+KAISER_ALPHA = 4
+# rows of a mip filtered at once: the source image is read and converted
+# to float tile by tile, so a float copy of the whole image isn't made
+TILE_ROWS = 64
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _dotnet_available() -> bool:
+    try:
+        init_clr_once()
+        return True
+    except Exception as e:
+        logging.warning("[WARN] .NET runtime isn't available, the NumPy BC encoder is used: %s", e)
+        return False
+
+
+def get_bc_encoder() -> str:
+    """
+    Which BC encoder is used (see --tex_encoder): dotnet or numpy.
+    In auto mode, NumPy is only used if the .NET runtime isn't available.
+    """
+    encoder = Settings.texture_encoder
+    if encoder == "auto":
+        encoder = "dotnet" if _dotnet_available() else "numpy"
+    return encoder
+
+
+def _compress_bc(images: List[Image.Image], format_name: str, quality: Quality) -> List[bytes]:
+    if get_bc_encoder() == "numpy":
+        return compress_images_to_bc_numpy(images, format_name, quality)
+    return compress_images_to_bc(images, format_name, quality)
 
 
 def image_to_texture2d(
@@ -17,55 +72,71 @@ def image_to_texture2d(
     if isinstance(target_texture_format, int):
         target_texture_format = TF(target_texture_format)
 
-    import etcpak
-
     if flip:
         img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
 
-    # DXT (BCnEncoder.NET)
-    if target_texture_format in [TF.DXT1, TF.DXT1Crunched]:
-        enc_img = compress_image_to_bc(img, "BC1", quality)
-        tex_format = TF.DXT1
-    elif target_texture_format in [TF.DXT3]:
-        enc_img = compress_image_to_bc(img, "BC2", quality)
-        tex_format = TF.DXT3
-    elif target_texture_format in [TF.DXT5, TF.DXT5Crunched, TF.BC7]:
-        enc_img = compress_image_to_bc(img, "BC3", quality)
-        tex_format = TF.DXT5
-    elif target_texture_format in [TF.BC4]:
-        enc_img = compress_image_to_bc(img, "BC4", quality)
-        tex_format = TF.BC4
-    elif target_texture_format in [TF.BC5]:
-        enc_img = compress_image_to_bc(img, "BC5", quality)
-        tex_format = TF.BC5
+    stripes = _split_stripes(img, target_texture_format)
+    if len(stripes) > 1:
+        return _encode_stripes(img, stripes, target_texture_format, quality)
+    return _encode(img, target_texture_format, quality)
+
+
+# target format -> encoder, encoder format and format of the encoded data
+# (image_to_texture2d, get_encoder_name and the planner use this table)
+ENCODERS: Dict[TF, Tuple[str, str, TF]] = {
+    # DXT (BCnEncoder.NET or NumPy)
+    TF.DXT1: ("bc", "BC1", TF.DXT1),
+    TF.DXT1Crunched: ("bc", "BC1", TF.DXT1),
+    TF.DXT3: ("bc", "BC2", TF.DXT3),
+    TF.DXT5: ("bc", "BC3", TF.DXT5),
+    TF.DXT5Crunched: ("bc", "BC3", TF.DXT5),
     # Disabled because the compression is very long and seems incorrect
-    # elif target_texture_format in [TF.BC7]:
-    #     enc_img = compress_image_to_bc(img, "BC7", quality)
-    #     tex_format = TF.BC7
-    
+    # TF.BC7: ("bc", "BC7", TF.BC7),
+    TF.BC7: ("bc", "BC3", TF.DXT5),
+    TF.BC4: ("bc", "BC4", TF.BC4),
+    TF.BC5: ("bc", "BC5", TF.BC5),
     # ETC (etcpak)
-    elif target_texture_format in [TF.ETC_RGB4, TF.ETC_RGB4Crunched, TF.ETC_RGB4_3DS]:
-        raw_img = img.tobytes("raw", "RGBA")
-        enc_img = etcpak.compress_etc1_rgb(raw_img, img.width, img.height)
-        tex_format = TF.ETC_RGB4
-    elif target_texture_format == TF.ETC2_RGB:
-        raw_img = img.tobytes("raw", "RGBA")
-        enc_img = etcpak.compress_etc2_rgb(raw_img, img.width, img.height)
-        tex_format = TF.ETC2_RGB
-    elif (
-        target_texture_format in [TF.ETC2_RGBA8, TF.ETC2_RGBA8Crunched, TF.ETC2_RGBA1]
-        or "_RGB_" in target_texture_format.name
-    ):
+    TF.ETC_RGB4: ("etc", "etc1_rgb", TF.ETC_RGB4),
+    TF.ETC_RGB4Crunched: ("etc", "etc1_rgb", TF.ETC_RGB4),
+    TF.ETC_RGB4_3DS: ("etc", "etc1_rgb", TF.ETC_RGB4),
+    TF.ETC2_RGB: ("etc", "etc2_rgb", TF.ETC2_RGB),
+    TF.ETC2_RGBA8: ("etc", "etc2_rgba", TF.ETC2_RGBA8),
+    TF.ETC2_RGBA8Crunched: ("etc", "etc2_rgba", TF.ETC2_RGBA8),
+    TF.ETC2_RGBA1: ("etc", "etc2_rgba", TF.ETC2_RGBA8),
+}
+
+
+def get_encoder(target_texture_format: Union[TF, int]) -> Tuple[str, str, TF]:
+    """return: encoder (bc, etc, astc or raw), encoder format and format of the encoded data"""
+    if isinstance(target_texture_format, int):
+        target_texture_format = TF(target_texture_format)
+
+    if target_texture_format in ENCODERS:
+        return ENCODERS[target_texture_format]
+    name = target_texture_format.name
+    if "_RGB_" in name:
+        return "etc", "etc2_rgba", TF.ETC2_RGBA8
+    if name.startswith("ASTC"):
+        return "astc", name.rsplit("_", 1)[1], target_texture_format
+    return "raw", "", target_texture_format
+
+
+def _encode(
+    img: Image.Image, target_texture_format: TF, quality: Quality
+) -> Tuple[bytes, TF]:
+    import etcpak
+
+    encoder, encoder_format, tex_format = get_encoder(target_texture_format)
+
+    if encoder == "bc":
+        enc_img = _compress_bc([img], encoder_format, quality)[0]
+    elif encoder == "etc":
         raw_img = img.tobytes("raw", "RGBA")
-        enc_img = etcpak.compress_etc2_rgba(raw_img, img.width, img.height)
-        tex_format = TF.ETC2_RGBA8
-    # ASTC (astc_encoder)
-    elif target_texture_format.name.startswith("ASTC"):
+        compress = getattr(etcpak, f"compress_{encoder_format}")
+        enc_img = compress(raw_img, img.width, img.height)
+    elif encoder == "astc":
         raw_img = img.tobytes("raw", "RGBA")
-
-        block_size = tuple(
-            map(int, target_texture_format.name.rsplit("_", 1)[1].split("x"))
-        )
+        block_size = tuple(map(int, encoder_format.split("x")))
 
         config = astc_encoder.ASTCConfig(
             astc_encoder.ASTCProfile.LDR, *block_size, 1, 100
@@ -74,20 +145,142 @@ def image_to_texture2d(
         raw_img = astc_encoder.ASTCImage(
             astc_encoder.ASTCType.U8, img.width, img.height, 1, raw_img
         )
-        if img.mode == "RGB":
-            tex_format = getattr(TF, f"ASTC_RGB_{block_size[0]}x{block_size[1]}")
-        else:
-            tex_format = getattr(TF, f"ASTC_RGBA_{block_size[0]}x{block_size[1]}")
-
         swizzle = astc_encoder.ASTCSwizzle.from_str("RGBA")
         enc_img = context.compress(raw_img, swizzle)
-        tex_format = target_texture_format
     else:
         return image_to_raw(img, target_texture_format, flip=False)
 
     return enc_img, tex_format
 
 
+def _block_height(target_texture_format: TF) -> int:
+    """Height of the blocks written by the encoder of the format (ASTC_RGB_* are encoded as ETC2)."""
+    encoder, encoder_format, _ = get_encoder(target_texture_format)
+    if encoder == "astc":
+        return int(encoder_format.split("x")[1])
+    return 4
+
+
+def _split_stripes(img: Image.Image, target_texture_format: TF) -> List[Tuple[int, int]]:
+    """
+    Rows (top, bottom) of the horizontal stripes the image is encoded in.
+    Blocks are stored row by row, so the stripes are aligned to the block
+    height and their encoded data is concatenated as is.
+    """
+    encoder = get_encoder_name(target_texture_format)
+    if (
+        encoder == "raw"
+        # BCnEncoder.NET encodes the blocks in parallel itself
+        or encoder == "bc" and get_bc_encoder() == "dotnet"
+        or img.width * img.height < PARALLEL_MIN_PIXELS
+    ):
+        return [(0, img.height)]
+
+    block_height = _block_height(target_texture_format)
+    block_rows = -(-img.height // block_height)
+    count = min(AdaptivePool.subprocess_threads(), block_rows)
+    if count < 2:
+        return [(0, img.height)]
+
+    rows = -(-block_rows // count) * block_height
+    return [(top, min(top + rows, img.height)) for top in range(0, img.height, rows)]
+
+
+def _map_in_pool(fn: Callable, tasks: List[Tuple]) -> Iterator:
+    """Runs the tasks in the shared process pool (it's created on the first use)."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: forked workers would inherit the threads and the CLR of the patcher
+            _process_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+            )
+        # submitted under the lock, so the pool can't be shut down in between
+        futures = [_process_pool.submit(fn, task) for task in tasks]
+    return (future.result() for future in futures)
+
+
+def shutdown_process_pool():
+    """Stops the encoding processes (submitted tasks are finished first)."""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_process_pool)
+
+
+def _encode_stripe(task: Tuple) -> Tuple[bytes, int]:
+    """Worker of the process pool (the image is already flipped)."""
+    mode, size, pixels, target_texture_format, quality, texture_encoder = task
+    # settings of the patcher aren't passed to the spawned process
+    Settings.texture_encoder = texture_encoder
+    img = Image.frombytes(mode, size, pixels)
+    enc_img, tex_format = _encode(img, TF(target_texture_format), Quality(quality))
+    return enc_img, int(tex_format)
+
+
+def _stripe_tasks(
+    img: Image.Image,
+    stripes: List[Tuple[int, int]],
+    target_texture_format: TF,
+    quality: Quality,
+) -> List[Tuple]:
+    tasks = []
+    for top, bottom in stripes:
+        stripe = img.crop((0, top, img.width, bottom))
+        tasks.append(
+            (
+                stripe.mode,
+                stripe.size,
+                stripe.tobytes(),
+                int(target_texture_format),
+                quality.value,
+                get_bc_encoder(),
+            )
+        )
+    return tasks
+
+
+def _encode_stripes(
+    img: Image.Image,
+    stripes: List[Tuple[int, int]],
+    target_texture_format: TF,
+    quality: Quality,
+) -> Tuple[bytes, TF]:
+    tasks = _stripe_tasks(img, stripes, target_texture_format, quality)
+    results = list(_map_in_pool(_encode_stripe, tasks))
+    return b"".join(data for data, _ in results), TF(results[0][1])
+
+
+def get_encoder_name(target_texture_format: Union[TF, int]) -> str:
+    """Which encoder image_to_texture2d uses for the format: bc, etc, astc or raw."""
+    return get_encoder(target_texture_format)[0]
+
+
+@lru_cache(maxsize=None)
+def _encoder_version(encoder: str) -> str:
+    if encoder == "dotnet":
+        return EncodeCache.source_hash(BC_ENCODER_PATH)
+    if encoder == "numpy":
+        return metadata.version("numpy")
+    if encoder == "etc":
+        return metadata.version("etcpak")
+    if encoder == "astc":
+        return metadata.version("astc-encoder-py")
+    return "raw"
+
+
+def get_encoder_version(target_texture_format: Union[TF, int]) -> str:
+    """Version of the encoder used for the format (a part of the encode cache key)."""
+    encoder = get_encoder_name(target_texture_format)
+    if encoder == "bc":
+        encoder = get_bc_encoder()
+    return f"{encoder}:{_encoder_version(encoder)}"
+
+
 def image_to_raw(
     img: Image.Image, target_texture_format: Union[TF, int], flip: bool = True
 ) -> Tuple[bytes, TF]:
@@ -142,30 +335,231 @@ def image_to_raw(
     return enc_img, tex_format
 
 
+def get_mipmap_count(width: int, height: int, mipmap_count: int) -> int:
+    """Unity stores mips down to 1x1, so the chain is limited by the largest dimension."""
+    return max(1, min(mipmap_count, max(width, height).bit_length()))
+
+
+def _srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    values = np.clip(values, 0, 1)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+
+
+def _filter_taps(size: int, new_size: int, mipmap_filter: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Source pixels and their weights for every pixel of the downscaled axis.
+    return: indices and weights, both (new_size, taps)
+    """
+    scale = size / new_size
+    centers = (np.arange(new_size) + 0.5) * scale
+    radius = scale / 2 if mipmap_filter == "box" else KAISER_WIDTH * scale / 2
+
+    first = np.floor(centers - radius).astype(np.int64)
+    indices = first[:, None] + np.arange(int(np.ceil(2 * radius)) + 2)
+    if mipmap_filter == "box":
+        # overlap of the source pixels with the area of the new pixel
+        weights = np.minimum(indices + 1, (centers + radius)[:, None]) - np.maximum(
+            indices, (centers - radius)[:, None]
+        )
+        weights = np.maximum(weights, 0)
+    else:
+        offsets = (indices + 0.5 - centers[:, None]) / scale
+        window = np.clip(1 - (2 * offsets / KAISER_WIDTH) ** 2, 0, None)
+        weights = np.sinc(offsets) * np.i0(KAISER_ALPHA * np.sqrt(window)) / np.i0(KAISER_ALPHA)
+        weights[np.abs(offsets) >= KAISER_WIDTH / 2] = 0
+
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.clip(indices, 0, size - 1), weights.astype(np.float32)
+
+
+def _filter_axis(pixels: np.ndarray, indices: np.ndarray, weights: np.ndarray, axis: int) -> np.ndarray:
+    shape = (-1, 1, 1) if axis == 0 else (1, -1, 1)
+    result = np.zeros(
+        pixels.shape[:axis] + (indices.shape[0],) + pixels.shape[axis + 1 :], dtype=np.float32
+    )
+    for tap in range(indices.shape[1]):
+        if weights[:, tap].any():
+            result += np.take(pixels, indices[:, tap], axis=axis) * weights[:, tap].reshape(shape)
+    return result
+
+
+def _downscale(
+    read_rows: Callable[[int, int], np.ndarray],
+    source_size: Tuple[int, int],
+    size: Tuple[int, int],
+    mipmap_filter: str,
+) -> np.ndarray:
+    """
+    read_rows(first, last): source rows as float32 (rows, width, channels)
+    return: (size[1], size[0], channels) in float32
+    """
+    row_indices, row_weights = _filter_taps(source_size[1], size[1], mipmap_filter)
+    column_indices, column_weights = _filter_taps(source_size[0], size[0], mipmap_filter)
+
+    result = None
+    for start in range(0, size[1], TILE_ROWS):
+        indices = row_indices[start : start + TILE_ROWS]
+        first, last = indices.min(), indices.max() + 1
+        tile_weights = row_weights[start : start + TILE_ROWS]
+        tile = _filter_axis(read_rows(first, last), indices - first, tile_weights, 0)
+        tile = _filter_axis(tile, column_indices, column_weights, 1)
+        if result is None:
+            result = np.empty((size[1], size[0], tile.shape[2]), dtype=np.float32)
+        result[start : start + TILE_ROWS] = tile
+    return result
+
+
+def _mipmap_chain(img: Image.Image, mipmap_count: int) -> List[Image.Image]:
+    """
+    Mips 1..mipmap_count-1 of the image, flipped like the encoded image. Each one
+    is downscaled from the previous level without rounding to 8 bits in between.
+    Colors are filtered in linear space with Settings.mipmap_gamma_correct.
+    """
+    color_channels = 1 if img.mode in ("L", "LA") else 3
+    gamma_correct = Settings.mipmap_gamma_correct
+
+    def read_image_rows(first: int, last: int) -> np.ndarray:
+        # rows of the flipped image
+        rows = np.asarray(img.crop((0, img.height - last, img.width, img.height - first)))[::-1]
+        if rows.ndim == 2:
+            rows = rows[..., None]
+        rows = rows.astype(np.float32) / 255
+        if gamma_correct:
+            rows[..., :color_channels] = _srgb_to_linear(rows[..., :color_channels])
+        return rows
+
+    def to_8bit(level: np.ndarray) -> np.ndarray:
+        result = np.empty(level.shape, dtype=np.uint8)
+        for start in range(0, level.shape[0], TILE_ROWS):
+            tile = np.clip(level[start : start + TILE_ROWS], 0, 1)
+            if gamma_correct:
+                tile[..., :color_channels] = _linear_to_srgb(tile[..., :color_channels])
+            result[start : start + TILE_ROWS] = np.rint(tile * 255)
+        return result
+
+    levels = []
+    read_rows = read_image_rows
+    width, height = img.size
+    for _ in range(mipmap_count - 1):
+        source_size = width, height
+        width, height = max(1, width // 2), max(1, height // 2)
+        pixels = _downscale(read_rows, source_size, (width, height), Settings.mipmap_filter)
+        # the next level is downscaled from this one in float
+        read_rows = lambda first, last, pixels=pixels: pixels[first:last]
+
+        level = to_8bit(pixels)
+        levels.append(Image.fromarray(level[..., 0] if img.mode == "L" else level, img.mode))
+    return levels
+
+
+def _pad_to_blocks(level: Image.Image) -> Image.Image:
+    """Mips smaller than a block are stored as a whole block."""
+    if not level.width % 4 and not level.height % 4:
+        return level
+    pixels = np.asarray(level)
+    padding = [(0, -level.height % 4), (0, -level.width % 4)]
+    pixels = np.pad(pixels, padding + [(0, 0)] * (pixels.ndim - 2), mode="edge")
+    return Image.fromarray(pixels, level.mode)
+
+
+def _encode_mipmaps(levels: List[Image.Image], tex_format: TF, quality: Quality) -> List[bytes]:
+    """
+    Encodes all mips at once: BC mips with a single encoder, ETC and ASTC mips
+    in stripes in the process pool when they are large enough.
+    """
+    encoder, encoder_format, _ = get_encoder(tex_format)
+    if encoder == "raw":
+        return [image_to_raw(level, tex_format, flip=False)[0] for level in levels]
+
+    if encoder in ("bc", "etc"):
+        levels = [_pad_to_blocks(level) for level in levels]
+    if encoder == "bc":
+        return _compress_bc(levels, encoder_format, quality)
+
+    if (
+        sum(level.width * level.height for level in levels) < PARALLEL_MIN_PIXELS
+        or AdaptivePool.subprocess_threads() < 2
+    ):
+        return [_encode(level, tex_format, quality)[0] for level in levels]
+
+    tasks, stripe_counts = [], []
+    for level in levels:
+        stripes = _split_stripes(level, tex_format)
+        tasks.extend(_stripe_tasks(level, stripes, tex_format, quality))
+        stripe_counts.append(len(stripes))
+
+    results = _map_in_pool(_encode_stripe, tasks)
+    return [b"".join(next(results)[0] for _ in range(count)) for count in stripe_counts]
+
+
 def generate_mipmaps(
     img: Image.Image,  # source image
-    data: bytes,  # bytes object where to write mipmaps
+    data: bytes,  # encoded source image
     mipmap_count: int,
-    target_format: TF,
+    tex_format: TF,  # format of the encoded source image
     compression_quality: Quality = Quality.BEST,
 ) -> Tuple[bytes, int]:
-    mips_data = bytearray()
-
-    if mipmap_count > 1:
-        width, height = img.size
-        re_img = img
-        for i in range(mipmap_count - 1):
-            width //= 2
-            height //= 2
-            if width < 4 or height < 4:
-                mipmap_count = i + 1
-                break
-            re_img = re_img.resize(
-                (width, height), Image.BILINEAR
-            )  # bilinear instead of bicubic
-            mips_data.extend(
-                image_to_texture2d(re_img, target_format, compression_quality)[0]
+    """
+    Builds the mip chain of the image at once and appends the encoded mips to data.
+    return: image data with mips and the mipmap count
+    """
+    mipmap_count = get_mipmap_count(img.width, img.height, mipmap_count)
+    if mipmap_count == 1:
+        return data, 1
+
+    if img.mode not in ("L", "LA", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+
+    levels = _mipmap_chain(img, mipmap_count)
+    mips = _encode_mipmaps(levels, tex_format, compression_quality)
+    return b"".join([data, *mips]), mipmap_count
+
+
+def encode_image(
+    img_path: str,
+    target_format: Union[TF, int],
+    raw_mode: bool = False,
+    compression_quality: Quality = Quality.BEST,
+    mipmap_count: int = 1,
+) -> Tuple[bytes, TF, int, Tuple[int, int]]:
+    """
+    Encodes the image file with its mipmaps (results are reused from the encode cache).
+
+    return: image data, texture format, mipmap count and image size
+    """
+
+    def encode():
+        img = Image.open(img_path)
+
+        img_data, tex_format = (
+            image_to_raw(img, target_format)
+            if raw_mode or any(dimension % 4 != 0 for dimension in img.size)
+            else image_to_texture2d(img, target_format, compression_quality)
+        )
+
+        mips = mipmap_count
+        if mipmap_count > 1:
+            img_data, mips = generate_mipmaps(
+                img, img_data, mipmap_count, tex_format, compression_quality
             )
 
-    new_data = data + bytes(mips_data)
-    return new_data, mipmap_count
+        return img_data, {"format": int(tex_format), "mips": mips, "size": list(img.size)}
+
+    img_data, info = EncodeCache.cached(
+        "texture",
+        [img_path],
+        lambda: [
+            int(target_format),
+            compression_quality.value,
+            raw_mode,
+            mipmap_count,
+            get_encoder_version(target_format),
+            f"mips{MIPMAP_VERSION}:{Settings.mipmap_filter}:{Settings.mipmap_gamma_correct}",
+        ],
+        encode,
+    )
+    return img_data, TF(info["format"]), info["mips"], tuple(info["size"])
@@ -1,12 +1,14 @@
 import logging
 import os
+import subprocess
 from enum import IntEnum
+from functools import lru_cache
 
 import ffmpeg  # ffmpeg-python
 from UnityPy import config
 from UnityPy.classes import VideoClip
 
-from helpers import GeneralHelper, ResourcePacker
+from helpers import AdaptivePool, EncodeCache, GeneralHelper, ResourcePacker
 
 
 class VideoCompressionFormat(IntEnum):
@@ -31,6 +33,16 @@ CODECS_MAPPINGS = {
 }
 
 
+@lru_cache(maxsize=None)
+def _ffmpeg_version() -> str:
+    """First line of `ffmpeg -version` (a part of the encode cache key)."""
+    try:
+        output = subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise FileNotFoundError(f"ffmpeg not found: {e}")
+    return output.decode("utf-8", "replace").splitlines()[0]
+
+
 def _VideoClip_set_video(
     self: VideoClip, file: str, transcode: bool = False, preset: str = "medium"
 ):
@@ -95,16 +107,28 @@ def _VideoClip_transcode_video(self: VideoClip, file: str, preset: str = "medium
     if self.check_codecs(file):
         return GeneralHelper.read_binary_file(file)
 
-    temp_path = config.TEMP_PATH
-    os.makedirs(temp_path, exist_ok=True)
-    output_file = os.path.join(temp_path, self.name + ext)
-    logging.info("Converting video: %s...", file)
-    (
-        ffmpeg.input(file)
-        .output(output_file, vcodec=vcodec, acodec=acodec, preset=preset)
-        .run(quiet=True, overwrite_output=True)
+    def encode():
+        temp_path = config.TEMP_PATH
+        os.makedirs(temp_path, exist_ok=True)
+        output_file = os.path.join(temp_path, self.name + ext)
+        logging.info("Converting video: %s...", file)
+        (
+            ffmpeg.input(file)
+            .output(
+                output_file,
+                vcodec=vcodec,
+                acodec=acodec,
+                preset=preset,
+                threads=AdaptivePool.subprocess_threads(),
+            )
+            .run(quiet=True, overwrite_output=True)
+        )
+        return GeneralHelper.read_binary_file(output_file), {}
+
+    data, _ = EncodeCache.cached(
+        "video", [file], lambda: [vcodec, acodec, ext, preset, _ffmpeg_version()], encode
     )
-    return GeneralHelper.read_binary_file(output_file)
+    return data
 
 
 def _VideoClip_save_via_tree(self: VideoClip, append_mode: bool = False):
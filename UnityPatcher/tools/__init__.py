@@ -1,7 +1,11 @@
-from .wrappers import convert_to_fsb5
+from .wrappers import FSB5_CONVERTER_PATH, convert_to_fsb5
 from .typetree_generator import generate_typetree
-from .bc_encoder import compress_image_to_bc
+from .bc_encoder import (
+    compress_image_to_bc, compress_image_to_bc_numpy, compress_images_to_bc, compress_images_to_bc_numpy
+)
 
 __all__ = [
-    "convert_to_fsb5", "generate_typetree", "compress_image_to_bc"
+    "convert_to_fsb5", "generate_typetree", "compress_image_to_bc",
+    "compress_image_to_bc_numpy", "compress_images_to_bc", "compress_images_to_bc_numpy",
+    "FSB5_CONVERTER_PATH"
 ]
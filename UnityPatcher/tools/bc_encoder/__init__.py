@@ -1,3 +1,7 @@
-from .main import compress_image_to_bc
+from .main import ENCODER_PATH, compress_image_to_bc, compress_images_to_bc, init_clr_once
+from .numpy_encoder import compress_image_to_bc_numpy, compress_images_to_bc_numpy
 
-__all__= ["compress_image_to_bc"]
\ No newline at end of file
+__all__= [
+    "compress_image_to_bc", "compress_images_to_bc", "compress_image_to_bc_numpy",
+    "compress_images_to_bc_numpy", "init_clr_once", "ENCODER_PATH"
+]
\ No newline at end of file
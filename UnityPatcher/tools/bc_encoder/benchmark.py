@@ -0,0 +1,110 @@
+"""
+Compares the NumPy and BCnEncoder.NET encoders on a synthetic image:
+encoding time and PSNR of the image decoded with texture2ddecoder.
+
+Run from the UnityPatcher folder:
+    python -m tools.bc_encoder.benchmark [--size 2048] [--formats BC1 BC3] [--encoders numpy]
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import texture2ddecoder
+from PIL import Image
+
+from enums import TextureCompressionQuality as Quality
+from tools.bc_encoder.main import compress_image_to_bc, init_clr_once
+from tools.bc_encoder.numpy_encoder import compress_image_to_bc_numpy
+
+# format -> decoder and the RGBA channels it keeps
+FORMATS: Dict[str, Tuple[Callable, List[int]]] = {
+    "BC1": (texture2ddecoder.decode_bc1, [0, 1, 2]),
+    "BC3": (texture2ddecoder.decode_bc3, [0, 1, 2, 3]),
+    "BC4": (texture2ddecoder.decode_bc4, [0]),
+    "BC5": (texture2ddecoder.decode_bc5, [0, 1]),
+}
+ENCODERS = {"numpy": compress_image_to_bc_numpy, "dotnet": compress_image_to_bc}
+
+
+def make_image(size: int, seed: int = 0) -> Image.Image:
+    """Smooth gradients with noise: each block has a dominant color and some detail."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    channels = [
+        128 + 100 * np.sin(6 * x + 2 * y),
+        128 + 100 * np.cos(4 * y - 3 * x),
+        255 * x * y,
+        255 * (0.5 + 0.5 * np.sin(10 * x * y)),
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 12, (size, size, 4))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGBA")
+
+
+def decode(data: bytes, format_name: str, width: int, height: int) -> np.ndarray:
+    """return: RGBA pixels (height, width, 4)"""
+    decoder = FORMATS[format_name][0]
+    bgra = np.frombuffer(decoder(data, width, height), dtype=np.uint8).reshape(height, width, 4)
+    return bgra[..., [2, 1, 0, 3]]
+
+
+def psnr(img: Image.Image, data: bytes, format_name: str) -> float:
+    """PSNR of the encoded image over the channels the format keeps."""
+    channels = FORMATS[format_name][1]
+    original = np.asarray(img.convert("RGBA"), dtype=np.float64)[..., channels]
+    decoded = decode(data, format_name, img.width, img.height)[..., channels].astype(np.float64)
+    mse = np.mean((original - decoded) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def run(
+    size: int, formats: List[str], encoders: List[str], qualities: List[Quality]
+) -> List[Tuple[str, str, str, float, float]]:
+    """return: (format, encoder, quality, seconds, PSNR) rows"""
+    img = make_image(size)
+    rows = []
+    for format_name in formats:
+        for encoder in encoders:
+            for quality in qualities:
+                start = time.perf_counter()
+                data = ENCODERS[encoder](img, format_name, quality)
+                seconds = time.perf_counter() - start
+                rows.append((format_name, encoder, quality.value, seconds, psnr(img, data, format_name)))
+                print("%-4s %-7s %-9s %7.2f s %6.2f dB" % rows[-1])
+    return rows
+
+
+def _dotnet_error() -> Optional[str]:
+    try:
+        init_clr_once()
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=2048, help="Image width and height. Default: 2048")
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--encoders", nargs="+", choices=list(ENCODERS), default=list(ENCODERS))
+    parser.add_argument(
+        "--qualities",
+        nargs="+",
+        choices=[quality.value for quality in Quality],
+        default=[quality.value for quality in Quality],
+    )
+    args = parser.parse_args()
+
+    encoders = args.encoders
+    if "dotnet" in encoders:
+        error = _dotnet_error()
+        if error:
+            print(f".NET runtime isn't available, BCnEncoder.NET is skipped: {error}")
+            encoders = [encoder for encoder in encoders if encoder != "dotnet"]
+
+    run(args.size, args.formats, encoders, [Quality(quality) for quality in args.qualities])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import ctypes
 import os
-import io
 import threading
+from typing import List
+
 from PIL import Image
 from enums import TextureCompressionQuality as Quality
 
@@ -11,6 +13,9 @@ from enums import TextureCompressionQuality as Quality
 # BC5 - RGTC2
 # BC7 - BPTC
 
+LIB_DIR = os.path.join(os.path.dirname(__file__), "libs")
+ENCODER_PATH = os.path.join(LIB_DIR, "BCnEncoder.dll")
+
 clr_initialized = False
 clr_lock = threading.Lock()
 
@@ -21,41 +26,63 @@ def init_clr_once():
         if not clr_initialized:
             from .assembly_loader import initialize_clr
 
-            lib_dir = os.path.join(os.path.dirname(__file__), "libs")
-            initialize_clr(lib_dir)
+            initialize_clr(LIB_DIR)
             clr_initialized = True
 
 
+def _copy_to_pinned(array, data: bytes):
+    """Copies data to the .NET array with a single memmove."""
+    from System.Runtime.InteropServices import GCHandle, GCHandleType
+
+    handle = GCHandle.Alloc(array, GCHandleType.Pinned)
+    try:
+        ctypes.memmove(handle.AddrOfPinnedObject().ToInt64(), data, len(data))
+    finally:
+        handle.Free()
+
+
+def _copy_from_pinned(array) -> bytes:
+    from System.Runtime.InteropServices import GCHandle, GCHandleType
+
+    handle = GCHandle.Alloc(array, GCHandleType.Pinned)
+    try:
+        return ctypes.string_at(handle.AddrOfPinnedObject().ToInt64(), array.Length)
+    finally:
+        handle.Free()
+
+
 def compress_image_to_bc(
     img: Image, format_name: str, quality: Quality = Quality.BEST
 ) -> bytes:
     """
     Compress image to specified BC format using BCnEncoder.NET.
 
+    RGBA pixels are copied to the encoder as is and raw BC blocks
+    are returned (without DDS header).
+
     :param img: Pil Image object
     :param format_name: BC format (BC1, BC2, BC3, BC4, BC5, BC7)
     :param quality: Compression quality (fast, balanced, best)
     :return: Compressed bytes
     """
-    init_clr_once()
+    return compress_images_to_bc([img], format_name, quality)[0]
 
-    from SixLabors.ImageSharp import Image as ImageSharpImage
-    from SixLabors.ImageSharp.PixelFormats import Rgba32
-    from BCnEncoder.ImageSharp import BCnEncoderExtensions
-    from BCnEncoder.Encoder import BcEncoder, CompressionQuality
-    from BCnEncoder.Shared import CompressionFormat, OutputFileFormat
-    from System.IO import MemoryStream
 
-    # Prepare input image
-    img_bytearray = io.BytesIO() 
-    pillow_img = img.convert("RGBA")
-    pillow_img.save(img_bytearray, format="PNG") 
+def compress_images_to_bc(
+    images: List[Image], format_name: str, quality: Quality = Quality.BEST
+) -> List[bytes]:
+    """
+    Compresses several images (e.g. mip levels) with the same encoder.
+    The mips generated by BCnEncoder.NET itself aren't used: they're filtered differently.
 
-    ms = MemoryStream(img_bytearray.getvalue()) 
-    try:
-        input_memory = ImageSharpImage.Load[Rgba32](ms)
-    finally:
-        ms.Dispose()
+    :return: Compressed bytes of every image
+    """
+    init_clr_once()
+
+    from System import Array
+    from BCnEncoder.Encoder import BcEncoder, CompressionQuality
+    from BCnEncoder.Shared import ColorRgba32, CompressionFormat
+    from CommunityToolkit.HighPerformance import ReadOnlyMemory2D
 
     # Initialize encoder
     encoder = BcEncoder()
@@ -77,14 +104,16 @@ def compress_image_to_bc(
     encoder.OutputOptions.GenerateMipMaps = False
     encoder.OutputOptions.Format = format_map[format_name]
     encoder.OutputOptions.Quality = quality_map[quality.value]
-    encoder.OutputOptions.FileFormat = OutputFileFormat.Dds
 
-    # Compress the image
-    output_stream = MemoryStream()
-    try:
-        BCnEncoderExtensions.EncodeToStream(encoder, input_memory, output_stream)
-        compressed_bytes = output_stream.ToArray()
-    finally:
-        output_stream.Dispose()
-    
-    return bytes(compressed_bytes)[128:] # strip dds header
+    result = []
+    for img in images:
+        # Prepare input pixels
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        pixels = Array.CreateInstance(ColorRgba32, img.width * img.height)
+        _copy_to_pinned(pixels, img.tobytes("raw", "RGBA"))
+
+        # Compress the image (a single mip level)
+        mips = encoder.EncodeToRawBytes(ReadOnlyMemory2D[ColorRgba32](pixels, img.height, img.width))
+        result.append(_copy_from_pinned(mips[0]))
+    return result
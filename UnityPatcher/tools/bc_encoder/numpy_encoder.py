@@ -0,0 +1,248 @@
+"""
+BC1/BC2/BC3/BC4/BC5 encoder written with NumPy (doesn't need the .NET runtime).
+
+All 4x4 blocks of the image are encoded at once:
+    fast     - endpoints from the bounding box of the block colors
+    balanced - endpoints along the principal axis of the block colors,
+               refined by least squares once the indices are known
+
+Indices are selected by the nearest palette color in both modes.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from enums import TextureCompressionQuality as Quality
+
+# blocks encoded at once (limits the memory used by the distance arrays)
+BATCH_BLOCKS = 32768
+# BC4 index of the n-th value from a0 to a1: a0, interpolated values, a1
+CHANNEL_INDICES = np.array([0, 2, 3, 4, 5, 6, 7, 1], dtype=np.uint8)
+# endpoints are moved inside the range by this share, so the interpolated
+# colors cover the block colors better (as in most fast BC encoders)
+INSET_SHIFT = 1 / 16
+
+
+def _to_blocks(pixels: np.ndarray) -> np.ndarray:
+    """(height, width, channels) -> (blocks, 16, channels)"""
+    height, width, channels = pixels.shape
+    blocks = pixels.reshape(height // 4, 4, width // 4, 4, channels)
+    return blocks.transpose(0, 2, 1, 3, 4).reshape(-1, 16, channels)
+
+
+def _pack_indices(indices: np.ndarray, bits: int) -> np.ndarray:
+    """(blocks, 16) -> packed integers, pixel 0 in the lowest bits"""
+    shifts = np.arange(16, dtype=np.uint64) * bits
+    return (indices.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+
+
+# ==== Color (BC1) ==== #
+
+def _to_565(colors: np.ndarray) -> np.ndarray:
+    colors = np.clip(np.rint(colors), 0, 255).astype(np.uint16)
+    return ((colors[..., 0] >> 3) << 11) | ((colors[..., 1] >> 2) << 5) | (colors[..., 2] >> 3)
+
+
+def _from_565(values: np.ndarray) -> np.ndarray:
+    r = (values >> 11) & 31
+    g = (values >> 5) & 63
+    b = values & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(
+        np.float32
+    )
+
+
+def _color_palette(c0: np.ndarray, c1: np.ndarray) -> np.ndarray:
+    """return: (blocks, 4, 3) in the order of the BC1 indices"""
+    return np.stack([c0, c1, (2 * c0 + c1) / 3, (c0 + 2 * c1) / 3], axis=1)
+
+
+def _nearest(colors: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """colors: (blocks, 16, channels), palette: (blocks, k, channels) -> (blocks, 16)"""
+    distances = ((colors[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=-1)
+    return distances.argmin(axis=-1)
+
+
+def _bounding_box_endpoints(colors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    low = colors.min(axis=1)
+    high = colors.max(axis=1)
+    inset = (high - low) * INSET_SHIFT
+    return high - inset, low + inset
+
+
+def _principal_axis_endpoints(colors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    mean = colors.mean(axis=1, keepdims=True)
+    centered = colors - mean
+    covariance = np.einsum("nki,nkj->nij", centered, centered)
+
+    # power iteration from the bounding box diagonal
+    axis = colors.max(axis=1) - colors.min(axis=1)
+    for _ in range(4):
+        axis = np.einsum("nij,nj->ni", covariance, axis)
+        norm = np.linalg.norm(axis, axis=1, keepdims=True)
+        axis = np.divide(axis, norm, out=np.zeros_like(axis), where=norm > 0)
+
+    projections = np.einsum("nki,ni->nk", centered, axis)
+    low = projections.min(axis=1, keepdims=True)
+    high = projections.max(axis=1, keepdims=True)
+    inset = (high - low) * INSET_SHIFT
+    high, low = high - inset, low + inset
+
+    mean = mean[:, 0]
+    return mean + high * axis, mean + low * axis
+
+
+def _refine_endpoints(
+    colors: np.ndarray, indices: np.ndarray, c0: np.ndarray, c1: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Least squares endpoints for the selected indices (blocks without a solution are kept)."""
+    weights = np.array([0, 1, 1 / 3, 2 / 3], dtype=np.float32)[indices]  # share of c1
+    a = 1 - weights
+    b = weights
+    aa = (a * a).sum(axis=1)
+    bb = (b * b).sum(axis=1)
+    ab = (a * b).sum(axis=1)
+    ax = np.einsum("nk,nkc->nc", a, colors)
+    bx = np.einsum("nk,nkc->nc", b, colors)
+
+    det = aa * bb - ab * ab
+    valid = np.abs(det) > 1e-6
+    det = np.where(valid, det, 1)[:, None]
+    new_c0 = (ax * bb[:, None] - bx * ab[:, None]) / det
+    new_c1 = (bx * aa[:, None] - ax * ab[:, None]) / det
+
+    valid = valid[:, None]
+    return np.where(valid, new_c0, c0), np.where(valid, new_c1, c1)
+
+
+def _encode_color_blocks(colors: np.ndarray, quality: Quality) -> np.ndarray:
+    """colors: (blocks, 16, 3) -> (blocks, 8) bytes of BC1 color blocks (4-color mode)"""
+    if quality == Quality.FAST:
+        c0, c1 = _bounding_box_endpoints(colors)
+    else:
+        c0, c1 = _principal_axis_endpoints(colors)
+        indices = _nearest(colors, _color_palette(_from_565(_to_565(c0)), _from_565(_to_565(c1))))
+        c0, c1 = _refine_endpoints(colors, indices, c0, c1)
+
+    c0, c1 = _to_565(c0), _to_565(c1)
+
+    # 4-color mode requires c0 > c1: swapping the endpoints swaps indices 0-1 and 2-3
+    swap = c0 < c1
+    c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+
+    indices = _nearest(colors, _color_palette(_from_565(c0), _from_565(c1)))
+    # equal endpoints are decoded in 3-color mode, index 0 is exact there
+    indices[c0 == c1] = 0
+
+    blocks = np.empty((len(colors), 8), dtype=np.uint8)
+    blocks[:, 0:2] = c0.astype("<u2")[:, None].view(np.uint8)
+    blocks[:, 2:4] = c1.astype("<u2")[:, None].view(np.uint8)
+    blocks[:, 4:8] = _pack_indices(indices, 2).astype("<u4")[:, None].view(np.uint8)
+    return blocks
+
+
+# ==== Single channel (BC4) ==== #
+
+def _encode_channel_blocks(values: np.ndarray, quality: Quality) -> np.ndarray:
+    """values: (blocks, 16) -> (blocks, 8) bytes of BC4 blocks (8-value mode)"""
+    a0 = values.max(axis=1)
+    a1 = values.min(axis=1)
+
+    # position of the values between a0 (0) and a1 (7)
+    span = np.maximum(a0 - a1, 1)[:, None]
+    if quality == Quality.FAST:
+        steps = np.clip(np.rint((a0[:, None] - values) * 7 / span), 0, 7).astype(np.uint8)
+    else:
+        levels = np.arange(8, dtype=np.float32)
+        palette = (a0[:, None] * (7 - levels) + a1[:, None] * levels) / 7
+        palette = np.floor(palette + 0.5)  # values are stored as 8-bit
+        steps = np.abs(values[:, :, None] - palette[:, None, :]).argmin(axis=-1).astype(np.uint8)
+
+    # index order: a0, a1, then the interpolated values from a0 to a1
+    indices = CHANNEL_INDICES[steps]
+    indices[a0 == a1] = 0
+
+    blocks = np.empty((len(values), 8), dtype=np.uint8)
+    blocks[:, 0] = a0
+    blocks[:, 1] = a1
+    packed = _pack_indices(indices, 3).astype("<u8")[:, None].view(np.uint8)
+    blocks[:, 2:8] = packed[:, :6]
+    return blocks
+
+
+def _encode_explicit_alpha_blocks(values: np.ndarray) -> np.ndarray:
+    """values: (blocks, 16) -> (blocks, 8) bytes of BC2 alpha blocks"""
+    alpha = np.rint(values / 17).astype(np.uint64)
+    return _pack_indices(alpha, 4).astype("<u8")[:, None].view(np.uint8)
+
+
+def compress_image_to_bc_numpy(
+    img: Image.Image, format_name: str, quality: Quality = Quality.BALANCED
+) -> bytes:
+    """
+    Compress image to specified BC format (BC1, BC2, BC3, BC4, BC5).
+    Image dimensions must be multiples of 4.
+
+    :param quality: fast or balanced (best is encoded as balanced)
+    :return: Compressed bytes (raw blocks)
+    """
+    return compress_images_to_bc_numpy([img], format_name, quality)[0]
+
+
+def compress_images_to_bc_numpy(
+    images: List[Image.Image], format_name: str, quality: Quality = Quality.BALANCED
+) -> List[bytes]:
+    """
+    Compresses several images (e.g. mip levels) in the same batches of blocks.
+    Pixels are kept in 8 bits and converted to float one batch at a time.
+
+    :return: Compressed bytes of every image
+    """
+    for img in images:
+        if img.width % 4 or img.height % 4:
+            raise ValueError(f"Image size must be a multiple of 4, got {img.size}")
+
+    blocks = np.concatenate([_to_blocks(np.asarray(img.convert("RGBA"))) for img in images])
+    data = b"".join(
+        _encode_blocks(
+            blocks[start : start + BATCH_BLOCKS].astype(np.float32), format_name, quality
+        )
+        for start in range(0, len(blocks), BATCH_BLOCKS)
+    )
+
+    block_size = len(data) // len(blocks) if len(blocks) else 0
+    result = []
+    position = 0
+    for img in images:
+        size = img.width * img.height // 16 * block_size
+        result.append(data[position : position + size])
+        position += size
+    return result
+
+
+def _encode_blocks(blocks: np.ndarray, format_name: str, quality: Quality) -> bytes:
+    if format_name == "BC1":
+        encoded = [_encode_color_blocks(blocks[..., :3], quality)]
+    elif format_name == "BC2":
+        encoded = [
+            _encode_explicit_alpha_blocks(blocks[..., 3]),
+            _encode_color_blocks(blocks[..., :3], quality),
+        ]
+    elif format_name == "BC3":
+        encoded = [
+            _encode_channel_blocks(blocks[..., 3], quality),
+            _encode_color_blocks(blocks[..., :3], quality),
+        ]
+    elif format_name == "BC4":
+        encoded = [_encode_channel_blocks(blocks[..., 0], quality)]
+    elif format_name == "BC5":
+        encoded = [
+            _encode_channel_blocks(blocks[..., 0], quality),
+            _encode_channel_blocks(blocks[..., 1], quality),
+        ]
+    else:
+        raise ValueError(f"Unsupported format '{format_name}'.")
+
+    return np.concatenate(encoded, axis=1).tobytes()
@@ -2,6 +2,7 @@ import os
 import subprocess
 
 DIR = os.path.dirname(os.path.abspath(__file__))
+FSB5_CONVERTER_PATH = os.path.join(DIR, "fsb5_converter", "FSB5.Converter.exe")
 
 
 def convert_to_fsb5(
@@ -19,7 +20,7 @@ def convert_to_fsb5(
         raise FileNotFoundError("fsb5_converter", "File not found:", audio_path)
 
     command = [
-        os.path.join(DIR, "fsb5_converter", "FSB5.Converter.exe"),
+        FSB5_CONVERTER_PATH,
         "-a",
         audio_path,
         "-f",
@@ -1,9 +1,9 @@
+import contextvars
 import logging
 import os
 import fnmatch
 import threading
 import traceback
-from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool
 from typing import Callable, List, Optional, Tuple, Union
 
@@ -22,12 +22,37 @@ def ask_directory(title="Select Directory"):
     return directory
 
 
-def run_multithread(worker: Callable, tasks: List[Tuple], max_workers: Optional[int] = None):
-    cpu_count = os.cpu_count()
-    max_workers = max_workers if (max_workers and max_workers <= cpu_count) else cpu_count
+def run_multithread(
+    worker: Callable,
+    tasks: List[Tuple],
+    max_workers: Optional[int] = None,
+    cost: Optional[Callable[[Tuple], float]] = None,
+    name: str = "Tasks",
+):
+    """
+    max_workers: fixed number of threads. If not set, the number of threads
+    is adjusted to the observed CPU and I/O load (see AdaptivePool).
+    cost: estimated duration of a task. Tasks are started in descending order
+    of cost; idle threads take the next task from the shared queue, so short
+    tasks fill the gaps while the long ones are running.
+    """
+    from helpers.AdaptivePool import AdaptivePool
+
+    if max_workers:
+        pool = AdaptivePool(name, min_workers=max_workers, max_workers=max_workers)
+    else:
+        pool = AdaptivePool(name)
+
+    if cost:
+        tasks = sorted(tasks, key=cost, reverse=True)
+
+    # worker threads don't inherit context variables (settings of the current job)
+    context = contextvars.copy_context()
+
+    def run_in_context(task: Tuple):
+        return context.copy().run(worker, task)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = list(executor.map(worker, tasks))
+    pool.run(run_in_context, tasks)
 
 
 def create_pptr(object_reader, file_id: int, path_id: int):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the patcher is run from its folder, so its modules are imported as top-level ones
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "UnityPatcher"))
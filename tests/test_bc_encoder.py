@@ -0,0 +1,34 @@
+import pytest
+
+from enums import TextureCompressionQuality as Quality
+from tools.bc_encoder.benchmark import make_image, psnr
+from tools.bc_encoder.numpy_encoder import compress_image_to_bc_numpy
+
+# minimum PSNR (dB) of the decoded image for fast and balanced quality
+MIN_PSNR = {
+    "BC1": (26, 28),
+    "BC3": (27, 29),
+    "BC4": (40, 40),
+    "BC5": (40, 40),
+}
+
+
+@pytest.fixture(scope="module")
+def image():
+    return make_image(128)
+
+
+@pytest.mark.parametrize("format_name", list(MIN_PSNR))
+@pytest.mark.parametrize("quality", [Quality.FAST, Quality.BALANCED])
+def test_numpy_round_trip(image, format_name, quality):
+    data = compress_image_to_bc_numpy(image, format_name, quality)
+
+    block_size = 8 if format_name in ("BC1", "BC4") else 16
+    assert len(data) == image.width * image.height // 16 * block_size
+    min_psnr = MIN_PSNR[format_name][quality == Quality.BALANCED]
+    assert psnr(image, data, format_name) >= min_psnr
+
+
+def test_numpy_size_not_multiple_of_4(image):
+    with pytest.raises(ValueError):
+        compress_image_to_bc_numpy(image.crop((0, 0, 30, 32)), "BC1")
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from PIL import Image
+from UnityPy.enums import TextureFormat as TF
+
+from enums import TextureCompressionQuality as Quality
+from helpers import AdaptivePool
+from patches import TextureConverter
+
+# 5 stripes: the row count per stripe isn't a multiple of the block height by itself
+STRIPES = 5
+
+
+@pytest.fixture
+def split(monkeypatch):
+    monkeypatch.setattr(TextureConverter, "PARALLEL_MIN_PIXELS", 0)
+    monkeypatch.setattr(AdaptivePool, "subprocess_threads", lambda: STRIPES)
+    return TextureConverter._split_stripes
+
+
+def make_image(width: int, height: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8), "RGBA")
+
+
+@pytest.mark.parametrize(
+    "tex_format, block_height",
+    [
+        (TF.ASTC_RGB_6x6, 4),  # encoded as ETC2
+        (TF.ETC2_RGBA8, 4),
+        (TF.ASTC_RGBA_6x6, 6),
+        (TF.ASTC_RGBA_5x5, 5),
+    ],
+)
+def test_stripes_are_block_aligned(split, tex_format, block_height):
+    img = make_image(64, 2070)
+    stripes = split(img, tex_format)
+
+    assert len(stripes) == STRIPES
+    assert stripes[0][0] == 0 and stripes[-1][1] == img.height
+    for (_, bottom), (top, _) in zip(stripes, stripes[1:]):
+        assert bottom == top
+        assert top % block_height == 0
+
+
+@pytest.mark.parametrize("tex_format", [TF.ASTC_RGB_6x6, TF.ASTC_RGBA_6x6])
+def test_stripes_encode_like_the_whole_image(split, tex_format):
+    # 6x6 blocks would give 414-row stripes, which etcpak rejects
+    img = make_image(16, 2048)
+    stripes = split(img, tex_format)
+    assert len(stripes) > 1
+
+    whole, whole_format = TextureConverter._encode(img, tex_format, Quality.FAST)
+    parts = [
+        TextureConverter._encode(img.crop((0, top, img.width, bottom)), tex_format, Quality.FAST)
+        for top, bottom in stripes
+    ]
+    assert b"".join(data for data, _ in parts) == whole
+    assert all(part_format == whole_format for _, part_format in parts)